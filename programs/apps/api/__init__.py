@@ -0,0 +1,4 @@
+"""
+The Programs REST API.
+"""
+default_app_config = 'programs.apps.api.apps.ApiConfig'
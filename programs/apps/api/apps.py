@@ -0,0 +1,13 @@
+"""
+App configuration for the REST API.
+"""
+from django.apps import AppConfig
+
+
+class ApiConfig(AppConfig):  # pylint: disable=missing-docstring
+    name = 'programs.apps.api'
+    verbose_name = 'API'
+
+    def ready(self):
+        from programs.apps.api.signals import connect_signals
+        connect_signals()
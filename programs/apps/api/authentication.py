@@ -1,14 +1,17 @@
 """
 Authentication logic for REST API.
 """
+import hashlib
 import logging
 import time
 
 from django.contrib.auth.models import Group
+from django.core.cache import cache
 from django.db import IntegrityError
 from rest_framework.exceptions import AuthenticationFailed
 from rest_framework_jwt.authentication import JSONWebTokenAuthentication
 
+from programs.apps.api.roles import JWT_ADMINISTRATOR_ATTR
 from programs.apps.core.constants import Role
 from programs.apps.core.models import User
 
@@ -18,20 +21,40 @@ logger = logging.getLogger(__name__)
 # TODO: Use a config model.
 MAX_RETRIES = 3
 COEFFICIENT = .15
+# Number of seconds for which a user's roles are assumed to match the role claims of their JWT,
+# once they have been synced.
+PROVISIONING_CACHE_TIMEOUT = 60 * 5
+
+# Claims which determine the roles of a user.
+ROLE_CLAIMS = ('administrator',)
+PROVISIONING_CACHE_KEY_TEMPLATE = 'programs.api.jwt_provisioned.{digest}'
 
 
 def _set_user_roles(user, payload):
     """
     DRY helper - sets roles for a user based on JWT payload (during JWT auth)
     or social auth signin (for use with session auth in the browseable API).
+
+    Group membership is only written when it differs from the claim.
     """
+    is_admin = bool(payload.get('administrator'))
+    if user.groups.filter(name=Role.ADMINS).exists() == is_admin:
+        return
+
     admin_group = Group.objects.get(name=Role.ADMINS)  # pylint: disable=no-member
-    if payload.get('administrator'):
+    if is_admin:
         user.groups.add(admin_group)
     else:
         user.groups.remove(admin_group)
 
 
+def _get_provisioning_cache_key(username):
+    """
+    Build the key used to remember the role claims with which a user's roles were last synced.
+    """
+    return PROVISIONING_CACHE_KEY_TEMPLATE.format(digest=hashlib.md5(username.encode('utf-8')).hexdigest())
+
+
 def pipeline_set_user_roles(response, user=None, *_, **__):
     """
     Social auth pipeline function to update group memberships based
@@ -55,7 +78,10 @@ class JwtAuthentication(JSONWebTokenAuthentication):
         the content of an already-decoded / verified JWT payload.
 
         In the process of inflating the user object based on the payload, we also
-        make sure that the roles associated with this user are up-to-date.
+        make sure that the roles associated with this user are up-to-date.  Once
+        synced, roles are not checked again for the same user and role claims
+        until PROVISIONING_CACHE_TIMEOUT has elapsed, so that authenticating a
+        known user costs a single read.
         """
         if 'preferred_username' not in payload:
             msg = 'Invalid JWT payload: preferred_username not present.'
@@ -85,5 +111,13 @@ class JwtAuthentication(JSONWebTokenAuthentication):
             else:
                 break
 
-        _set_user_roles(user, payload)
+        # skip syncing roles if they were recently synced with the same claims.
+        cache_key = _get_provisioning_cache_key(username)
+        role_claims = [payload.get(claim) for claim in ROLE_CLAIMS]
+        if cache.get(cache_key) != role_claims:
+            _set_user_roles(user, payload)
+            cache.set(cache_key, role_claims, PROVISIONING_CACHE_TIMEOUT)
+
+        # record the verified claim, so that role checks for this request need not query group membership.
+        setattr(user, JWT_ADMINISTRATOR_ATTR, bool(payload.get('administrator')))
         return user
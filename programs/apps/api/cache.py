@@ -0,0 +1,62 @@
+"""
+Shared response caching for the REST API.
+
+Cached responses are namespaced by a global catalog version, which is replaced
+whenever any model contributing to a program document is saved or deleted (see
+`programs.apps.api.signals`).  Entries cached under a previous version are
+therefore never read again, and simply age out of the cache.
+"""
+import hashlib
+from uuid import uuid4
+
+from django.core.cache import cache
+
+
+CATALOG_VERSION_KEY = 'programs.api.catalog_version'
+RESPONSE_KEY_TEMPLATE = 'programs.api.response.{version}.{digest}'
+
+
+def get_catalog_version():
+    """
+    Return the current catalog version, initializing it if necessary.
+
+    The version is a random token rather than a counter, so that losing it
+    (e.g. to cache eviction) can never cause entries cached under an earlier
+    version to be served again.
+
+    Returns:
+        str
+    """
+    version = cache.get(CATALOG_VERSION_KEY)
+    if version is None:
+        version = uuid4().hex
+        if not cache.add(CATALOG_VERSION_KEY, version, None):
+            # another process initialized the version first; use its value.
+            version = cache.get(CATALOG_VERSION_KEY, version)
+    return version
+
+
+def bump_catalog_version():
+    """
+    Invalidate all cached API responses by replacing the catalog version.
+    """
+    cache.set(CATALOG_VERSION_KEY, uuid4().hex, None)
+
+
+def get_response_cache_key(request, *parts):
+    """
+    Build the cache key for a response to the given request.
+
+    The absolute URI is part of the key because it determines both the query
+    parameters and the host used to build absolute URLs in the response body.
+
+    Arguments:
+        request (Request): the request being responded to.
+        parts: any additional values the response depends upon (e.g. the role of the requesting user).
+
+    Returns:
+        str
+    """
+    key_data = u'|'.join([request.build_absolute_uri()] + [unicode(part) for part in parts])
+    digest = hashlib.md5(key_data.encode('utf-8')).hexdigest()
+    return RESPONSE_KEY_TEMPLATE.format(version=get_catalog_version(), digest=digest)
@@ -0,0 +1,224 @@
+"""
+Precomputed program documents for the read path of the REST API.
+
+Rendering a program with ProgramSerializer walks four related tables.  Instead,
+the rendered representation of each program is stored in a ProgramDocument row
+and served from there, so that reading a program costs a single query.
+
+Documents are built without a request, so banner image URLs are stored as they
+come from storage (possibly relative) and are made absolute when served.
+
+Consistency is maintained as follows:
+
+  - the document row of a program is created along with the program itself, so
+    that every later change has a row to invalidate.
+  - any change to a row rendered in a program (see `programs.apps.api.signals`)
+    replaces the version of the program's document, in the same transaction as
+    the change itself.
+  - a build stores its result only if the version it read before building is
+    still current.  A build which raced with a change is therefore discarded
+    rather than stored, and done again later.
+
+Stale documents are rebuilt on a background worker once the request which
+invalidated them has finished (see `rebuild_after_request`), so that readers
+rarely have to.  A reader which does find a stale document (e.g. one
+invalidated outside of a request, or not yet rebuilt) rebuilds it itself.
+"""
+from collections import OrderedDict
+import json
+import operator
+import threading
+from uuid import uuid4
+
+from django.conf import settings
+from django.db.models import Case, F, Q, TextField, Value, When
+from rest_framework import serializers
+from rest_framework.utils.encoders import JSONEncoder
+
+from programs.apps.api.serializers import ProgramReadSerializer, ProgramSerializer
+from programs.apps.programs import models, workers
+
+
+# Whether documents have been invalidated by the current thread since it last submitted a rebuild.
+_invalidated = threading.local()
+
+
+def create_document(program):
+    """
+    Create the (not yet built) document row of a new program.
+    """
+    models.ProgramDocument.objects.get_or_create(program_id=program.id, defaults={'version': uuid4().hex})
+    _invalidated.pending = True
+
+
+def invalidate_documents(queryset):
+    """
+    Invalidate the documents in the given ProgramDocument queryset.
+    """
+    if queryset.update(version=uuid4().hex):
+        _invalidated.pending = True
+
+
+def get_affected_documents(instance):
+    """
+    Return the queryset of documents in which the given model instance is rendered.
+    """
+    documents = models.ProgramDocument.objects.all()
+    if isinstance(instance, models.Program):
+        return documents.filter(program_id=instance.id)
+    elif isinstance(instance, (models.ProgramOrganization, models.ProgramCourseCode)):
+        return documents.filter(program_id=instance.program_id)
+    elif isinstance(instance, models.ProgramCourseRunMode):
+        return documents.filter(program__programcoursecode__id=instance.program_course_code_id)
+    elif isinstance(instance, models.CourseCode):
+        return documents.filter(program__programcoursecode__course_code_id=instance.id)
+    elif isinstance(instance, models.Organization):
+        return documents.filter(
+            Q(program__programorganization__organization_id=instance.id) |
+            Q(program__programcoursecode__course_code__organization_id=instance.id)
+        )
+    elif isinstance(instance, models.ProgramDefault):
+        # the default banner image is rendered in the programs without one of their own.
+        return documents.filter(Q(program__banner_image='') | Q(program__banner_image__isnull=True))
+    return documents
+
+
+def build_documents(program_ids):
+    """
+    Render the given programs and store their documents (in a single query), unless they were invalidated meanwhile.
+
+    Programs without a document row are rendered, but not stored: such a row could be created after a concurrent
+    change had already (not) invalidated it, and so be stored with stale data.  See `create_missing_documents`.
+
+    Returns:
+        dict mapping program IDs to their rendered data.
+    """
+    # versions must be read before the data they guard.
+    versions = dict(
+        models.ProgramDocument.objects.filter(program_id__in=program_ids).values_list('program_id', 'version')
+    )
+    programs = ProgramSerializer.setup_eager_loading(models.Program.objects.filter(id__in=program_ids))
+
+    rendered = {}
+    stored = []
+    for data in ProgramReadSerializer(programs, many=True).data:
+        document = json.dumps(data, cls=JSONEncoder)
+        if data['id'] in versions:
+            stored.append(When(program_id=data['id'], then=Value(document)))
+        rendered[data['id']] = json.loads(document, object_pairs_hook=OrderedDict)
+
+    if stored:
+        unchanged = reduce(
+            operator.or_, (Q(program_id=program_id, version=version) for program_id, version in versions.items())
+        )
+        models.ProgramDocument.objects.filter(unchanged).update(
+            document=Case(*stored, output_field=TextField()),
+            # only rows whose version is unchanged are updated, so this is the version read above.
+            document_version=F('version'),
+        )
+    return rendered
+
+
+def create_missing_documents():
+    """
+    Create the document rows of any programs without one, e.g. programs created without sending signals.
+
+    Returns:
+        int: the number of rows created.
+    """
+    program_ids = models.Program.objects.filter(document__isnull=True).values_list('id', flat=True)
+    models.ProgramDocument.objects.bulk_create(
+        models.ProgramDocument(program_id=program_id, version=uuid4().hex) for program_id in program_ids
+    )
+    return len(program_ids)
+
+
+def rebuild_stale_documents(chunk_size=100):
+    """
+    Build every document which is not current, a chunk of programs at a time.
+
+    Returns:
+        int: the number of documents which were stale.
+    """
+    stale_ids = list(
+        models.ProgramDocument.objects.filter(
+            Q(document_version__isnull=True) | ~Q(document_version=F('version'))
+        ).order_by('program_id').values_list('program_id', flat=True)
+    )
+    for index in range(0, len(stale_ids), chunk_size):
+        build_documents(stale_ids[index:index + chunk_size])
+    return len(stale_ids)
+
+
+def rebuild_after_request(sender, **kwargs):  # pylint: disable=unused-argument
+    """
+    Submit a rebuild of the stale documents to a background worker, if the request which has just finished
+    invalidated any.  Its changes are committed by now, so the rebuild reads them.
+    """
+    if getattr(_invalidated, 'pending', False):
+        _invalidated.pending = False
+        if settings.PROGRAM_DOCUMENTS_ENABLED and settings.PROGRAM_DOCUMENTS_REBUILD_ON_WRITE:
+            workers.submit(rebuild_stale_documents)
+
+
+def get_document_data(programs):
+    """
+    Return the rendered data of each of the given programs, from their documents where current, otherwise by
+    rebuilding them.  Programs should be read with select_related('document').
+
+    Returns:
+        list of OrderedDict, in the same order as the programs.
+    """
+    rendered = {}
+    stale_ids = []
+    for program in programs:
+        try:
+            document = program.document
+        except models.ProgramDocument.DoesNotExist:
+            document = None
+
+        if document is not None and document.is_current:
+            rendered[program.id] = json.loads(document.document, object_pairs_hook=OrderedDict)
+        else:
+            stale_ids.append(program.id)
+
+    if stale_ids:
+        rendered.update(build_documents(stale_ids))
+    return [rendered[program.id] for program in programs]
+
+
+class ProgramDocumentListSerializer(serializers.ListSerializer):  # pylint: disable=abstract-method
+    """
+    Render lists of programs from their documents, rebuilding any stale ones in one batch.
+    """
+
+    def to_representation(self, data):
+        return [self.child.finalize(item) for item in get_document_data(list(data))]
+
+
+class ProgramDocumentSerializer(serializers.BaseSerializer):  # pylint: disable=abstract-method
+    """
+    Read-only serializer rendering programs from their documents, with the same output as ProgramSerializer.
+    """
+
+    class Meta(object):  # pylint: disable=missing-docstring
+        list_serializer_class = ProgramDocumentListSerializer
+
+    def finalize(self, data):
+        """
+        Select the fields given in the context (see `SparseFieldsetMixin`), if any, and make the stored
+        banner image URLs absolute, as ProgramSerializer does.
+        """
+        fields = self.context.get('fields')
+        if fields is not None:
+            data = OrderedDict((name, value) for name, value in data.items() if name in fields)
+
+        request = self.context.get('request')
+        if request is not None and 'banner_image_urls' in data:
+            data['banner_image_urls'] = {
+                size: request.build_absolute_uri(url) for size, url in data['banner_image_urls'].items()
+            }
+        return data
+
+    def to_representation(self, instance):
+        return self.finalize(get_document_data([instance])[0])
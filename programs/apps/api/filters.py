@@ -1,9 +1,14 @@
 """
 Reusable queryset filters for the REST API.
 """
-from rest_framework import filters
-
-from programs.apps.core.constants import Role
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from django.utils.translation import ugettext as _
+from rest_framework import exceptions, filters
+
+from programs.apps.api.roles import is_admin
+from programs.apps.programs import models
 from programs.apps.programs.constants import ProgramStatus
 
 
@@ -16,11 +21,18 @@ class ProgramStatusRoleFilterBackend(filters.BaseFilterBackend):
       - LEARNERS can see programs with any status other than 'deleted' or 'unpublished'
     """
 
-    def filter_queryset(self, request, queryset, view):
+    @staticmethod
+    def get_allowed_statuses(request):
+        """
+        Return the list of program statuses visible to the requesting user.
+        """
         allowed_status = [ProgramStatus.ACTIVE, ProgramStatus.RETIRED]
-        if request.user.groups.filter(name=Role.ADMINS).exists():
+        if is_admin(request):
             allowed_status.append(ProgramStatus.UNPUBLISHED)
-        return queryset.filter(status__in=allowed_status)
+        return allowed_status
+
+    def filter_queryset(self, request, queryset, view):
+        return queryset.filter(status__in=self.get_allowed_statuses(request))
 
 
 class ProgramCompletionFilterBackend(filters.BaseFilterBackend):
@@ -57,12 +69,109 @@ class ProgramStatusQueryFilterBackend(BaseQueryFilterBackend):
     lookup_filter = 'status'
 
 
+class ProgramModifiedSinceFilterBackend(filters.BaseFilterBackend):
+    """
+    Allows for filtering programs by a 'modified_since' query string argument (an ISO 8601 timestamp,
+    assumed to be UTC if it has no offset), to those which changed after that time.
+
+    A program has changed if the program itself, or any of its organization links, course codes or
+    run modes was modified.  Removing nested rows through the API saves the program too, so removals
+    are detected by the program's own modification time.
+    """
+    query_parameter = 'modified_since'
+
+    @classmethod
+    def get_modified_since(cls, request):
+        """
+        Return the timestamp given in the query string, or None if there is none.
+
+        Raises:
+            ValidationError: if the value is not a valid timestamp.
+        """
+        value = request.query_params.get(cls.query_parameter)
+        if not value:
+            return None
+
+        try:
+            modified_since = parse_datetime(value)
+        except ValueError:
+            modified_since = None
+        if modified_since is None:
+            raise exceptions.ValidationError(
+                {cls.query_parameter: [_("'{value}' is not a valid ISO 8601 timestamp.").format(value=value)]}
+            )
+
+        if timezone.is_naive(modified_since):
+            modified_since = timezone.make_aware(modified_since, timezone.utc)
+        return modified_since
+
+    @staticmethod
+    def get_changed_filter(modified_since):
+        """
+        Build a filter matching the programs which changed after the given time.
+
+        Nested rows are matched with semi-joins rather than joins, so that no program is matched twice.
+        """
+        changed_links = (
+            models.ProgramOrganization.objects.filter(
+                Q(modified__gt=modified_since) | Q(organization__modified__gt=modified_since)
+            ),
+            models.ProgramCourseCode.objects.filter(
+                Q(modified__gt=modified_since) | Q(course_code__modified__gt=modified_since)
+            ),
+        )
+        changed_run_modes = models.ProgramCourseRunMode.objects.filter(modified__gt=modified_since)
+
+        changed = Q(modified__gt=modified_since)
+        for queryset in changed_links:
+            changed |= Q(id__in=queryset.values('program_id'))
+        changed |= Q(id__in=changed_run_modes.values('program_course_code__program_id'))
+        return changed
+
+    def filter_queryset(self, request, queryset, view):
+        modified_since = self.get_modified_since(request)
+        if request.method == 'GET' and modified_since is not None:
+            return queryset.filter(self.get_changed_filter(modified_since))
+        else:
+            return queryset
+
+
 class ProgramOrgKeyFilterBackend(BaseQueryFilterBackend):
     """
     Allows for filtering program listings by an organization key query string argument.
+
+    The key is first resolved to an organization ID, so that programs are matched from the
+    (organization, program) index of ProgramOrganization alone, without joining organizations.
+    A program has at most one organization (see ProgramOrganization.save), so it is never matched
+    twice.  This is preferred to a semi-join (`id__in` a subquery), for which some planners (e.g.
+    sqlite's) scan programs by status and probe the subquery for each of them instead.
     """
     query_parameter = 'organization'
-    lookup_filter = 'organizations__key'  # match over m2m, thus 'organizations'
+    request_attr = 'program_org_key_filter_ids'
+
+    def get_organization_id(self, request):
+        """
+        Return the ID of the organization with the requested key, or None if there is none.  The ID is only
+        looked up once per request, as views may filter more than once (e.g. for conditional GET validators).
+        """
+        key = request.query_params[self.query_parameter]
+        resolved = getattr(request, self.request_attr, None)
+        if resolved is None:
+            resolved = {}
+            setattr(request, self.request_attr, resolved)
+
+        if key not in resolved:
+            resolved[key] = models.Organization.objects.filter(key=key).values_list('id', flat=True).first()
+        return resolved[key]
+
+    def filter_queryset(self, request, queryset, view):
+        if request.method != 'GET' or self.query_parameter not in request.query_params:
+            return queryset
+
+        organization_id = self.get_organization_id(request)
+        if organization_id is None:
+            return queryset.none()
+        return queryset.filter(programorganization__organization_id=organization_id)
 
 
 class CourseCodeOrgKeyFilterBackend(BaseQueryFilterBackend):
@@ -0,0 +1,78 @@
+# pylint: disable=missing-docstring
+from collections import OrderedDict
+import json
+import logging
+
+from django.core.management import BaseCommand, CommandError
+from rest_framework.utils.encoders import JSONEncoder
+
+from programs.apps.api.documents import build_documents, create_missing_documents, invalidate_documents
+from programs.apps.api.serializers import ProgramSerializer
+from programs.apps.programs.models import Program, ProgramDocument
+
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the precomputed documents of all programs, and verify them against the live serializer output.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--verify-only',
+            action='store_true',
+            dest='verify_only',
+            default=False,
+            help='Verify the current documents without rebuilding them first.'
+        )
+
+        parser.add_argument(
+            '--chunk-size',
+            action='store',
+            type=int,
+            dest='chunk_size',
+            default=100,
+            help='Number of programs to process at a time.'
+        )
+
+    @staticmethod
+    def _chunks(program_ids, chunk_size):
+        for index in range(0, len(program_ids), chunk_size):
+            yield program_ids[index:index + chunk_size]
+
+    def _verify(self, program_ids):
+        """Return the IDs of the given programs whose documents are missing, stale or differ from live output."""
+        documents = ProgramDocument.objects.in_bulk(program_ids)
+        programs = ProgramSerializer.setup_eager_loading(Program.objects.filter(id__in=program_ids))
+
+        mismatched = []
+        for data in ProgramSerializer(programs, many=True).data:
+            document = documents.get(data['id'])
+            expected = json.loads(json.dumps(data, cls=JSONEncoder), object_pairs_hook=OrderedDict)
+            if document is None or not document.is_current or json.loads(document.document) != expected:
+                mismatched.append(data['id'])
+        return mismatched
+
+    def handle(self, *args, **options):
+        program_ids = list(Program.objects.order_by('id').values_list('id', flat=True))
+
+        if not options.get('verify_only'):
+            created = create_missing_documents()
+            if created:
+                logger.info('Created the missing documents of %d programs.', created)
+            invalidate_documents(ProgramDocument.objects.all())
+            for chunk in self._chunks(program_ids, options['chunk_size']):
+                build_documents(chunk)
+            logger.info('Rebuilt the documents of %d programs.', len(program_ids))
+
+        mismatched = []
+        for chunk in self._chunks(program_ids, options['chunk_size']):
+            mismatched.extend(self._verify(chunk))
+
+        if mismatched:
+            raise CommandError(
+                'The documents of {} programs do not match their live representation: {}'.format(
+                    len(mismatched), mismatched
+                )
+            )
+        logger.info('Verified the documents of %d programs.', len(program_ids))
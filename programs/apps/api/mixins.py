@@ -0,0 +1,285 @@
+"""
+Reusable view mixins for the REST API.
+"""
+from calendar import timegm
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.http import http_date, parse_etags, parse_http_date_safe, quote_etag
+from django.utils.translation import ugettext as _
+from rest_framework import exceptions, status
+from rest_framework.response import Response
+
+from programs.apps.api.cache import get_response_cache_key
+from programs.apps.api.pagination import KeysetPagination
+
+
+class CachedResponseMixin(object):
+    """
+    Serve successful list and retrieve responses from the shared response cache.
+
+    Views using this mixin should override `get_response_cache_parts` to return
+    any request-dependent values (other than the URI itself) that affect the
+    content of their responses, such as the role of the requesting user.
+    """
+
+    def get_response_cache_parts(self, request):  # pylint: disable=unused-argument
+        """
+        Return a sequence of values to be included in response cache keys.
+        """
+        return ()
+
+    def _get_cached_response(self, handler, request, *args, **kwargs):
+        """
+        Return the cached data for this request if present, otherwise call the
+        handler and cache the data of its response.
+        """
+        timeout = settings.API_RESPONSE_CACHE_TIMEOUT
+        if not timeout:
+            return handler(request, *args, **kwargs)
+
+        # the key must be computed before the response is built, so that data read
+        # during a concurrent write is cached under the version preceding that write.
+        key = get_response_cache_key(request, *self.get_response_cache_parts(request))
+        data = cache.get(key)
+        if data is not None:
+            return Response(data)
+
+        response = handler(request, *args, **kwargs)
+        if response.status_code == 200:
+            cache.set(key, response.data, timeout)
+        return response
+
+    def list(self, request, *args, **kwargs):  # pylint: disable=missing-docstring
+        return self._get_cached_response(super(CachedResponseMixin, self).list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):  # pylint: disable=missing-docstring
+        return self._get_cached_response(super(CachedResponseMixin, self).retrieve, request, *args, **kwargs)
+
+
+class ConditionalGetMixin(CachedResponseMixin):
+    """
+    Support conditional GET requests (If-None-Match / If-Modified-Since) for
+    list and retrieve, answering 304 Not Modified without building the response
+    body when the client's copy is current.
+
+    Views using this mixin must implement `get_conditional_state(queryset)`.
+    List validators only summarize the rows of the requested page (and the
+    total count it reports), so that their cost does not grow with the size of
+    the list.
+    When response caching is enabled, validators are cached alongside
+    responses, so that revalidating an unchanged resource runs no queries.
+    The queryset is only filtered when the validators are not cached, since
+    filter backends may run queries of their own.
+    """
+
+    def get_conditional_state(self, queryset):
+        """
+        Summarize the data which would be rendered from the given queryset.
+
+        Returns:
+            None if the queryset is empty, otherwise a tuple of (last_modified,
+            state), where `last_modified` is the most recent modification time
+            of any rendered row, and `state` is a list of hashable values which
+            will change whenever the rendered data changes.
+        """
+        raise NotImplementedError
+
+    def _get_page_summary(self):
+        """
+        Return a tuple of the queryset of the rows on the requested page of the
+        list, and the state of the page itself, i.e. the ids of those rows and
+        the total count of rows which the response reports.
+        """
+        queryset = self.filter_queryset(self.get_queryset())
+        if self.paginator is None:
+            return queryset, None
+
+        # only the ids of the page are read, rather than the (eagerly loaded) rows.
+        ids = self.paginator.paginate_queryset(
+            queryset.prefetch_related(None).values_list('pk', flat=True), self.request, view=self
+        )
+        if ids is None:
+            return queryset, None
+        ids = list(ids)
+        return queryset.filter(pk__in=ids), [ids, self.paginator.page.paginator.count]
+
+    def _get_validators(self, request, get_summary):
+        """
+        Return a tuple of (etag, last_modified) for the response to this request,
+        or None if the requested resource does not exist.
+
+        Arguments:
+            get_summary (callable): returns a tuple of the queryset to summarize,
+                and any state of the response which is not derived from its rows.
+        """
+        parts = self.get_response_cache_parts(request)
+        key = None
+        if settings.API_RESPONSE_CACHE_TIMEOUT:
+            key = get_response_cache_key(request, 'validators', *parts)
+            validators = cache.get(key)
+            if validators is not None:
+                return validators or None
+
+        queryset, response_state = get_summary()
+        conditional_state = self.get_conditional_state(queryset)
+        if conditional_state is None:
+            validators = ()
+        else:
+            last_modified, state = conditional_state
+            etag_data = repr([request.build_absolute_uri(), list(parts), response_state, state])
+            validators = (quote_etag(hashlib.md5(etag_data).hexdigest()), last_modified)
+
+        if key:
+            cache.set(key, validators, settings.API_RESPONSE_CACHE_TIMEOUT)
+        return validators or None
+
+    @staticmethod
+    def _is_not_modified(request, etag, last_modified):
+        """
+        Evaluate the request's preconditions against the current validators.
+        If-None-Match takes precedence over If-Modified-Since, per RFC 7232.
+        """
+        if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+        if if_none_match:
+            # weak tags (W/"...") are unquoted too, as If-None-Match uses the weak comparison.
+            etags = parse_etags(if_none_match)
+            return '*' in etags or etag.strip('"') in etags
+
+        if_modified_since = parse_http_date_safe(request.META.get('HTTP_IF_MODIFIED_SINCE'))
+        if if_modified_since and last_modified:
+            return timegm(last_modified.utctimetuple()) <= if_modified_since
+
+        return False
+
+    def _get_conditional_response(self, handler, get_summary, request, *args, **kwargs):
+        """
+        Return a 304 response if the client's copy is current, otherwise call the handler.
+        Either way, annotate the response with the current validators.
+        """
+        validators = self._get_validators(request, get_summary)
+        if validators is None:
+            return handler(request, *args, **kwargs)
+
+        etag, last_modified = validators
+        if self._is_not_modified(request, etag, last_modified):
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            response = handler(request, *args, **kwargs)
+
+        if response.status_code in (status.HTTP_200_OK, status.HTTP_304_NOT_MODIFIED):
+            response['ETag'] = etag
+            if last_modified:
+                response['Last-Modified'] = http_date(timegm(last_modified.utctimetuple()))
+        return response
+
+    def list(self, request, *args, **kwargs):  # pylint: disable=missing-docstring
+        if isinstance(self.paginator, KeysetPagination):
+            # keyset pages are read by clients walking the entire list, which have no copy to revalidate.
+            return super(ConditionalGetMixin, self).list(request, *args, **kwargs)
+
+        return self._get_conditional_response(
+            super(ConditionalGetMixin, self).list, self._get_page_summary, request, *args, **kwargs
+        )
+
+    def retrieve(self, request, *args, **kwargs):  # pylint: disable=missing-docstring
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        lookup = {self.lookup_field: self.kwargs[lookup_url_kwarg]}
+        try:
+            self.get_queryset().filter(**lookup)
+        except (TypeError, ValueError):
+            # let the handler respond to malformed lookups as usual (i.e. with a 404).
+            return super(ConditionalGetMixin, self).retrieve(request, *args, **kwargs)
+        return self._get_conditional_response(
+            super(ConditionalGetMixin, self).retrieve,
+            lambda: (self.filter_queryset(self.get_queryset()).filter(**lookup), None),
+            request, *args, **kwargs
+        )
+
+
+class KeysetPaginationMixin(object):
+    """
+    Allow clients to opt in to keyset pagination of list responses, by passing
+    `pagination=cursor` (or a `cursor` from a previous page) in the query string.
+    Other requests are paginated by the default paginator.
+
+    Views using this mixin must define `keyset_ordering` (see KeysetPagination).
+    """
+    keyset_ordering = None
+    pagination_query_param = 'pagination'
+    keyset_pagination_value = 'cursor'
+
+    def _is_keyset_pagination_requested(self):
+        """
+        Return True if the request asks for keyset pagination.
+        """
+        query_params = self.request.query_params
+        return (
+            query_params.get(self.pagination_query_param) == self.keyset_pagination_value or
+            KeysetPagination.cursor_query_param in query_params
+        )
+
+    @property
+    def paginator(self):  # pylint: disable=missing-docstring
+        if not hasattr(self, '_paginator') and self._is_keyset_pagination_requested():
+            self._paginator = KeysetPagination()  # pylint: disable=attribute-defined-outside-init
+        return super(KeysetPaginationMixin, self).paginator
+
+
+class SparseFieldsetMixin(object):
+    """
+    Allow clients to select the fields rendered in GET responses, by passing comma-separated
+    field names as `fields` (to render only those fields) and/or `exclude` (to omit them) in
+    the query string.
+
+    Views using this mixin must define `sparse_fields`, the names of all of the fields they
+    render.  The selected fields are passed to serializers in their context, as `fields`.
+    """
+    sparse_fields = None
+    fields_query_param = 'fields'
+    exclude_query_param = 'exclude'
+
+    def _parse_sparse_fields(self, query_param):
+        """
+        Return the field names given in the query parameter, or None if it is absent.
+
+        Raises:
+            ValidationError: if any of the names is not one of `sparse_fields`.
+        """
+        value = self.request.query_params.get(query_param)
+        if value is None:
+            return None
+
+        names = [name.strip() for name in value.split(',') if name.strip()]
+        unknown = [name for name in names if name not in self.sparse_fields]
+        if unknown:
+            raise exceptions.ValidationError(
+                {query_param: [_('Unknown field(s): {names}.').format(names=', '.join(unknown))]}
+            )
+        return names
+
+    def get_sparse_fields(self):
+        """
+        Return the names of the fields selected by the request (in their usual order), or None if the
+        request did not select any fields, in which case all fields are rendered.
+        """
+        if not hasattr(self, '_sparse_fields'):
+            fields, exclude = None, None
+            if self.request.method == 'GET':
+                fields = self._parse_sparse_fields(self.fields_query_param)
+                exclude = self._parse_sparse_fields(self.exclude_query_param)
+
+            if fields is None and exclude is None:
+                self._sparse_fields = None  # pylint: disable=attribute-defined-outside-init
+            else:
+                self._sparse_fields = tuple(  # pylint: disable=attribute-defined-outside-init
+                    name for name in self.sparse_fields
+                    if (fields is None or name in fields) and (exclude is None or name not in exclude)
+                )
+        return self._sparse_fields
+
+    def get_serializer_context(self):  # pylint: disable=missing-docstring
+        context = super(SparseFieldsetMixin, self).get_serializer_context()
+        context['fields'] = self.get_sparse_fields()
+        return context
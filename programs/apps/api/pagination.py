@@ -1,8 +1,19 @@
 """
 Reusable pagination for REST API views.
 """
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+import datetime
+import json
+import operator
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import Q
+from django.utils.translation import ugettext_lazy as _
+from rest_framework.exceptions import NotFound
 from rest_framework.response import Response
 from rest_framework import pagination
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
 
 
 class DefaultPagination(pagination.PageNumberPagination):
@@ -24,3 +35,148 @@ class DefaultPagination(pagination.PageNumberPagination):
             'num_pages': self.page.paginator.num_pages,
             'results': data
         })
+
+
+def _encode_cursor_value(value):
+    """
+    JSON-encode values which the json module does not support natively.
+
+    Datetimes are encoded at full precision, unlike DjangoJSONEncoder which
+    truncates them to milliseconds; the cursor must match rows exactly.
+    """
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    raise TypeError(repr(value) + ' is not JSON serializable')
+
+
+class KeysetPagination(pagination.BasePagination):
+    """
+    Forward-only pagination by the position of the last row of the previous
+    page, in a stable ordering declared by the view.
+
+    Unlike DefaultPagination, this never counts the rows being paginated, and
+    each page is read with a range query rather than an OFFSET.  Provided the
+    ordering is covered by an index, the cost of a page does not depend on its
+    depth.  It is meant for clients which walk an entire listing, e.g. to
+    synchronize it.
+
+    Views using this paginator must define `keyset_ordering`, a sequence of
+    attribute names (model fields or annotations) whose values, taken together,
+    are unique.  In practice this means the last of them should be `id`, and
+    the model should declare the fields in its `index_together`.
+    """
+    page_size = api_settings.PAGE_SIZE
+    page_size_query_param = 'page_size'
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = _('Invalid cursor')
+    # the browsable API renders no page controls for this paginator.
+    display_page_controls = False
+
+    def __init__(self):
+        self.base_url = None
+        self.next_position = None
+
+    def get_page_size(self, request):
+        """
+        Return the requested page size, or the default if none (or an invalid one) was requested.
+        """
+        try:
+            return pagination._positive_int(  # pylint: disable=protected-access
+                request.query_params[self.page_size_query_param], strict=True
+            )
+        except (KeyError, ValueError):
+            return self.page_size
+
+    def decode_cursor(self, request, queryset, ordering):
+        """
+        Return the position encoded in the request's cursor, or None if there is no cursor.
+        """
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+
+        try:
+            values = json.loads(urlsafe_b64decode(encoded.encode('ascii')))
+            if not isinstance(values, list) or len(values) != len(ordering):
+                raise ValueError
+            return [self._to_python(queryset, name, value) for name, value in zip(ordering, values)]
+        except (TypeError, ValueError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+    @staticmethod
+    def _to_python(queryset, name, value):
+        """
+        Convert a decoded cursor value to the type of the attribute it was read from.
+        """
+        try:
+            field = queryset.model._meta.get_field(name)  # pylint: disable=protected-access
+        except FieldDoesNotExist:
+            # annotations are compared to the value as decoded.
+            return value
+        return field.to_python(value)
+
+    @staticmethod
+    def encode_cursor(values):
+        """
+        Encode a position as an opaque, URL-safe string.
+        """
+        return urlsafe_b64encode(json.dumps(values, default=_encode_cursor_value))
+
+    @staticmethod
+    def get_position_filter(ordering, position):
+        """
+        Build a filter matching the rows which follow the given position in the given ordering, i.e.
+
+            (a > x) OR (a = x AND b > y) OR ...
+        """
+        clauses = []
+        for index, name in enumerate(ordering):
+            lookups = dict(zip(ordering[:index], position[:index]))
+            lookups[name + '__gt'] = position[index]
+            clauses.append(Q(**lookups))
+        return reduce(operator.or_, clauses)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        page_size = self.get_page_size(request)
+        if not page_size:
+            return None
+
+        ordering = tuple(view.keyset_ordering)
+        self.base_url = request.build_absolute_uri()
+
+        queryset = queryset.order_by(*ordering)
+        position = self.decode_cursor(request, queryset, ordering)
+        if position is not None:
+            queryset = queryset.filter(self.get_position_filter(ordering, position))
+
+        # read one row more than the page size, to learn whether there is a next page.
+        results = list(queryset[:page_size + 1])
+        if len(results) > page_size:
+            results = results[:page_size]
+            last = results[-1]
+            # rows may also be dicts, as read with values().
+            self.next_position = [last[name] if isinstance(last, dict) else getattr(last, name) for name in ordering]
+        return results
+
+    def get_next_link(self):
+        """
+        Return the URL of the next page, or None if this is the last page.
+        """
+        if self.next_position is None:
+            return None
+        return replace_query_param(self.base_url, self.cursor_query_param, self.encode_cursor(self.next_position))
+
+    def to_html(self):
+        """
+        Render no page controls; see `display_page_controls`.
+        """
+        return ''
+
+    def get_paginated_response(self, data):
+        """
+        Annotate the response with the link to the next page.
+        """
+        return Response({
+            'next': self.get_next_link(),
+            'results': data
+        })
@@ -3,7 +3,7 @@ Custom Permissions for the REST API.
 """
 from rest_framework import permissions
 
-from programs.apps.core.constants import Role
+from programs.apps.api.roles import is_admin
 
 
 class IsAdminGroupOrReadOnly(permissions.IsAuthenticated):
@@ -16,7 +16,7 @@ class IsAdminGroupOrReadOnly(permissions.IsAuthenticated):
         return (
             super(IsAdminGroupOrReadOnly, self).has_permission(request, view) and
             request.method in permissions.SAFE_METHODS or
-            request.user.groups.filter(name=Role.ADMINS).exists()
+            is_admin(request)
         )
 
 
@@ -28,5 +28,5 @@ class IsAdminGroup(permissions.IsAuthenticated):
     def has_permission(self, request, view):
         return (
             super(IsAdminGroup, self).has_permission(request, view) and
-            request.user.groups.filter(name=Role.ADMINS).exists()
+            is_admin(request)
         )
@@ -0,0 +1,158 @@
+"""
+Projection-based rendering of program listings.
+
+Rendering a list of programs from model instances constructs a Program (with
+its image field file) for each program, and instances of four more models for
+each of its nested rows.  Instead, only the columns emitted by the API are read,
+as plain values: the programs with `values()`, and their nested rows with three
+`values_list()` joins.  The nested representation of each program is then
+assembled in a single grouping pass over those rows, with the same output as
+ProgramSerializer.
+"""
+from collections import defaultdict, OrderedDict
+
+from rest_framework import fields, serializers
+
+from programs.apps.api.serializers import BannerImageUrlsMixin
+from programs.apps.programs import models
+
+
+PROGRAM_COLUMNS = (
+    'id', 'name', 'subtitle', 'category', 'status', 'marketing_slug', 'created', 'modified', 'uuid',
+    'banner_image', 'banner_image_resized_urls',
+)
+
+
+def get_projection_queryset(queryset):
+    """
+    Return the given Program queryset as a queryset of dicts holding the columns needed for rendering.
+    """
+    return queryset.values(*PROGRAM_COLUMNS)
+
+
+class ProgramProjectionListSerializer(serializers.ListSerializer):  # pylint: disable=abstract-method
+    """
+    Render lists of projected programs, reading the nested rows of all of them at once.
+    """
+
+    def to_representation(self, data):
+        rows = list(data)
+        program_ids = [row['id'] for row in rows]
+        organizations, course_codes = self.child.get_nested_data(program_ids, self.context.get('fields'))
+        return [
+            self.child.render(row, organizations[row['id']], course_codes[row['id']]) for row in rows
+        ]
+
+
+class ProgramProjectionSerializer(BannerImageUrlsMixin, serializers.BaseSerializer):  # pylint: disable=abstract-method
+    """
+    Read-only serializer rendering the dicts of `get_projection_queryset` with the same output as ProgramSerializer.
+    """
+    _datetime = fields.DateTimeField().to_representation
+    _uuid = fields.UUIDField().to_representation
+
+    class Meta(object):  # pylint: disable=missing-docstring
+        list_serializer_class = ProgramProjectionListSerializer
+
+    @classmethod
+    def get_nested_data(cls, program_ids, requested_fields=None):
+        """
+        Read and group the organizations and course codes (with their run modes) of the given programs.
+        Nested data which is not among the requested fields (if any) is not read.
+
+        Returns:
+            tuple of two dicts, mapping program IDs to lists of the rendered organizations and course codes.
+        """
+        organizations = defaultdict(list)
+        course_codes = defaultdict(list)
+        if requested_fields is None or 'organizations' in requested_fields:
+            cls._read_organizations(program_ids, organizations)
+        if requested_fields is None or 'course_codes' in requested_fields:
+            cls._read_course_codes(program_ids, course_codes)
+        return organizations, course_codes
+
+    @staticmethod
+    def _read_organizations(program_ids, organizations):
+        """
+        Add the rendered organizations of the given programs to the lists in `organizations`, by program ID.
+        """
+        for program_id, display_name, key in models.ProgramOrganization.objects.filter(
+                program_id__in=program_ids
+        ).order_by('id').values_list('program_id', 'organization__display_name', 'organization__key'):
+            organizations[program_id].append(OrderedDict([('display_name', display_name), ('key', key)]))
+
+    @classmethod
+    def _read_course_codes(cls, program_ids, course_codes):
+        """
+        Add the rendered course codes (with their run modes) of the given programs to the lists in `course_codes`,
+        by program ID.
+        """
+        run_modes = defaultdict(list)
+        for program_course_code_id, course_key, mode_slug, sku, start_date, run_key in (
+                models.ProgramCourseRunMode.objects.filter(
+                    program_course_code__program_id__in=program_ids
+                ).order_by('id').values_list(
+                    'program_course_code_id', 'course_key', 'mode_slug', 'sku', 'start_date', 'run_key'
+                )
+        ):
+            run_modes[program_course_code_id].append(OrderedDict([
+                ('course_key', course_key),
+                ('mode_slug', mode_slug),
+                ('sku', sku),
+                ('start_date', None if start_date is None else cls._datetime(start_date)),
+                ('run_key', run_key),
+            ]))
+
+        for program_course_code_id, program_id, display_name, key, org_display_name, org_key in (
+                models.ProgramCourseCode.objects.filter(
+                    program_id__in=program_ids
+                ).order_by('position').values_list(
+                    'id', 'program_id', 'course_code__display_name', 'course_code__key',
+                    'course_code__organization__display_name', 'course_code__organization__key',
+                )
+        ):
+            course_codes[program_id].append(OrderedDict([
+                ('display_name', display_name),
+                ('key', key),
+                ('organization', OrderedDict([('display_name', org_display_name), ('key', org_key)])),
+                ('run_modes', run_modes[program_course_code_id]),
+            ]))
+
+    def render(self, row, organizations, course_codes):
+        """
+        Render a projected program, given its rendered organizations and course codes.
+        """
+        data = OrderedDict([
+            ('id', row['id']),
+            ('name', row['name']),
+            ('subtitle', row['subtitle']),
+            ('category', row['category']),
+            ('status', row['status']),
+            ('marketing_slug', row['marketing_slug']),
+            ('organizations', organizations),
+            ('course_codes', course_codes),
+            ('created', self._datetime(row['created'])),
+            ('modified', self._datetime(row['modified'])),
+            ('banner_image_urls', None),
+            ('uuid', self._uuid(row['uuid'])),
+        ])
+        requested_fields = self.context.get('fields')
+        if requested_fields is not None:
+            data = OrderedDict((name, value) for name, value in data.items() if name in requested_fields)
+
+        # banner image URLs are only resolved when they are rendered.
+        if 'banner_image_urls' in data:
+            data['banner_image_urls'] = self._render_banner_image_urls(row)
+        return data
+
+    def _render_banner_image_urls(self, row):
+        """
+        Render the banner image URLs of a projected program.
+        """
+        banner_image_field = models.Program._meta.get_field('banner_image')  # pylint: disable=protected-access
+        resized_urls = banner_image_field.get_resized_urls(row['banner_image'], row['banner_image_resized_urls'])
+        return self.render_banner_image_urls(resized_urls)
+
+    def to_representation(self, instance):
+        organizations, course_codes = self.get_nested_data([instance['id']], self.context.get('fields'))
+        return self.render(instance, organizations[instance['id']], course_codes[instance['id']])
@@ -0,0 +1,40 @@
+"""
+Per-request resolution of user roles for the REST API.
+"""
+from programs.apps.core.constants import Role
+
+
+# Name of the user attribute holding the `administrator` claim of a verified JWT (see JwtAuthentication).
+JWT_ADMINISTRATOR_ATTR = '_jwt_administrator'
+# Name of the request attribute used to memoize the result of `is_admin`.
+IS_ADMIN_ATTR = '_is_admin'
+
+
+def is_admin(request):
+    """
+    Determine whether the requesting user has the ADMINS role.
+
+    The result is memoized on the request, so that permissions, filters and
+    views can all check the role without repeating any query.  When the user
+    was authenticated with a JWT, the verified `administrator` claim is used
+    directly; JwtAuthentication keeps group membership in sync with that claim,
+    so no query is needed at all.
+
+    Arguments:
+        request (Request): the current request.
+
+    Returns:
+        bool
+    """
+    try:
+        return getattr(request, IS_ADMIN_ATTR)
+    except AttributeError:
+        pass
+
+    user = request.user
+    result = getattr(user, JWT_ADMINISTRATOR_ATTR, None)
+    if result is None:
+        result = user.groups.filter(name=Role.ADMINS).exists()
+
+    setattr(request, IS_ADMIN_ATTR, result)
+    return result
@@ -6,13 +6,72 @@ should be created here. As the API evolves, serializers may become more
 specific to a particular version of the API. In this case, the serializers
 in question should be moved to versioned sub-package.
 """
+from collections import defaultdict, OrderedDict
+from operator import attrgetter
+
 from django.core.exceptions import ValidationError
+from django.db import IntegrityError, transaction
+from django.db.models import Prefetch
+from django.utils import timezone
 from django.utils.translation import ugettext as _
 from rest_framework import fields, exceptions, serializers
 
 from programs.apps.programs import models, constants
 
 
+def bulk_write_instances(model, to_create, to_update, prepare=None):
+    """
+    Create and update instances of a model in bulk: new instances are written with a single bulk
+    INSERT, and changes to existing instances with one set-based UPDATE per distinct set of changed
+    values.  Existing instances with no changes are not written at all.
+
+    Note that model.save() is not called, so any validation it performs must be done by `prepare`,
+    and that the primary keys of created instances are not set on every database backend.
+
+    Arguments:
+        model: the model class.
+        to_create: validated data for each new instance.
+        to_update: (model instance, validated data) pairs for existing instances.
+        prepare: optional callable, given the list of all updated and new instances (with the validated
+            data applied) before anything is written, to validate / derive values.  New instances are
+            those without a primary key.
+
+    Returns:
+        tuple of (list of updated instances, list of created instances).
+    """
+    concrete_fields = model._meta.concrete_fields  # pylint: disable=protected-access
+    compared_fields = [field for field in concrete_fields if field.name != 'modified']
+
+    originals = []
+    for instance, data in to_update:
+        originals.append([getattr(instance, field.attname) for field in compared_fields])
+        for attr, value in data.items():
+            setattr(instance, attr, value)
+    updated = [instance for instance, __ in to_update]
+    created = [model(**data) for data in to_create]
+    if prepare is not None and (updated or created):
+        prepare(updated + created)
+
+    changed_ids = defaultdict(list)
+    for instance, original in zip(updated, originals):
+        changes = tuple(
+            (field.attname, getattr(instance, field.attname))
+            for field, value in zip(compared_fields, original) if getattr(instance, field.attname) != value
+        )
+        if changes:
+            changed_ids[changes].append(instance.id)
+
+    for changes, ids in changed_ids.items():
+        values = dict(changes)
+        if len(compared_fields) < len(concrete_fields):
+            values['modified'] = timezone.now()
+        model.objects.filter(id__in=ids).update(**values)
+
+    if created:
+        model.objects.bulk_create(created)
+    return updated, created
+
+
 class NestedWriteableSerializer(serializers.ListSerializer):
     """
     Reusable implementation of updatable nested lists.
@@ -24,10 +83,19 @@ class NestedWriteableSerializer(serializers.ListSerializer):
          for any child relative to the parent, and it should work with either
          mapping objects (keys) or model instances (attributes).  See the examples
          defined in this file.
+      c) define `batch_write(to_create, to_update)` on the serializer being nested.  That
+         method should write new children (given their validated data) and existing
+         children (given (child, validated data) pairs) in bulk, and return them.  See
+         `batch_update`.
     """
 
-    def update(self, instance, validated_data):
+    def _diff(self, instance, validated_data):
+        """
+        Match request data to existing children by their unique attributes.
 
+        Returns:
+            tuple of (data for new children, (child, data) pairs for existing children, children to delete).
+        """
         def _key(obj):
             """
             Use unique_attrs to compare across nested json dicts and model
@@ -35,28 +103,40 @@ class NestedWriteableSerializer(serializers.ListSerializer):
             """
             return self.child.unique_attrs(obj)
 
-        db_objs = {_key(obj): obj for obj in instance}
-        req_objs = {_key(obj): obj for obj in validated_data}
+        db_objs = OrderedDict((_key(obj), obj) for obj in instance)
+        req_objs = OrderedDict((_key(obj), obj) for obj in validated_data)
 
-        # Perform creations and updates.
-        ret = []
+        to_create = [req_obj for key, req_obj in req_objs.items() if key not in db_objs]
+        to_update = [(db_objs[key], req_obj) for key, req_obj in req_objs.items() if key in db_objs]
+        to_delete = [db_obj for key, db_obj in db_objs.items() if key not in req_objs]
+        return to_create, to_update, to_delete
 
-        for key, req_obj in req_objs.items():
-            db_obj = db_objs.get(key)
-            if db_obj is None:
-                # create the thing
-                ret.append(self.child.create(req_obj))
-            else:
-                # update the thing
-                ret.append(self.child.update(db_obj, req_obj))
+    def batch_update(self, groups):
+        """
+        Reconcile the children of any number of parents using a constant number of statements: a
+        single DELETE, set-based UPDATEs (skipping unchanged children), and a single bulk INSERT.
 
-        # Perform deletions.
-        for key, db_obj in db_objs.items():
-            if key not in req_objs:
-                # delete the thing
-                db_obj.delete()
+        Arguments:
+            groups: (existing children, validated data) pairs, one for each parent.
+
+        Returns:
+            list of the updated and created children.
+        """
+        to_create, to_update, to_delete = [], [], []
+        for instance, validated_data in groups:
+            created, updated, deleted = self._diff(instance, validated_data)
+            to_create.extend(created)
+            to_update.extend(updated)
+            to_delete.extend(deleted)
+
+        with transaction.atomic():
+            # deleting first frees any unique values (e.g. positions) held by removed children.
+            if to_delete:
+                self.child.Meta.model.objects.filter(id__in=[obj.id for obj in to_delete]).delete()
+            return self.child.batch_write(to_create, to_update)
 
-        return ret
+    def update(self, instance, validated_data):
+        return self.batch_update([(instance, validated_data)])
 
 
 class OrganizationSerializer(serializers.ModelSerializer):
@@ -86,6 +166,15 @@ class ProgramCourseRunModeSerializer(serializers.ModelSerializer):
         fields = ('course_key', 'mode_slug', 'sku', 'start_date', 'run_key')
         list_serializer_class = NestedWriteableSerializer
 
+    def batch_write(self, to_create, to_update):
+        """
+        For use with `NestedWriteableSerializer.batch_update`
+        """
+        updated, created = bulk_write_instances(
+            models.ProgramCourseRunMode, to_create, to_update, prepare=models.ProgramCourseRunMode.validate_bulk
+        )
+        return updated + created
+
     @classmethod
     def unique_attrs(cls, obj):
         """
@@ -129,6 +218,89 @@ class CourseCodeSerializer(serializers.ModelSerializer):
     )
 
 
+class ResolvedCourseCodeSerializer(CourseCodeSerializer):
+    """
+    Serializer for course codes which have been looked up by a CourseCodeResolver.
+
+    The resolver has already established whether a course code with the given keys exists, so
+    the UniqueTogether validator (which would query for it again) is omitted.  The database
+    constraint still guards against concurrent creation of the same course code.
+    """
+
+    class Meta(CourseCodeSerializer.Meta):  # pylint: disable=missing-docstring
+        validators = []
+
+
+class CourseCodeResolver(object):
+    """
+    Look up the organizations and course codes referred to by nested course code data, loading
+    all of them up front in two set-based queries, so that each nested item can be resolved from
+    memory.
+
+    Keys which miss in memory are looked up again in the database, one at a time, since whether
+    keys match is decided by the collation of the database (e.g. case-insensitively on MySQL).
+    """
+    CONTEXT_KEY = 'course_code_resolver'
+
+    def __init__(self, course_codes_data):
+        """
+        Arguments:
+            course_codes_data: the (unvalidated) course code items of a request.
+        """
+        pairs = set()
+        for data in course_codes_data:
+            try:
+                org_key, key = data[u'organization'][u'key'], data[u'key']
+            except (KeyError, TypeError):
+                # invalid items are reported when they are validated.
+                continue
+            if isinstance(org_key, basestring) and isinstance(key, basestring):
+                pairs.add((org_key, key))
+
+        org_keys = set(org_key for org_key, __ in pairs)
+        self.organizations = {org.key: org for org in models.Organization.objects.filter(key__in=org_keys)}
+        self.course_codes = {}
+        if self.organizations:
+            course_codes = models.CourseCode.objects.filter(
+                organization__in=self.organizations.values(),
+                key__in=set(key for __, key in pairs),
+            )
+            organizations_by_id = {org.id: org for org in self.organizations.values()}
+            for course_code in course_codes:
+                # avoid a query when the organization of the course code is next accessed.
+                course_code.organization = organizations_by_id[course_code.organization_id]
+                self.add_course_code(course_code)
+
+    def get_organization(self, key):
+        """
+        Return the organization with the given key, or None if it does not exist.
+        """
+        if not isinstance(key, basestring):
+            return None
+        if key not in self.organizations:
+            self.organizations[key] = models.Organization.objects.filter(key=key).first()
+        return self.organizations[key]
+
+    def get_course_code(self, organization, key):
+        """
+        Return the course code with the given key offered by the given organization, or None if it does not exist.
+        """
+        if not isinstance(key, basestring):
+            return None
+        if (organization.id, key) not in self.course_codes:
+            course_code = models.CourseCode.objects.filter(organization=organization, key=key).first()
+            if course_code is not None:
+                course_code.organization = organization
+            self.course_codes[(organization.id, key)] = course_code
+        return self.course_codes[(organization.id, key)]
+
+    def add_course_code(self, course_code):
+        """
+        Make a (new) course code available for lookup.
+        """
+        self.course_codes[(course_code.organization_id, course_code.key)] = course_code
+
+
 class ProgramCourseCodeSerializer(serializers.ModelSerializer):
     """Serializer for the program course code model."""
 
@@ -164,37 +336,47 @@ class ProgramCourseCodeSerializer(serializers.ModelSerializer):
         elif 'organization' not in data or 'key' not in data['organization']:
             raise ValidationError('Missing organization information.')
 
+        # the resolver is normally set up by the root serializer, for all of the course codes at once.
+        resolver = self.context.get(CourseCodeResolver.CONTEXT_KEY) or CourseCodeResolver([data])
+
         # find the organization, without which we can't do anything useful.
-        try:
-            organization = models.Organization.objects.get(key=data[u'organization'][u'key'])
-        except models.Organization.DoesNotExist:
+        organization = resolver.get_organization(data[u'organization'][u'key'])
+        if organization is None:
             raise ValidationError('Invalid organization key.')
         # extract request data we intend to pass to the serializer
         serializer_data = {k: data[k] for k in ('key', 'display_name') if k in data}
         serializer_data['organization'] = organization
 
         # try to find an existing course code instance, based on the keys we have.
-        try:
-            course_code = models.CourseCode.objects.get(key=data[u'key'], organization=organization)
-        except models.CourseCode.DoesNotExist:
-            course_code = None
+        course_code = resolver.get_course_code(organization, data[u'key'])
 
         # note that we are passing the organization in the context, because
         # while it's a read-only field on the CourseCodeSerializer, it's needed
-        # at create time (and there seems to be no other way to pass it through
-        # to the serializer's UniqueTogether validator, which requires its
-        # presence).
+        # at create time.
         #
         # see also: DefaultOrganizationFromContext (in this module)
         # and: http://www.django-rest-framework.org/api-guide/validators/#advanced-default-argument-usage
-        cc_serializer = CourseCodeSerializer(
+        cc_serializer = ResolvedCourseCodeSerializer(
             instance=course_code,
             data=serializer_data,
             partial=True,
             context={'organization': organization},
         )
         cc_serializer.is_valid(raise_exception=True)
-        return cc_serializer.save()
+        if course_code is not None and all(
+                getattr(course_code, attr) == value for attr, value in cc_serializer.validated_data.items()):
+            # nothing to update.
+            return course_code
+
+        try:
+            with transaction.atomic():
+                course_code = cc_serializer.save()
+        except IntegrityError:
+            # e.g. one was created concurrently, or its key differs from an existing one only in ways which the
+            # database collation ignores.
+            raise ValidationError('A course code with this key already exists for this organization.')
+        resolver.add_course_code(course_code)
+        return course_code
 
     def to_internal_value(self, data):
         """
@@ -221,40 +403,114 @@ class ProgramCourseCodeSerializer(serializers.ModelSerializer):
 
         return out_data
 
-    def _update_run_modes(self, instance, validated_run_modes):
+    def _batch_update_run_modes(self, pairs):
         """
-        Call the list serializer associated with the `run_modes` field on this serializer,
-        to handle nested list update logic.
+        Reconcile the run modes of several program course codes in one batch.
+
+        Arguments:
+            pairs: (program course code, validated run modes) tuples.  Run modes which are None are left as they are.
         """
-        if validated_run_modes is not None:
-            for run_mode in validated_run_modes:
+        pairs = [(program_course_code, run_modes) for program_course_code, run_modes in pairs if run_modes is not None]
+        if not pairs:
+            return
+
+        existing_run_modes = defaultdict(list)
+        for run_mode in models.ProgramCourseRunMode.objects.filter(
+                program_course_code__in=[program_course_code.id for program_course_code, __ in pairs]):
+            existing_run_modes[run_mode.program_course_code_id].append(run_mode)
+
+        groups = []
+        for program_course_code, run_modes in pairs:
+            for run_mode in run_modes:
                 # push down the reference to this parent object before passing data along
-                run_mode['program_course_code'] = instance
-            try:
-                self.fields['run_modes'].update(instance.run_modes.all(), validated_run_modes)
-            except ValidationError as exc:
-                raise exceptions.ValidationError(list(exc.messages))
+                run_mode['program_course_code'] = program_course_code
+            groups.append((existing_run_modes[program_course_code.id], run_modes))
 
-    def update(self, instance, validated_data):
+        try:
+            self.fields['run_modes'].batch_update(groups)
+        except ValidationError as exc:
+            raise exceptions.ValidationError(list(exc.messages))
+
+    @staticmethod
+    def _allocate_positions(program_course_codes):
         """
-        Implement nested writeable run modes during updates.
+        Perform the validation of ProgramCourseCode.save() for new program course codes.
         """
-        run_modes = validated_data.pop('run_modes', None)
-        instance = super(ProgramCourseCodeSerializer, self).update(instance, validated_data)
-        self._update_run_modes(instance, run_modes)
-        return instance
+        models.ProgramCourseCode.allocate_positions(
+            [program_course_code for program_course_code in program_course_codes if program_course_code.id is None]
+        )
 
-    def create(self, validated_data):
+    def batch_write(self, to_create, to_update):
+        """
+        For use with `NestedWriteableSerializer.batch_update`.  The run modes of all of the
+        program course codes, whether new or existing, are then reconciled in one batch.
+        """
+        updated_run_modes = [data.pop('run_modes', None) for __, data in to_update]
+        created_run_modes = [data.pop('run_modes', None) for data in to_create]
+
+        updated, created = bulk_write_instances(
+            models.ProgramCourseCode, to_create, to_update, prepare=self._allocate_positions
+        )
+        if created:
+            # bulk_create does not set primary keys on every backend, so read them back by their (unique) programs
+            # and positions.
+            ids = {
+                (program_id, position): pk for program_id, position, pk in models.ProgramCourseCode.objects.filter(
+                    program__in=set(instance.program_id for instance in created),
+                    position__in=set(instance.position for instance in created),
+                ).values_list('program', 'position', 'id')
+            }
+            for instance in created:
+                instance.id = ids[(instance.program_id, instance.position)]
+
+        self._batch_update_run_modes(zip(updated + created, updated_run_modes + created_run_modes))
+        return updated + created
+
+
+class BannerImageUrlsMixin(object):
+    """
+    Render the banner image URLs of programs, for serializers of the Program model.
+
+    The default banner image URLs are read once per serializer, and kept in its
+    context, which the serializers of all items of a list share.
+    """
+    DEFAULT_BANNER_IMAGES_CONTEXT_KEY = 'default_banner_images'
+
+    def _get_default_banner_images(self):
+        """Get default banner image URLs.
+
+        Returns:
+            list of tuples if default banner image has been configured. Empty list otherwise.
+        """
+        context = self.context
+        if self.DEFAULT_BANNER_IMAGES_CONTEXT_KEY not in context:
+            context[self.DEFAULT_BANNER_IMAGES_CONTEXT_KEY] = models.ProgramDefault.get_banner_image_urls().items()
+        return context[self.DEFAULT_BANNER_IMAGES_CONTEXT_KEY]
+
+    def get_banner_image_urls(self, instance):
         """
-        Implement nested writeable run modes upon creation.
+        Render public-facing URLs for the available banner images.
+        """
+        return self.render_banner_image_urls(instance.banner_image.resized_urls)
+
+    def render_banner_image_urls(self, resized_urls):
+        """
+        Render public-facing URLs for the given resized banner image URLs, keyed by (width, height), or for
+        the default banner images if there are none.
         """
-        run_modes = validated_data.pop('run_modes', None)
-        instance = super(ProgramCourseCodeSerializer, self).create(validated_data)
-        self._update_run_modes(instance, run_modes)
-        return instance
+        url_items = resized_urls.items()
+        if not url_items:
+            url_items = self._get_default_banner_images()
+
+        # in case MEDIA_URL does not include scheme+host, ensure that the URLs are absolute and not relative.
+        # without a request (e.g. when building program documents) they are left as they are.
+        request = self.context.get('request')
+        if request is not None:
+            url_items = [[size, request.build_absolute_uri(url)] for size, url in url_items]
+        return {'w{}h{}'.format(*size): url for size, url in url_items}
 
 
-class ProgramSerializer(serializers.ModelSerializer):
+class ProgramSerializer(BannerImageUrlsMixin, serializers.ModelSerializer):
     """General-purpose serializer for the Program model."""
 
     class Meta(object):  # pylint: disable=missing-docstring
@@ -269,29 +525,46 @@ class ProgramSerializer(serializers.ModelSerializer):
     organizations = ProgramOrganizationSerializer(many=True, source='programorganization_set')
     course_codes = ProgramCourseCodeSerializer(many=True, source='programcoursecode_set', required=False)
 
-    def _get_default_banner_images(self):
-        """Get default banner image URLs.
+    NESTED_FIELDS = ('organizations', 'course_codes')
 
-        Returns:
-            list of tuples if default banner image has been configured. Empty list otherwise.
-        """
-        try:
-            program_default = models.ProgramDefault.objects.get()
-            return program_default.banner_image.resized_urls.items()
-        except models.ProgramDefault.DoesNotExist:
-            return []
+    # the context may hold a dict of organizations by key, preloaded for several programs at once (e.g. by the bulk
+    # write view).  Keys which miss in it are looked up in the database, since whether keys match is decided by the
+    # collation of the database.
+    ORGANIZATIONS_CONTEXT_KEY = 'organizations_by_key'
 
-    def get_banner_image_urls(self, instance):
+    @staticmethod
+    def setup_eager_loading(queryset, requested_fields=None):
         """
-        Render public-facing URLs for the available banner images.
+        Prefetch the nested data rendered by this serializer, to prevent a cascade of performance-degrading queries.
+
+        Arguments:
+            queryset: the Program queryset.
+            requested_fields: the names of the fields which will be rendered, or None for all of them.  Nested data
+                which will not be rendered is not prefetched.
         """
-        url_items = instance.banner_image.resized_urls.items()
-        if not url_items:
-            url_items = self._get_default_banner_images()
+        lookups = []
+        if requested_fields is None or 'organizations' in requested_fields:
+            lookups.append(Prefetch(
+                'programorganization_set',
+                queryset=models.ProgramOrganization.objects.select_related('organization')
+            ))
+        if requested_fields is None or 'course_codes' in requested_fields:
+            lookups.append(Prefetch(
+                'programcoursecode_set',
+                queryset=models.ProgramCourseCode.objects.select_related()
+            ))
+            lookups.append('programcoursecode_set__run_modes')
+        return queryset.prefetch_related(*lookups)
 
-        # in case MEDIA_URL does not include scheme+host, ensure that the URLs are absolute and not relative
-        url_items = [[size, self.context['request'].build_absolute_uri(url)] for size, url in url_items]
-        return {'w{}h{}'.format(*size): url for size, url in url_items}
+    def to_internal_value(self, data):
+        """
+        Resolve all of the course codes referred to by nested data at once, before the nested items are
+        deserialized (see `ProgramCourseCodeSerializer._get_course_code`).
+        """
+        course_codes_data = data.get('course_codes') if isinstance(data, dict) else None
+        if isinstance(course_codes_data, list):
+            self.context[CourseCodeResolver.CONTEXT_KEY] = CourseCodeResolver(course_codes_data)
+        return super(ProgramSerializer, self).to_internal_value(data)
 
     def create(self, validated_data):
         """
@@ -304,7 +577,7 @@ class ProgramSerializer(serializers.ModelSerializer):
         # with the newly created program
         for organization_data in programs_organizations_data:
             org_data = organization_data.get('organization')
-            organization = models.Organization.objects.get(key=org_data.get('key'))
+            organization = self._get_organization(org_data.get('key'))
             models.ProgramOrganization.objects.get_or_create(program=program, organization=organization)
 
         return program
@@ -315,10 +588,15 @@ class ProgramSerializer(serializers.ModelSerializer):
         """
         program_course_codes = validated_data.pop('programcoursecode_set', None)
 
-        program = super(ProgramSerializer, self).update(instance, validated_data)
+        with transaction.atomic():
+            if program_course_codes is not None:
+                self.fields['course_codes'].update(
+                    instance.programcoursecode_set.select_related('course_code__organization'), program_course_codes
+                )
 
-        if program_course_codes is not None:
-            self.fields['course_codes'].update(instance.programcoursecode_set.all(), program_course_codes)
+            # the program is saved last, so that its signals (which invalidate cached representations)
+            # follow all of the nested changes, some of which may have been written in bulk, without signals.
+            program = super(ProgramSerializer, self).update(instance, validated_data)
 
         return program
 
@@ -347,8 +625,120 @@ class ProgramSerializer(serializers.ModelSerializer):
         # the same key
         for organization_data in organizations:
             org_data = organization_data.get('organization')
-            if not models.Organization.objects.filter(key=org_data.get('key')).exists():
+            if self._get_organization(org_data.get('key')) is None:
                 error_msg = _("Provided Organization with key '{org_key}' doesn't exist.")
                 raise serializers.ValidationError(error_msg.format(org_key=org_data.get('key')))
 
         return organizations
+
+    def _get_organization(self, key):
+        """
+        Return the organization with the given key, or None if it does not exist.
+        """
+        organizations = self.context.get(self.ORGANIZATIONS_CONTEXT_KEY)
+        if organizations is None:
+            return models.Organization.objects.filter(key=key).first()
+        if key not in organizations:
+            organizations[key] = models.Organization.objects.filter(key=key).first()
+        return organizations[key]
+
+
+def _compile_accessors(*specs):
+    """
+    Compile the given (output name, dotted source attribute, representation function) specs, for use with
+    `_render`.  The representation function may be None, to output attribute values as they are.
+    """
+    return tuple((name, attrgetter(source), to_representation) for name, source, to_representation in specs)
+
+
+def _render(instance, accessors):
+    """
+    Render an instance with compiled accessors.  As with DRF fields, None is rendered as None.
+    """
+    data = OrderedDict()
+    for name, get_attribute, to_representation in accessors:
+        value = get_attribute(instance)
+        data[name] = value if value is None or to_representation is None else to_representation(value)
+    return data
+
+
+def _render_one(accessors):
+    """
+    Return a representation function rendering a related instance with compiled accessors.
+    """
+    return lambda instance: _render(instance, accessors)
+
+
+def _render_many(accessors):
+    """
+    Return a representation function rendering each instance of a related manager with compiled accessors.
+    """
+    return lambda manager: [_render(instance, accessors) for instance in manager.all()]
+
+
+class ProgramReadSerializer(BannerImageUrlsMixin, serializers.BaseSerializer):  # pylint: disable=abstract-method
+    """
+    Read-only serializer rendering programs with exactly the same output as ProgramSerializer, for GET requests.
+
+    ProgramSerializer binds a tree of DRF fields for every request and calls each of them for every row, which
+    dominates the cost of rendering long lists.  This instead renders the data prefetched by
+    `ProgramSerializer.setup_eager_loading` with accessors compiled once, at import time.
+    """
+    _datetime = fields.DateTimeField().to_representation
+    _uuid = fields.UUIDField().to_representation
+
+    organization_accessors = _compile_accessors(
+        ('display_name', 'display_name', unicode),
+        ('key', 'key', unicode),
+    )
+    program_organization_accessors = _compile_accessors(
+        ('display_name', 'organization.display_name', unicode),
+        ('key', 'organization.key', unicode),
+    )
+    run_mode_accessors = _compile_accessors(
+        ('course_key', 'course_key', unicode),
+        ('mode_slug', 'mode_slug', unicode),
+        ('sku', 'sku', unicode),
+        ('start_date', 'start_date', _datetime),
+        ('run_key', 'run_key', unicode),
+    )
+    program_course_code_accessors = _compile_accessors(
+        ('display_name', 'course_code.display_name', unicode),
+        ('key', 'course_code.key', unicode),
+        ('organization', 'course_code.organization', _render_one(organization_accessors)),
+        ('run_modes', 'run_modes', _render_many(run_mode_accessors)),
+    )
+    # banner image URLs are rendered from the resized URLs by `to_representation`, as they depend on the request.
+    program_accessors = _compile_accessors(
+        ('id', 'id', None),
+        ('name', 'name', unicode),
+        ('subtitle', 'subtitle', unicode),
+        ('category', 'category', unicode),
+        ('status', 'status', unicode),
+        ('marketing_slug', 'marketing_slug', unicode),
+        ('organizations', 'programorganization_set', _render_many(program_organization_accessors)),
+        ('course_codes', 'programcoursecode_set', _render_many(program_course_code_accessors)),
+        ('created', 'created', _datetime),
+        ('modified', 'modified', _datetime),
+        ('banner_image_urls', 'banner_image.resized_urls', None),
+        ('uuid', 'uuid', _uuid),
+    )
+
+    @property
+    def selected_accessors(self):
+        """
+        The program accessors of the fields selected in the context (see `SparseFieldsetMixin`), if any.
+        """
+        if not hasattr(self, '_selected_accessors'):
+            requested_fields = self.context.get('fields')
+            self._selected_accessors = tuple(  # pylint: disable=attribute-defined-outside-init
+                accessor for accessor in self.program_accessors
+                if requested_fields is None or accessor[0] in requested_fields
+            )
+        return self._selected_accessors
+
+    def to_representation(self, instance):
+        data = _render(instance, self.selected_accessors)
+        if 'banner_image_urls' in data:
+            data['banner_image_urls'] = self.render_banner_image_urls(data['banner_image_urls'])
+        return data
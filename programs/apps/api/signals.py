@@ -0,0 +1,59 @@
+"""
+Signal handlers for the REST API.
+"""
+from django.core.signals import request_finished
+from django.db.models.signals import post_delete, post_save
+
+from programs.apps.api.cache import bump_catalog_version
+from programs.apps.api.documents import (
+    create_document,
+    get_affected_documents,
+    invalidate_documents,
+    rebuild_after_request,
+)
+from programs.apps.programs import models
+
+
+# Every model whose data is rendered (directly or through a default) in program API responses.
+CATALOG_MODELS = (
+    models.Program,
+    models.ProgramOrganization,
+    models.ProgramCourseCode,
+    models.ProgramCourseRunMode,
+    models.CourseCode,
+    models.Organization,
+    models.ProgramDefault,
+)
+
+
+def invalidate_cached_responses(sender, **kwargs):  # pylint: disable=unused-argument
+    """
+    Invalidate all cached API responses when catalog data changes.
+    """
+    bump_catalog_version()
+
+
+def invalidate_program_documents(sender, instance, created=False, **kwargs):  # pylint: disable=unused-argument
+    """
+    Invalidate the documents of the programs in which the changed instance is
+    rendered, or create the document of a new program.
+    """
+    if created and isinstance(instance, models.Program):
+        create_document(instance)
+    else:
+        invalidate_documents(get_affected_documents(instance))
+
+
+def connect_signals():
+    """
+    Connect the handlers in this module to the models they depend upon.
+    """
+    for model in CATALOG_MODELS:
+        for signal in (post_save, post_delete):
+            for handler in (invalidate_cached_responses, invalidate_program_documents):
+                signal.connect(
+                    handler,
+                    sender=model,
+                    dispatch_uid='api.{}.{}'.format(handler.__name__, model.__name__),
+                )
+    request_finished.connect(rebuild_after_request, dispatch_uid='api.rebuild_after_request')
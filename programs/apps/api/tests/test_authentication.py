@@ -5,8 +5,9 @@ import time
 
 import ddt
 from django.contrib.auth.models import Group
+from django.core.cache import cache
 from django.db import IntegrityError
-from django.test import TestCase
+from django.test import override_settings, TestCase
 from edx_rest_framework_extensions.utils import api_settings as drf_jwt_settings
 import mock
 from rest_framework.exceptions import AuthenticationFailed
@@ -20,6 +21,7 @@ from programs.apps.core.tests.factories import UserFactory
 
 
 AUTH_MODULE = 'programs.apps.api.authentication'
+LOCMEM_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
 
 
 @ddt.ddt
@@ -112,6 +114,88 @@ class TestJWTAuthentication(JwtMixin, TestCase):
             authentication.authenticate(request)
 
 
+@override_settings(CACHES=LOCMEM_CACHES)
+@ddt.ddt
+class TestJWTUserProvisioning(JwtMixin, TestCase):
+    """
+    Ensure that provisioning users during JWT authentication avoids unnecessary queries and writes.
+    """
+
+    def setUp(self):
+        super(TestJWTUserProvisioning, self).setUp()
+        cache.clear()
+        self.user = UserFactory.create()
+        self.admin_group = Group.objects.get(name=Role.ADMINS)  # pylint: disable=no-member
+
+    def authenticate(self, admin):
+        """
+        Shorthand convenience.
+        """
+        return JwtAuthentication().authenticate_credentials(self.default_payload(self.user, admin=admin))
+
+    def assert_has_admin_role(self, has_role=True):
+        """
+        Shorthand convenience.
+        """
+        _assert = self.assertTrue if has_role else self.assertFalse
+        _assert(self.user.groups.filter(name=Role.ADMINS).exists())
+
+    @ddt.data(True, False)
+    def test_known_user(self, admin):
+        """
+        Verify that once roles are synced, a known user is authenticated with a single query.
+        """
+        self.authenticate(admin)
+        self.assert_has_admin_role(admin)
+
+        with self.assertNumQueries(1):
+            self.assertEqual(self.authenticate(admin), self.user)
+
+    @ddt.data(True, False)
+    def test_no_write_when_roles_match(self, admin):
+        """
+        Verify that group membership is not written when it already matches the claim.
+        """
+        if admin:
+            self.user.groups.add(self.admin_group)
+
+        with mock.patch.object(Group.user_set.related_manager_cls, 'add') as mock_add:
+            with mock.patch.object(Group.user_set.related_manager_cls, 'remove') as mock_remove:
+                self.authenticate(admin)
+
+        self.assertFalse(mock_add.called)
+        self.assertFalse(mock_remove.called)
+        self.assert_has_admin_role(admin)
+
+    def test_claim_change(self):
+        """
+        Verify that a change in role claims is applied immediately, despite caching.
+        """
+        self.authenticate(False)
+        self.assert_has_admin_role(False)
+
+        self.authenticate(True)
+        self.assert_has_admin_role()
+
+        self.authenticate(False)
+        self.assert_has_admin_role(False)
+
+    def test_cache_expiry(self):
+        """
+        Verify that roles are synced again once the cached sync has expired.
+        """
+        self.authenticate(True)
+        self.user.groups.remove(self.admin_group)
+
+        # within the timeout, membership is assumed to match the claim.
+        self.authenticate(True)
+        self.assert_has_admin_role(False)
+
+        cache.clear()
+        self.authenticate(True)
+        self.assert_has_admin_role()
+
+
 @ddt.ddt
 class TestPipelineUserRoles(TestCase):
     """
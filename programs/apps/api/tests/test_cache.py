@@ -0,0 +1,101 @@
+"""
+Tests for REST API response caching.
+"""
+import ddt
+from django.core.cache import cache
+from django.test import override_settings, TestCase
+from rest_framework.test import APIRequestFactory
+
+from programs.apps.api.cache import bump_catalog_version, get_catalog_version, get_response_cache_key
+from programs.apps.programs.tests import factories
+
+
+LOCMEM_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+@ddt.ddt
+class CatalogVersionTests(TestCase):
+    """
+    Tests for the catalog version used to invalidate cached responses.
+    """
+
+    def setUp(self):
+        super(CatalogVersionTests, self).setUp()
+        cache.clear()
+
+    def test_version_is_stable(self):
+        """
+        Verify that the version does not change unless bumped.
+        """
+        self.assertEqual(get_catalog_version(), get_catalog_version())
+
+    def test_bump(self):
+        """
+        Verify that bumping the version replaces it.
+        """
+        version = get_catalog_version()
+        bump_catalog_version()
+        self.assertNotEqual(get_catalog_version(), version)
+
+    def test_response_cache_key(self):
+        """
+        Verify that response cache keys depend on the version, the URI and any extra parts.
+        """
+        request = APIRequestFactory().get('/api/v1/programs/', {'status': 'active'})
+        key = get_response_cache_key(request, 'a')
+
+        self.assertEqual(key, get_response_cache_key(request, 'a'))
+        self.assertNotEqual(key, get_response_cache_key(request, 'b'))
+        self.assertNotEqual(key, get_response_cache_key(APIRequestFactory().get('/api/v1/programs/'), 'a'))
+
+        bump_catalog_version()
+        self.assertNotEqual(key, get_response_cache_key(request, 'a'))
+
+    @ddt.data(
+        factories.ProgramFactory,
+        factories.OrganizationFactory,
+        factories.CourseCodeFactory,
+    )
+    def test_invalidated_by_save_and_delete(self, factory):
+        """
+        Verify that saving or deleting catalog data changes the version.
+        """
+        version = get_catalog_version()
+        obj = factory.create()
+        self.assertNotEqual(get_catalog_version(), version)
+
+        version = get_catalog_version()
+        obj.delete()
+        self.assertNotEqual(get_catalog_version(), version)
+
+    def test_invalidated_by_program_default(self):
+        """
+        Verify that saving the program defaults changes the version.
+        """
+        version = get_catalog_version()
+        factories.ProgramDefaultFactory.create()
+        self.assertNotEqual(get_catalog_version(), version)
+
+    def test_invalidated_by_nested_data(self):
+        """
+        Verify that saving nested program data changes the version.
+        """
+        program = factories.ProgramFactory.create()
+        org = factories.OrganizationFactory.create()
+        course_code = factories.CourseCodeFactory.create(organization=org)
+
+        version = get_catalog_version()
+        factories.ProgramOrganizationFactory.create(program=program, organization=org)
+        self.assertNotEqual(get_catalog_version(), version)
+
+        version = get_catalog_version()
+        program_course_code = factories.ProgramCourseCodeFactory.create(program=program, course_code=course_code)
+        self.assertNotEqual(get_catalog_version(), version)
+
+        version = get_catalog_version()
+        factories.ProgramCourseRunModeFactory.create(
+            program_course_code=program_course_code,
+            course_key='edX/DemoX/Demo_Course',
+        )
+        self.assertNotEqual(get_catalog_version(), version)
@@ -0,0 +1,216 @@
+"""
+Tests for precomputed program documents.
+"""
+import json
+
+from django.core.management import call_command, CommandError
+from django.core.signals import request_finished
+from django.db.models.query import QuerySet
+from django.test import override_settings, RequestFactory, TestCase
+import mock
+
+from programs.apps.api.documents import (
+    build_documents,
+    get_document_data,
+    ProgramDocumentSerializer,
+    rebuild_stale_documents,
+)
+from programs.apps.api.serializers import ProgramSerializer
+from programs.apps.programs.models import Program, ProgramDefault, ProgramDocument
+from programs.apps.programs.tests.factories import (
+    CourseCodeFactory,
+    OrganizationFactory,
+    ProgramCourseCodeFactory,
+    ProgramCourseRunModeFactory,
+    ProgramDefaultFactory,
+    ProgramFactory,
+    ProgramOrganizationFactory,
+)
+from programs.apps.programs.tests.helpers import make_banner_image_file
+
+
+class ProgramDocumentTests(TestCase):
+    """
+    Tests for building, serving and invalidating program documents.
+    """
+
+    def setUp(self):
+        super(ProgramDocumentTests, self).setUp()
+        self.org = OrganizationFactory.create()
+        self.program = ProgramFactory.create()
+        ProgramOrganizationFactory.create(program=self.program, organization=self.org)
+        self.course_code = CourseCodeFactory.create(organization=self.org)
+        self.program_course_code = ProgramCourseCodeFactory.create(program=self.program, course_code=self.course_code)
+        self.run_mode = ProgramCourseRunModeFactory.create(
+            program_course_code=self.program_course_code, course_key='edX/DemoX/Demo_Course'
+        )
+        self.request = RequestFactory().get('/')
+
+    def _render(self):
+        """
+        Return the program as rendered from its document, and as rendered by ProgramSerializer.
+        """
+        program = Program.objects.select_related('document').get(id=self.program.id)
+        document_data = ProgramDocumentSerializer(program, context={'request': self.request}).data
+        live_data = ProgramSerializer(program, context={'request': self.request}).data
+        return json.loads(json.dumps(document_data)), json.loads(json.dumps(live_data))
+
+    def assert_current(self):
+        """
+        Ensure that the program's document is current, and renders the same data as ProgramSerializer.
+        """
+        document_data, live_data = self._render()
+        self.assertEqual(document_data, live_data)
+        self.assertTrue(ProgramDocument.objects.get(program=self.program).is_current)
+
+    def assert_invalidated(self, change):
+        """
+        Ensure that making the given change invalidates the program's document.
+        """
+        self.assert_current()
+        change()
+        self.assertFalse(ProgramDocument.objects.get(program=self.program).is_current)
+        self.assert_current()
+
+    def test_created_with_program(self):
+        """
+        Ensure that a document row is created (though not built) along with its program.
+        """
+        document = ProgramDocument.objects.get(program=ProgramFactory.create())
+        self.assertFalse(document.is_current)
+        self.assertNotEqual(document.version, '')
+
+    def test_build_on_read(self):
+        """
+        Ensure that documents are built when read, and then served with a single query.
+        """
+        self.assertFalse(ProgramDocument.objects.get(program=self.program).is_current)
+        self.assert_current()
+
+        with self.assertNumQueries(1):
+            program = Program.objects.select_related('document').get(id=self.program.id)
+            data = ProgramDocumentSerializer(program, context={'request': self.request}).data
+        self.assertEqual(data['id'], self.program.id)
+
+    def test_missing_row_not_stored(self):
+        """
+        Ensure that programs without a document row are rendered, but that readers do not create the row (which
+        a concurrent change could not have invalidated).
+        """
+        ProgramDocument.objects.filter(program=self.program).delete()
+        document_data, live_data = self._render()
+        self.assertEqual(document_data, live_data)
+        self.assertFalse(ProgramDocument.objects.filter(program=self.program).exists())
+
+        call_command('rebuild_program_documents')
+        self.assert_current()
+
+    def test_stores_batched(self):
+        """
+        Ensure that the documents built together are stored with a single query.
+        """
+        other = ProgramFactory.create()
+        with mock.patch.object(QuerySet, 'update', autospec=True, side_effect=QuerySet.update) as mock_update:
+            build_documents([self.program.id, other.id])
+        self.assertEqual(mock_update.call_count, 1)
+        self.assertTrue(ProgramDocument.objects.get(program=self.program).is_current)
+        self.assertTrue(ProgramDocument.objects.get(program=other).is_current)
+
+    @override_settings(PROGRAM_DOCUMENTS_REBUILD_ON_WRITE=True)
+    def test_rebuild_after_request(self):
+        """
+        Ensure that documents invalidated by a request are rebuilt on a background worker once it has finished.
+        """
+        with mock.patch('programs.apps.programs.workers.submit') as mock_submit:
+            self.run_mode.save()
+            request_finished.send(sender=None)
+            request_finished.send(sender=None)
+        mock_submit.assert_called_once_with(rebuild_stale_documents)
+        self.assertFalse(ProgramDocument.objects.get(program=self.program).is_current)
+
+        self.assertEqual(rebuild_stale_documents(), 1)
+        self.assert_current()
+        self.assertEqual(rebuild_stale_documents(), 0)
+
+    def test_invalidate_program(self):
+        """
+        Ensure that changing a program invalidates its document.
+        """
+        self.program.name = 'updated'
+        self.assert_invalidated(self.program.save)
+
+    def test_invalidate_nested(self):
+        """
+        Ensure that changing or deleting nested rows invalidates the document.
+        """
+        self.assert_invalidated(self.run_mode.save)
+        self.assert_invalidated(self.run_mode.delete)
+        self.assert_invalidated(self.course_code.save)
+        self.assert_invalidated(self.org.save)
+        self.assert_invalidated(self.program_course_code.delete)
+
+    def test_invalidate_program_default(self):
+        """
+        Ensure that changing the program defaults invalidates the documents of programs without a banner image.
+        """
+        self.assert_invalidated(ProgramDefaultFactory.create)
+
+        other = ProgramFactory.create()
+        other.banner_image = make_banner_image_file('test_filename.jpg')
+        other.save()
+        get_document_data(Program.objects.select_related('document').filter(id__in=[self.program.id, other.id]))
+        ProgramDefault.get_solo().save()
+        self.assertTrue(ProgramDocument.objects.get(program=other).is_current)
+        self.assertFalse(ProgramDocument.objects.get(program=self.program).is_current)
+
+    def test_other_programs_unaffected(self):
+        """
+        Ensure that changes only invalidate the documents of the programs they affect.
+        """
+        other = ProgramFactory.create()
+        get_document_data(Program.objects.select_related('document').filter(id__in=[self.program.id, other.id]))
+        self.run_mode.save()
+        self.assertTrue(ProgramDocument.objects.get(program=other).is_current)
+
+    def test_relative_banner_urls(self):
+        """
+        Ensure that banner image URLs are stored as they are, and made absolute when served.
+        """
+        self.program.banner_image = make_banner_image_file('test_filename.jpg')
+        self.program.save()
+        self.assert_current()
+        stored = json.loads(ProgramDocument.objects.get(program=self.program).document)
+        for url in stored['banner_image_urls'].values():
+            self.assertTrue(url.startswith('/'))
+
+    def test_racing_rebuild_discarded(self):
+        """
+        Ensure that a rebuild is not stored if the document was invalidated while it was being built.
+        """
+        original_setup = ProgramSerializer.setup_eager_loading
+
+        def setup_and_change(queryset):
+            """Change the program after the document versions have been read."""
+            Program.objects.get(id=self.program.id).save()
+            return original_setup(queryset)
+
+        ProgramSerializer.setup_eager_loading = staticmethod(setup_and_change)
+        try:
+            build_documents([self.program.id])
+        finally:
+            ProgramSerializer.setup_eager_loading = staticmethod(original_setup)
+
+        self.assertFalse(ProgramDocument.objects.get(program=self.program).is_current)
+
+    def test_rebuild_command(self):
+        """
+        Ensure that the management command rebuilds and verifies documents.
+        """
+        self.assert_current()
+        ProgramDocument.objects.filter(program=self.program).update(document='{}')
+        with self.assertRaises(CommandError):
+            call_command('rebuild_program_documents', verify_only=True)
+
+        call_command('rebuild_program_documents', chunk_size=1)
+        self.assert_current()
+        call_command('rebuild_program_documents', verify_only=True)
@@ -0,0 +1,65 @@
+"""
+Tests for per-request role resolution.
+"""
+import ddt
+from django.contrib.auth.models import Group
+from django.test import TestCase
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from programs.apps.api.authentication import JwtAuthentication
+from programs.apps.api.roles import is_admin
+from programs.apps.api.v1.tests.mixins import JwtMixin
+from programs.apps.core.constants import Role
+from programs.apps.core.tests.factories import UserFactory
+
+
+@ddt.ddt
+class IsAdminTests(JwtMixin, TestCase):
+    """
+    Tests for `is_admin`.
+    """
+
+    def _make_request(self, user):
+        """
+        Build a DRF request authenticated as the given user.
+        """
+        request = APIRequestFactory().get('/')
+        force_authenticate(request, user)
+        return Request(request)
+
+    @ddt.data(True, False)
+    def test_session_user_memoized(self, admin):
+        """
+        Verify that group membership is queried at most once per request.
+        """
+        user = UserFactory()
+        if admin:
+            user.groups.add(Group.objects.get(name=Role.ADMINS))  # pylint: disable=no-member
+        request = self._make_request(user)
+
+        with self.assertNumQueries(1):
+            self.assertEqual(is_admin(request), admin)
+            self.assertEqual(is_admin(request), admin)
+
+    def test_not_shared_between_requests(self):
+        """
+        Verify that the role is resolved again for each request.
+        """
+        user = UserFactory()
+        self.assertFalse(is_admin(self._make_request(user)))
+        user.groups.add(Group.objects.get(name=Role.ADMINS))  # pylint: disable=no-member
+        self.assertTrue(is_admin(self._make_request(user)))
+
+    @ddt.data(True, False)
+    def test_jwt_claim(self, admin):
+        """
+        Verify that no queries are needed for users authenticated by JWT.
+        """
+        user = JwtAuthentication().authenticate_credentials(
+            self.default_payload(UserFactory(), admin=admin)
+        )
+        request = self._make_request(user)
+
+        with self.assertNumQueries(0):
+            self.assertEqual(is_admin(request), admin)
@@ -0,0 +1,199 @@
+"""
+Tests for Programs API serializers.
+"""
+import json
+
+from django.core.cache import cache
+from django.test import override_settings, RequestFactory, TestCase
+import mock
+from rest_framework.utils.encoders import JSONEncoder
+
+from programs.apps.api.projections import get_projection_queryset, ProgramProjectionSerializer
+from programs.apps.api.serializers import (
+    CourseCodeResolver,
+    ProgramCourseCodeSerializer,
+    ProgramReadSerializer,
+    ProgramSerializer,
+)
+from programs.apps.programs.models import Program, ProgramCourseCode, ProgramDefault
+from programs.apps.programs.tests.factories import (
+    CourseCodeFactory,
+    OrganizationFactory,
+    ProgramCourseCodeFactory,
+    ProgramCourseRunModeFactory,
+    ProgramDefaultFactory,
+    ProgramFactory,
+    ProgramOrganizationFactory,
+)
+from programs.apps.programs.tests.helpers import make_banner_image_file
+
+
+class ProgramReadSerializerTests(TestCase):
+    """
+    Tests for the read-only program serializer.
+    """
+
+    def setUp(self):
+        super(ProgramReadSerializerTests, self).setUp()
+        self.request = RequestFactory().get('/')
+        for i in range(2):
+            org = OrganizationFactory.create()
+            program = ProgramFactory.create(subtitle='', marketing_slug=u'sl\xfcg-{}'.format(i))
+            ProgramOrganizationFactory.create(program=program, organization=org)
+            for __ in range(2):
+                program_course_code = ProgramCourseCodeFactory.create(
+                    program=program, course_code=CourseCodeFactory.create(organization=org)
+                )
+                ProgramCourseRunModeFactory.create(
+                    program_course_code=program_course_code, course_key='edX/DemoX/Demo_Course', sku='sku'
+                )
+                ProgramCourseRunModeFactory.create(
+                    program_course_code=program_course_code, course_key='course-v1:edX+DemoX+2016', mode_slug='honor'
+                )
+        # a program without any nested data.
+        ProgramFactory.create()
+        self.program = program
+        self.program.banner_image = make_banner_image_file('test_banner.jpg')
+        self.program.save()
+
+    def _render(self, serializer_class, context):
+        """
+        Render all of the programs with the given serializer, and return the data and its JSON encoding.
+        """
+        programs = ProgramSerializer.setup_eager_loading(Program.objects.order_by('id'))
+        data = serializer_class(programs, many=True, context=context).data
+        return data, json.dumps(data, cls=JSONEncoder)
+
+    def test_parity(self):
+        """
+        Ensure that programs are rendered exactly as ProgramSerializer renders them, with or without a request.
+        """
+        ProgramDefaultFactory.create(banner_image=make_banner_image_file('default_banner.jpg'))
+        for context in ({'request': self.request}, {}):
+            data, encoded = self._render(ProgramReadSerializer, context)
+            expected_data, expected_encoded = self._render(ProgramSerializer, context)
+            self.assertEqual(data, expected_data)
+            self.assertEqual(encoded, expected_encoded)
+
+    def test_default_banner_read_once(self):
+        """
+        Ensure that the default banner image URLs are read once for a whole list of programs without their own.
+        """
+        programs = list(ProgramSerializer.setup_eager_loading(Program.objects.all()))
+        for serializer_class in (ProgramSerializer, ProgramReadSerializer):
+            with mock.patch.object(
+                ProgramDefault, 'get_banner_image_urls', wraps=ProgramDefault.get_banner_image_urls
+            ) as mock_get_urls:
+                serializer_class(  # pylint: disable=expression-not-assigned
+                    programs, many=True, context={'request': self.request}
+                ).data
+            self.assertEqual(mock_get_urls.call_count, 1)
+
+    @override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+    def test_queries(self):
+        """
+        Ensure that rendering prefetched programs runs no further queries, once the default banner image is cached.
+        """
+        cache.clear()
+        ProgramDefault.get_banner_image_urls()
+        programs = list(ProgramSerializer.setup_eager_loading(Program.objects.all()))
+        with self.assertNumQueries(0):
+            data = ProgramReadSerializer(programs, many=True, context={'request': self.request}).data
+        self.assertEqual(len(data), len(programs))
+
+
+class ProgramProjectionSerializerTests(ProgramReadSerializerTests):
+    """
+    Tests for rendering programs from projected column values.
+    """
+
+    def test_parity(self):
+        """
+        Ensure that projected programs are rendered exactly as ProgramSerializer renders them.
+        """
+        ProgramDefaultFactory.create(banner_image=make_banner_image_file('default_banner.jpg'))
+        for context in ({'request': self.request}, {}):
+            data = ProgramProjectionSerializer(
+                get_projection_queryset(Program.objects.order_by('id')), many=True, context=context
+            ).data
+            expected_data, expected_encoded = self._render(ProgramSerializer, context)
+            self.assertEqual(data, expected_data)
+            self.assertEqual(json.dumps(data, cls=JSONEncoder), expected_encoded)
+
+            program = get_projection_queryset(Program.objects.filter(id=self.program.id)).get()
+            self.assertEqual(ProgramProjectionSerializer(program, context=context).data, expected_data[-2])
+
+    @override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+    def test_queries(self):
+        """
+        Ensure that programs and their nested rows are read with one query each, once the default banner image
+        is cached.
+        """
+        cache.clear()
+        ProgramDefault.get_banner_image_urls()
+        with self.assertNumQueries(4):
+            ProgramProjectionSerializer(  # pylint: disable=expression-not-assigned
+                get_projection_queryset(Program.objects.all()), many=True, context={'request': self.request}
+            ).data
+
+
+class CourseCodeResolverTests(TestCase):
+    """
+    Tests for looking up the organizations and course codes referred to by nested data.
+    """
+
+    def setUp(self):
+        super(CourseCodeResolverTests, self).setUp()
+        self.org = OrganizationFactory.create(key='test-org')
+        self.course_code = CourseCodeFactory.create(organization=self.org, key='test-cc')
+
+    def test_loaded(self):
+        """
+        Ensure that the keys given up front are looked up together, and then resolved without queries.
+        """
+        with self.assertNumQueries(2):
+            resolver = CourseCodeResolver([{'key': 'test-cc', 'organization': {'key': 'test-org'}}])
+        with self.assertNumQueries(0):
+            self.assertEqual(resolver.get_organization('test-org'), self.org)
+            self.assertEqual(resolver.get_course_code(self.org, 'test-cc'), self.course_code)
+
+    def test_fallback(self):
+        """
+        Ensure that keys which miss in memory (e.g. ones the database matches despite differing in case) are looked
+        up in the database, once each.
+        """
+        resolver = CourseCodeResolver([])
+        with self.assertNumQueries(3):
+            self.assertEqual(resolver.get_organization('test-org'), self.org)
+            self.assertEqual(resolver.get_course_code(self.org, 'test-cc'), self.course_code)
+            self.assertIsNone(resolver.get_course_code(self.org, 'missing-cc'))
+        with self.assertNumQueries(0):
+            self.assertEqual(resolver.get_organization('test-org'), self.org)
+            self.assertEqual(resolver.get_course_code(self.org, 'test-cc').organization, self.org)
+            self.assertIsNone(resolver.get_course_code(self.org, 'missing-cc'))
+
+
+class ProgramCourseCodeSerializerTests(TestCase):
+    """
+    Tests for the nested program course code serializer.
+    """
+
+    def test_batch_write_programs(self):
+        """
+        Ensure that program course codes created for several programs at once are given their own ids.
+        """
+        org = OrganizationFactory.create()
+        course_code = CourseCodeFactory.create(organization=org)
+        programs = [ProgramFactory.create(), ProgramFactory.create()]
+        for program in programs:
+            ProgramOrganizationFactory.create(program=program, organization=org)
+        # offsets the positions of the new program course codes.
+        ProgramCourseCodeFactory.create(program=programs[0], course_code=CourseCodeFactory.create(organization=org))
+
+        written = ProgramCourseCodeSerializer().batch_write(
+            [{'program': program, 'course_code': course_code} for program in programs], []
+        )
+        self.assertEqual(
+            [(obj.id, obj.program, obj.position) for obj in written],
+            [(obj.id, obj.program, obj.position) for obj in ProgramCourseCode.objects.filter(course_code=course_code)]
+        )
@@ -0,0 +1,367 @@
+"""
+Performance benchmarks for Programs API views (v1).
+
+Query budgets are always checked, against small synthetic catalogs of two different sizes, so that any
+regression in the number of queries (including a query per row) fails the test suite.
+
+Latency and memory are only measured when requested, against catalogs of the given numbers of programs:
+
+    PROGRAMS_BENCHMARK_SCALES=10,1000,10000 ./manage.py test programs.apps.api.v1.tests.test_benchmarks \
+        --settings=programs.settings.test
+
+The benchmarks run against whichever database the settings configure (i.e. sqlite, or a local MySQL), and
+report the query count, p50 / p99 latency and peak memory of each scenario on stderr.  A scenario fails if
+it exceeds its query or p99 latency budget.  Other options, read from the environment:
+
+    PROGRAMS_BENCHMARK_REPEAT: the number of timed requests per scenario (default 50).
+    PROGRAMS_BENCHMARK_LATENCY_FACTOR: a multiplier for the latency budgets, for slower machines (default 1).
+    PROGRAMS_BENCHMARK_ORGANIZATIONS: the number of organizations in the catalog used to compare organization
+        filters (default 500).
+"""
+from __future__ import unicode_literals
+from collections import namedtuple
+import datetime
+import json
+import math
+import os
+import resource
+import sys
+import time
+from unittest import skipUnless
+
+from django.core.urlresolvers import reverse
+from django.db import connection
+from django.test import RequestFactory, TestCase
+from django.test.utils import CaptureQueriesContext
+import pytz
+from rest_framework.request import Request
+
+from programs.apps.api.documents import create_missing_documents
+from programs.apps.api.filters import ProgramOrgKeyFilterBackend
+from programs.apps.api.v1.tests.mixins import JwtMixin
+from programs.apps.core.tests.factories import UserFactory
+from programs.apps.programs import models
+from programs.apps.programs.constants import ProgramStatus
+from programs.apps.programs.tests.factories import (
+    CourseCodeFactory,
+    OrganizationFactory,
+    ProgramCourseCodeFactory,
+    ProgramCourseRunModeFactory,
+    ProgramFactory,
+    ProgramOrganizationFactory,
+)
+
+
+SCALES = [int(scale) for scale in os.environ.get('PROGRAMS_BENCHMARK_SCALES', '').split(',') if scale.strip()]
+REPEAT = int(os.environ.get('PROGRAMS_BENCHMARK_REPEAT', 50))
+ORGANIZATION_FILTER_ORGANIZATIONS = int(os.environ.get('PROGRAMS_BENCHMARK_ORGANIZATIONS', 500))
+LATENCY_FACTOR = float(os.environ.get('PROGRAMS_BENCHMARK_LATENCY_FACTOR', 1))
+
+# the shape of each synthetic program: most programs are active, and each is offered by one of a few
+# organizations, with several course codes, each having a few runs in a few modes.
+ORGANIZATIONS = 10
+UNPUBLISHED_EVERY = 10
+COURSE_CODES = 5
+RUNS = 2
+MODES = ('verified', 'honor')
+
+# Scenario budgets.  The query budgets must not depend on the size of the catalog.
+Scenario = namedtuple('Scenario', ['name', 'max_queries', 'max_p99_ms'])
+SCENARIOS = (
+    Scenario('programs-list', 11, 500),
+    Scenario('programs-retrieve', 8, 100),
+    Scenario('programs-list-status', 11, 500),
+    Scenario('programs-list-organization', 12, 500),
+    Scenario('programs-list-thin', 7, 250),
+    Scenario('programs-patch', 36, 250),
+    Scenario('organizations-list', 4, 100),
+    Scenario('course-codes-list', 4, 150),
+)
+
+Result = namedtuple('Result', ['queries', 'p50_ms', 'p99_ms', 'peak_rss_mb'])
+
+
+def build_catalog(size, organization_count=ORGANIZATIONS):
+    """
+    Create a synthetic catalog with the given number of programs, offered by up to the given number of
+    organizations, with the existing model factories.  Rows are written with bulk inserts, so that large
+    catalogs can be built in reasonable time.
+
+    Returns:
+        list of the programs, in the order of creation.
+    """
+    organizations = [
+        OrganizationFactory.create(key='bench-org-{}'.format(i)) for i in range(min(size, organization_count))
+    ]
+
+    models.Program.objects.bulk_create([
+        ProgramFactory.build(
+            name='bench-program-{}'.format(i),
+            status=ProgramStatus.UNPUBLISHED if i % UNPUBLISHED_EVERY == 0 else ProgramStatus.ACTIVE,
+        ) for i in range(size)
+    ])
+    # bulk_create does not set primary keys on every backend, so read the programs back.
+    programs = list(models.Program.objects.filter(name__startswith='bench-program-').order_by('id'))
+    # nor does it send signals, so the programs' document rows must be created here.
+    create_missing_documents()
+
+    program_organizations, course_codes, program_course_codes, run_modes = [], [], [], []
+    start_date = datetime.datetime(2016, 1, 1, tzinfo=pytz.UTC)
+    for i, program in enumerate(programs):
+        organization = organizations[i % len(organizations)]
+        program_organizations.append(ProgramOrganizationFactory.build(program=program, organization=organization))
+        for position in range(1, COURSE_CODES + 1):
+            course_code = CourseCodeFactory.build(organization=organization, key='BENCH{}X{}'.format(i, position))
+            course_codes.append(course_code)
+            program_course_code = ProgramCourseCodeFactory.build(
+                program=program, course_code=course_code, position=position
+            )
+            program_course_codes.append(program_course_code)
+            for run in range(RUNS):
+                for mode in MODES:
+                    run_modes.append(ProgramCourseRunModeFactory.build(
+                        program_course_code=program_course_code,
+                        course_key='course-v1:{}+{}+run{}'.format(organization.key, course_code.key, run),
+                        run_key='run{}'.format(run),
+                        mode_slug=mode,
+                        start_date=start_date,
+                    ))
+
+    # the factories assign primary keys to the other models, so the rows can refer to each other directly.
+    for model, instances in (
+            (models.ProgramOrganization, program_organizations),
+            (models.CourseCode, course_codes),
+            (models.ProgramCourseCode, program_course_codes),
+            (models.ProgramCourseRunMode, run_modes),
+    ):
+        model.objects.bulk_create(instances, batch_size=500)
+    return programs
+
+
+def percentile(values, percent):
+    """
+    Return the given percentile of the values, by the nearest-rank method.
+    """
+    values = sorted(values)
+    return values[max(0, int(math.ceil(percent / 100.0 * len(values))) - 1)]
+
+
+def time_calls(func, repeat):
+    """
+    Call the given function repeatedly, after one untimed call to warm up.
+
+    Returns:
+        tuple of the p50 and p99 durations, in milliseconds.
+    """
+    func()
+    durations = []
+    for __ in range(repeat):
+        start = time.time()
+        func()
+        durations.append(time.time() - start)
+    return percentile(durations, 50) * 1000, percentile(durations, 99) * 1000
+
+
+def explain(queryset):
+    """
+    Return the query plan of the given queryset, as reported by the database.
+    """
+    sql, params = queryset.query.sql_with_params()
+    prefix = 'EXPLAIN QUERY PLAN ' if connection.vendor == 'sqlite' else 'EXPLAIN '
+    with connection.cursor() as cursor:
+        cursor.execute(prefix + sql, params)
+        return [' '.join(unicode(value) for value in row) for row in cursor.fetchall()]
+
+
+def measure(request, repeat):
+    """
+    Make the given request repeatedly, after one untimed request to warm up (e.g. to build program documents).
+
+    Arguments:
+        request: callable making a request, and returning the response.
+        repeat: the number of timed requests.
+
+    Returns:
+        Result, with the greatest query count of any request.  Peak memory is the peak resident set size of
+        the process so far, as the standard library cannot measure the peak of a single request.
+    """
+    request()
+    query_counts, durations = [], []
+    for __ in range(repeat):
+        with CaptureQueriesContext(connection) as context:
+            start = time.time()
+            response = request()
+            durations.append(time.time() - start)
+        assert response.status_code == 200, response.content
+        query_counts.append(len(context))
+
+    # ru_maxrss is in kilobytes on Linux, and in bytes on OS X.
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    peak_rss_mb = peak_rss / 1024.0 ** (2 if sys.platform == 'darwin' else 1)
+    return Result(
+        queries=max(query_counts),
+        p50_ms=percentile(durations, 50) * 1000,
+        p99_ms=percentile(durations, 99) * 1000,
+        peak_rss_mb=peak_rss_mb,
+    )
+
+
+class BenchmarkMixin(JwtMixin):
+    """
+    Build the requests of each scenario against a synthetic catalog.
+    """
+
+    def _get_requests(self, programs):
+        """
+        Return a dict mapping scenario names to callables making their requests.
+        """
+        # tokens must outlive the slowest benchmark.
+        auth = 'JWT {0}'.format(self.generate_id_token(UserFactory(), admin=True, ttl=24 * 60 * 60))
+        program = programs[len(programs) // 2]
+        organization = models.Organization.objects.get(programorganization__program=program)
+
+        def get(url, **params):  # pylint: disable=missing-docstring
+            return lambda: self.client.get(url, params, HTTP_AUTHORIZATION=auth)
+
+        # each PATCH moves the start dates of the program's run modes back and forth, so that every request
+        # writes the same number of rows.
+        start_dates = ['2016-01-01T00:00:00Z', '2016-02-01T00:00:00Z']
+        patch_data = []
+        for start_date in start_dates:
+            course_codes = []
+            for program_course_code in program.programcoursecode_set.select_related('course_code'):
+                run_modes = [
+                    {'course_key': run_mode.course_key, 'mode_slug': run_mode.mode_slug, 'start_date': start_date}
+                    for run_mode in program_course_code.run_modes.all()
+                ]
+                course_codes.append({
+                    'key': program_course_code.course_code.key,
+                    'organization': {'key': organization.key},
+                    'run_modes': run_modes,
+                })
+            patch_data.append(json.dumps({'course_codes': course_codes}))
+        patch_count = []
+
+        def patch():  # pylint: disable=missing-docstring
+            patch_count.append(None)
+            return self.client.patch(
+                reverse('api:v1:programs-detail', kwargs={'pk': program.id}),
+                data=patch_data[len(patch_count) % 2],
+                HTTP_AUTHORIZATION=auth,
+                content_type='application/merge-patch+json',
+            )
+
+        return {
+            'programs-list': get(reverse('api:v1:programs-list')),
+            'programs-retrieve': get(reverse('api:v1:programs-detail', kwargs={'pk': program.id})),
+            'programs-list-status': get(reverse('api:v1:programs-list'), status=ProgramStatus.ACTIVE),
+            'programs-list-organization': get(reverse('api:v1:programs-list'), organization=organization.key),
+            'programs-list-thin': get(reverse('api:v1:programs-list'), fields='uuid,name,status,marketing_slug'),
+            'programs-patch': patch,
+            'organizations-list': get(reverse('api:v1:organizations-list')),
+            'course-codes-list': get(reverse('api:v1:course_codes-list')),
+        }
+
+
+class QueryBudgetTests(BenchmarkMixin, TestCase):
+    """
+    Ensure that the number of queries made by each scenario is within its budget, and does not grow
+    with the size of the catalog.
+    """
+
+    def test_query_budgets(self):
+        """
+        Compare the query counts of each scenario against catalogs of two sizes.
+        """
+        query_counts = {}
+        for size in (3, 30):
+            requests = self._get_requests(build_catalog(size))
+            for scenario in SCENARIOS:
+                query_counts.setdefault(scenario.name, []).append(measure(requests[scenario.name], 2).queries)
+            models.Program.objects.all().delete()
+            models.CourseCode.objects.all().delete()
+            models.Organization.objects.all().delete()
+
+        for scenario in SCENARIOS:
+            small, large = query_counts[scenario.name]
+            self.assertLessEqual(small, scenario.max_queries, scenario.name)
+            self.assertEqual(small, large, scenario.name)
+
+
+@skipUnless(SCALES, 'Set PROGRAMS_BENCHMARK_SCALES to run the API benchmarks.')
+class ApiBenchmarkTests(BenchmarkMixin, TestCase):
+    """
+    Measure each scenario against catalogs of the requested sizes.
+    """
+
+    def test_benchmarks(self):
+        """
+        Report the results of every scenario at every scale, then fail if any exceeded its budgets.
+        """
+        failures = []
+        report = ['', '{:<28} {:>8} {:>8} {:>10} {:>10} {:>10}'.format(
+            'scenario', 'programs', 'queries', 'p50 (ms)', 'p99 (ms)', 'peak (MB)'
+        )]
+        for size in sorted(SCALES):
+            requests = self._get_requests(build_catalog(size))
+            for scenario in SCENARIOS:
+                result = measure(requests[scenario.name], REPEAT)
+                report.append('{:<28} {:>8} {:>8} {:>10.1f} {:>10.1f} {:>10.1f}'.format(
+                    scenario.name, size, result.queries, result.p50_ms, result.p99_ms, result.peak_rss_mb
+                ))
+                if result.queries > scenario.max_queries:
+                    failures.append('{} ({} programs): {} queries, budget {}'.format(
+                        scenario.name, size, result.queries, scenario.max_queries
+                    ))
+                if result.p99_ms > scenario.max_p99_ms * LATENCY_FACTOR:
+                    failures.append('{} ({} programs): p99 {:.1f}ms, budget {:.1f}ms'.format(
+                        scenario.name, size, result.p99_ms, scenario.max_p99_ms * LATENCY_FACTOR
+                    ))
+            models.Program.objects.all().delete()
+            models.CourseCode.objects.all().delete()
+            models.Organization.objects.all().delete()
+
+        sys.stderr.write('\n'.join(report) + '\n')
+        self.assertEqual(failures, [])
+
+
+@skipUnless(SCALES, 'Set PROGRAMS_BENCHMARK_SCALES to run the API benchmarks.')
+class OrganizationFilterBenchmarkTests(TestCase):
+    """
+    Compare ways of filtering programs by organization key, against a catalog of the largest requested size.
+    """
+
+    def test_organization_filter(self):
+        """
+        Report the plan and timing of counting and reading a page of the programs of one organization.
+        """
+        size = max(SCALES)
+        programs = build_catalog(size, ORGANIZATION_FILTER_ORGANIZATIONS)
+        key = models.Organization.objects.get(programorganization__program=programs[0]).key
+        queryset = models.Program.objects.filter(status__in=[ProgramStatus.ACTIVE, ProgramStatus.RETIRED])
+        request = Request(RequestFactory().get('/', {ProgramOrgKeyFilterBackend.query_parameter: key}))
+
+        organization_id = models.Organization.objects.get(key=key).id
+        variants = (
+            ('join on key (previous)', lambda: queryset.filter(organizations__key=key)),
+            ('semi-join on id', lambda: queryset.filter(
+                id__in=models.ProgramOrganization.objects.filter(organization_id=organization_id).values('program_id')
+            )),
+            ('ProgramOrgKeyFilterBackend', lambda: ProgramOrgKeyFilterBackend().filter_queryset(
+                request, queryset, None
+            )),
+        )
+        report = ['', 'programs: {}, organizations: {}'.format(size, ORGANIZATION_FILTER_ORGANIZATIONS)]
+        results = []
+        for name, get_queryset in variants:
+            def count_and_read(get_queryset=get_queryset):  # pylint: disable=missing-docstring
+                filtered = get_queryset()
+                return filtered.count(), [program.id for program in filtered.order_by('id')[:20]]
+
+            results.append(count_and_read())
+            p50_ms, p99_ms = time_calls(count_and_read, REPEAT)
+            report.append('{}: p50 {:.1f}ms, p99 {:.1f}ms'.format(name, p50_ms, p99_ms))
+            report.extend('    ' + line for line in explain(get_queryset().order_by('id')[:20]))
+
+        sys.stderr.write('\n'.join(report) + '\n')
+        self.assertEqual(len(set(repr(result) for result in results)), 1)
@@ -4,14 +4,24 @@ Tests for Programs API views (v1).
 from __future__ import unicode_literals
 import datetime
 import json
+import re
 
 import ddt
+from django.core.cache import cache
 from django.core.urlresolvers import reverse
+from django.db import connection, IntegrityError
 from django.test import override_settings, TestCase
+from django.test.utils import CaptureQueriesContext
+import mock
 from mock import ANY
 import pytz
+from rest_framework.fields import DateTimeField
+from rest_framework.utils.encoders import JSONEncoder
 
+from programs.apps.api.filters import ProgramOrgKeyFilterBackend
+from programs.apps.api.serializers import CourseCodeResolver
 from programs.apps.api.v1.tests.mixins import AuthClientMixin, JwtMixin
+from programs.apps.api.v1.views import ProgramsViewSet
 from programs.apps.core.constants import Role
 from programs.apps.core.tests.factories import UserFactory
 from programs.apps.programs.constants import ProgramCategory, ProgramStatus
@@ -33,6 +43,17 @@ POST_FIELDS = ("name", "subtitle", "category", "status")
 CATEGORIES = (ProgramCategory.XSERIES, )
 STATUSES = (ProgramStatus.UNPUBLISHED, ProgramStatus.ACTIVE, ProgramStatus.RETIRED, ProgramStatus.DELETED)
 DRF_DATE_FORMAT = '%Y-%m-%dT%H:%M:%S.%fZ'
+LOCMEM_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+# some backends (e.g. sqlite) capture queries in a debug format, wrapping the SQL itself.
+CAPTURED_QUERY_PREFIX = re.compile(r'^QUERY = u?[\'"]')
+
+
+def get_statements(captured_queries, statement):
+    """
+    Return the SQL of the captured queries which are statements of the given kind (e.g. 'INSERT').
+    """
+    sqls = (CAPTURED_QUERY_PREFIX.sub('', query['sql'].lstrip()) for query in captured_queries)
+    return [sql for sql in sqls if sql.lstrip().upper().startswith(statement + ' ')]
 
 
 @ddt.ddt
@@ -164,6 +185,10 @@ class ProgramsViewTests(JwtMixin, TestCase):
             self.assertEqual(len(results), 1)
             self.assertEqual(results[0]['organizations'][0]['key'], org_key)
 
+        response = self._make_request(admin=True, data={'organization': 'unknown-org'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['results'], [])
+
     def test_create(self):
         """
         Ensure the API supports creation of Programs with a valid organization.
@@ -877,6 +902,269 @@ class ProgramsViewTests(JwtMixin, TestCase):
         self.assertIn("must be unique", response.data["name"][0])
 
 
+# documents are disabled, so that stale data can only be served from the response cache.
+@override_settings(CACHES=LOCMEM_CACHES, API_RESPONSE_CACHE_TIMEOUT=60 * 60, PROGRAM_DOCUMENTS_ENABLED=False)
+class ProgramsCacheTests(JwtMixin, TestCase):
+    """
+    Tests for caching of Program API responses.
+    """
+
+    def setUp(self):
+        super(ProgramsCacheTests, self).setUp()
+        cache.clear()
+        self.program = ProgramFactory.create(status=ProgramStatus.ACTIVE)
+        self.unpublished_program = ProgramFactory.create(status=ProgramStatus.UNPUBLISHED)
+
+    def _get(self, url, admin=False, **params):
+        """
+        DRY helper.
+        """
+        token = self.generate_id_token(UserFactory(), admin=admin)
+        response = self.client.get(url, params, HTTP_AUTHORIZATION='JWT {0}'.format(token))
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def _list_names(self, admin=False, **params):
+        """
+        Return the names of the programs listed by the API.
+        """
+        response = self._get(reverse('api:v1:programs-list'), admin=admin, **params)
+        return sorted(obj['name'] for obj in response.data['results'])
+
+    def test_list_cached(self):
+        """
+        Verify that list responses are served from the cache until catalog data changes.
+        """
+        self.assertEqual(self._list_names(), [self.program.name])
+
+        # bypass signals, so that the cached response is not invalidated.
+        Program.objects.filter(id=self.program.id).update(name='updated-name')
+        self.assertEqual(self._list_names(), [self.program.name])
+
+        self.program.refresh_from_db()
+        self.program.save()
+        self.assertEqual(self._list_names(), ['updated-name'])
+
+    def test_retrieve_cached(self):
+        """
+        Verify that detail responses are served from the cache until catalog data changes.
+        """
+        url = reverse('api:v1:programs-detail', kwargs={'pk': self.program.id})
+        self.assertEqual(self._get(url).data['organizations'], [])
+
+        # bypass signals, so that the cached response is not invalidated.
+        Program.objects.filter(id=self.program.id).update(name='updated-name')
+        self.assertEqual(self._get(url).data['name'], self.program.name)
+
+        org = OrganizationFactory.create()
+        ProgramOrganizationFactory.create(program=self.program, organization=org)
+        data = self._get(url).data
+        self.assertEqual(data['name'], 'updated-name')
+        self.assertEqual(data['organizations'], [{'key': org.key, 'display_name': org.display_name}])
+
+    def test_cached_by_role(self):
+        """
+        Verify that cached responses are never shared between roles.
+        """
+        self.assertEqual(self._list_names(), [self.program.name])
+        self.assertEqual(self._list_names(admin=True), sorted([self.program.name, self.unpublished_program.name]))
+        self.assertEqual(self._list_names(), [self.program.name])
+
+    def test_cached_by_query(self):
+        """
+        Verify that cached responses are never shared between different query strings.
+        """
+        self.assertEqual(self._list_names(admin=True), sorted([self.program.name, self.unpublished_program.name]))
+        self.assertEqual(
+            self._list_names(admin=True, status=ProgramStatus.UNPUBLISHED),
+            [self.unpublished_program.name]
+        )
+
+    def test_filters_not_run_on_hit(self):
+        """
+        Verify that the queries of filter backends (e.g. resolving an organization key) are not run for
+        responses served from the cache.
+        """
+        org = OrganizationFactory.create()
+        ProgramOrganizationFactory.create(program=self.program, organization=org)
+        get_organization_id = ProgramOrgKeyFilterBackend.get_organization_id
+        with mock.patch.object(
+            ProgramOrgKeyFilterBackend, 'get_organization_id', autospec=True, side_effect=get_organization_id
+        ) as mock_get_organization_id:
+            self.assertEqual(self._list_names(organization=org.key), [self.program.name])
+            self.assertTrue(mock_get_organization_id.called)
+
+            mock_get_organization_id.reset_mock()
+            self.assertEqual(self._list_names(organization=org.key), [self.program.name])
+            self.assertFalse(mock_get_organization_id.called)
+
+    @override_settings(API_RESPONSE_CACHE_TIMEOUT=0)
+    def test_cache_disabled(self):
+        """
+        Verify that response caching can be disabled.
+        """
+        self.assertEqual(self._list_names(), [self.program.name])
+        Program.objects.filter(id=self.program.id).update(name='updated-name')
+        self.assertEqual(self._list_names(), ['updated-name'])
+
+
+@ddt.ddt
+class ProgramsConditionalGetTests(JwtMixin, TestCase):
+    """
+    Tests for conditional GET support (ETag / Last-Modified) in the Programs API.
+    """
+
+    def setUp(self):
+        super(ProgramsConditionalGetTests, self).setUp()
+        self.org = OrganizationFactory.create()
+        self.program = ProgramFactory.create(status=ProgramStatus.ACTIVE)
+        ProgramOrganizationFactory.create(program=self.program, organization=self.org)
+        course_code = CourseCodeFactory.create(organization=self.org)
+        self.program_course_code = ProgramCourseCodeFactory.create(program=self.program, course_code=course_code)
+        self.run_mode = ProgramCourseRunModeFactory.create(
+            program_course_code=self.program_course_code,
+            course_key='edX/DemoX/Demo_Course',
+        )
+        self.detail_url = reverse('api:v1:programs-detail', kwargs={'pk': self.program.id})
+        self.list_url = reverse('api:v1:programs-list')
+
+    def _get(self, url, admin=False, **headers):
+        """
+        DRY helper.
+        """
+        token = self.generate_id_token(UserFactory(), admin=admin)
+        return self.client.get(url, HTTP_AUTHORIZATION='JWT {0}'.format(token), **headers)
+
+    def assert_not_modified(self, url, etag):
+        """
+        Ensure that a request bearing the given ETag receives an empty 304 response.
+        """
+        response = self._get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        self.assertEqual(response.content, b'')
+
+    def assert_modified(self, url, etag):
+        """
+        Ensure that a request bearing the given ETag receives a full response, and return its new ETag.
+        """
+        response = self._get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        return response['ETag']
+
+    @ddt.data('detail_url', 'list_url')
+    def test_if_none_match(self, url_attr):
+        """
+        Verify that a matching If-None-Match header results in a 304 response,
+        without invoking the serializer.
+        """
+        url = getattr(self, url_attr)
+        response = self._get(url)
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        self.assertIn('Last-Modified', response)
+
+        with mock.patch('programs.apps.api.serializers.ProgramSerializer.to_representation') as mock_repr:
+            self.assert_not_modified(url, etag)
+            self.assertFalse(mock_repr.called)
+
+        self.assert_modified(url, '"not-the-current-etag"')
+
+    @ddt.data('detail_url', 'list_url')
+    def test_etag_changes_with_nested_data(self, url_attr):
+        """
+        Verify that the ETag changes when nested data is modified or deleted.
+        """
+        url = getattr(self, url_attr)
+        etag = self._get(url)['ETag']
+
+        self.run_mode.start_date = self.run_mode.start_date - datetime.timedelta(days=1)
+        self.run_mode.save()
+        etag = self.assert_modified(url, etag)
+
+        self.org.display_name = 'updated-display-name'
+        self.org.save()
+        etag = self.assert_modified(url, etag)
+
+        self.run_mode.delete()
+        self.assert_modified(url, etag)
+
+    @ddt.data('detail_url', 'list_url')
+    def test_etag_changes_with_default_banner_urls(self, url_attr):
+        """
+        Verify that the ETag changes when the stored URLs of the default banner image change, which does not change
+        any modification time.
+        """
+        url = getattr(self, url_attr)
+        program_default = ProgramDefaultFactory.create()
+        program_default.banner_image = make_banner_image_file('default_banner.jpg')
+        program_default.save()
+        etag = self._get(url)['ETag']
+
+        type(program_default).objects.update(banner_image_resized_urls='')
+        self.assert_modified(url, etag)
+
+    def test_weak_etag(self):
+        """
+        Verify that a weakened copy of the current ETag (e.g. by a compressing proxy) still matches.
+        """
+        etag = self._get(self.detail_url)['ETag']
+        response = self._get(self.detail_url, HTTP_IF_NONE_MATCH='W/' + etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_list_etag_summarizes_page(self):
+        """
+        Verify that list ETags only depend on the requested page, and the total count it reports.
+        """
+        other = ProgramFactory.create(status=ProgramStatus.ACTIVE)
+        first_page_url = self.list_url + '?page_size=1'
+        etag = self._get(first_page_url)['ETag']
+
+        # the other program is rendered on the second page.
+        other.name = 'updated-name'
+        other.save()
+        self.assert_not_modified(first_page_url, etag)
+
+        ProgramFactory.create(status=ProgramStatus.ACTIVE)
+        self.assert_modified(first_page_url, etag)
+
+    def test_etag_varies_by_role(self):
+        """
+        Verify that ETags are not shared between roles, which may see different listings.
+        """
+        self.assertNotEqual(self._get(self.list_url)['ETag'], self._get(self.list_url, admin=True)['ETag'])
+
+    def test_if_modified_since(self):
+        """
+        Verify that a current If-Modified-Since header results in a 304 response.
+        """
+        last_modified = self._get(self.detail_url)['Last-Modified']
+
+        response = self._get(self.detail_url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 304)
+
+        response = self._get(self.detail_url, HTTP_IF_MODIFIED_SINCE='Thu, 01 Jan 2015 00:00:00 GMT')
+        self.assertEqual(response.status_code, 200)
+
+    @ddt.data(ProgramStatus.UNPUBLISHED, ProgramStatus.DELETED)
+    def test_not_found(self, status):
+        """
+        Verify that conditional requests for programs which are not visible still result in a 404.
+        """
+        self.program.status = status
+        self.program.save()
+        response = self._get(self.detail_url, HTTP_IF_NONE_MATCH='*')
+        self.assertEqual(response.status_code, 404)
+
+    def test_malformed_lookup(self):
+        """
+        Verify that requests for malformed ids still result in a 404.
+        """
+        response = self._get(self.list_url + 'not-an-id/')
+        self.assertEqual(response.status_code, 404)
+
+
 class OrganizationViewTests(AuthClientMixin, TestCase):
     """
     Tests for listing / creating Organizations.
@@ -969,3 +1257,823 @@ class CourseCodesViewTests(AuthClientMixin, TestCase):
             results = response.data['results']  # pylint: disable=no-member
             self.assertEqual(len(results), 1)
             self.assertEqual(results[0]['organization']['key'], org_key)
+
+
+@ddt.ddt
+class KeysetPaginationTests(JwtMixin, AuthClientMixin, TestCase):
+    """
+    Tests for opt-in keyset pagination of list views.
+    """
+
+    def setUp(self):
+        super(KeysetPaginationTests, self).setUp()
+        # organizations and course codes are only listed to members of the admin group.
+        self.admin_client = self.get_authenticated_client(Role.ADMINS)
+
+    def _get(self, url, params, client=None):
+        """
+        DRY helper.
+        """
+        token = self.generate_id_token(UserFactory(), admin=True)
+        response = (client or self.client).get(url, params, HTTP_AUTHORIZATION='JWT {0}'.format(token))
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def _walk(self, url, client=None, **params):
+        """
+        Follow the next links from the first cursor-paginated page, returning the results of every page.
+        """
+        params = dict(params, pagination='cursor')
+        pages = []
+        while url:
+            response = self._get(url, params, client=client)
+            self.assertEqual(set(response.data), {'next', 'results'})
+            pages.append(response.data['results'])
+            url, params = response.data['next'], {}
+        return pages
+
+    def test_walk_programs(self):
+        """
+        Verify that walking the programs list yields every visible program once, in modification order.
+        """
+        programs = [ProgramFactory.create(status=ProgramStatus.ACTIVE) for _ in range(5)]
+        ProgramFactory.create(status=ProgramStatus.DELETED)
+        # move the first program to the end of the ordering.
+        programs[0].save()
+        programs.append(programs.pop(0))
+
+        pages = self._walk(reverse('api:v1:programs-list'), page_size=2)
+        self.assertEqual([len(page) for page in pages], [2, 2, 1])
+        self.assertEqual([obj['id'] for page in pages for obj in page], [program.id for program in programs])
+
+    def test_modified_ties(self):
+        """
+        Verify that rows sharing a modification time are neither skipped nor repeated.
+        """
+        programs = [ProgramFactory.create(status=ProgramStatus.ACTIVE) for _ in range(3)]
+        Program.objects.update(modified=datetime.datetime(2016, 1, 1, tzinfo=pytz.UTC))
+
+        pages = self._walk(reverse('api:v1:programs-list'), page_size=1)
+        self.assertEqual([obj['id'] for page in pages for obj in page], [program.id for program in programs])
+
+    def test_filters(self):
+        """
+        Verify that cursors preserve the filters of the first page.
+        """
+        org = OrganizationFactory.create(key='org1')
+        programs = [ProgramFactory.create(status=ProgramStatus.ACTIVE) for _ in range(3)]
+        for program in programs[1:]:
+            ProgramOrganizationFactory.create(organization=org, program=program)
+
+        pages = self._walk(reverse('api:v1:programs-list'), page_size=1, organization='org1')
+        self.assertEqual([obj['id'] for page in pages for obj in page], [program.id for program in programs[1:]])
+
+    def test_no_count(self):
+        """
+        Verify that no count query is run.
+        """
+        for _ in range(3):
+            ProgramFactory.create(status=ProgramStatus.ACTIVE)
+        url = reverse('api:v1:programs-list')
+        token = self.generate_id_token(UserFactory(), admin=True)
+        self.client.get(url, HTTP_AUTHORIZATION='JWT {0}'.format(token))  # provision the user.
+
+        with CaptureQueriesContext(connection) as context:
+            response = self._get(url, {'pagination': 'cursor', 'page_size': 2})
+        self.assertIsNotNone(response.data['next'])
+        self.assertFalse([query for query in context.captured_queries if 'COUNT(' in query['sql'].upper()])
+
+    @ddt.data('not-base64!', 'e30=', 'WzFd')
+    def test_invalid_cursor(self, cursor):
+        """
+        Verify that malformed cursors are rejected with a 404, as with invalid page numbers.
+        """
+        token = self.generate_id_token(UserFactory(), admin=True)
+        response = self.client.get(
+            reverse('api:v1:programs-list'), {'cursor': cursor}, HTTP_AUTHORIZATION='JWT {0}'.format(token)
+        )
+        self.assertEqual(response.status_code, 404)
+
+    def test_default_pagination(self):
+        """
+        Verify that page number pagination remains the default.
+        """
+        ProgramFactory.create(status=ProgramStatus.ACTIVE)
+        response = self._get(reverse('api:v1:programs-list'), {})
+        self.assertEqual(response.data['count'], 1)
+        self.assertEqual(response.data['num_pages'], 1)
+
+    def test_walk_organizations(self):
+        """
+        Verify that organizations are walked in key order.
+        """
+        for key in ('b', 'd', 'a', 'c'):
+            OrganizationFactory.create(key=key)
+
+        pages = self._walk(reverse('api:v1:organizations-list'), client=self.admin_client, page_size=3)
+        self.assertEqual([[obj['key'] for obj in page] for page in pages], [['a', 'b', 'c'], ['d']])
+
+    def test_walk_course_codes(self):
+        """
+        Verify that course codes are walked in modification order.
+        """
+        org = OrganizationFactory.create()
+        course_codes = [CourseCodeFactory.create(organization=org) for _ in range(3)]
+
+        pages = self._walk(reverse('api:v1:course_codes-list'), client=self.admin_client, page_size=2)
+        self.assertEqual([obj['key'] for page in pages for obj in page], [code.key for code in course_codes])
+
+    def test_no_validators(self):
+        """
+        Verify that cursor-paginated lists are not summarized for conditional GET.
+        """
+        ProgramFactory.create(status=ProgramStatus.ACTIVE)
+        response = self._get(reverse('api:v1:programs-list'), {'pagination': 'cursor'})
+        self.assertNotIn('ETag', response)
+
+
+class ProgramsExportTests(JwtMixin, TestCase):
+    """
+    Tests for the streaming export of programs.
+    """
+
+    def _export(self, admin=False, **params):
+        """
+        Return the programs exported by the API.
+        """
+        token = self.generate_id_token(UserFactory(), admin=admin)
+        response = self.client.get(
+            reverse('api:v1:programs-export'), params, HTTP_AUTHORIZATION='JWT {0}'.format(token)
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        content = b''.join(response.streaming_content).decode('utf-8')
+        self.assertTrue(content == '' or content.endswith('\n'))
+        return [json.loads(line) for line in content.splitlines()]
+
+    def test_export(self):
+        """
+        Verify that the export matches the list representation of each program.
+        """
+        org = OrganizationFactory.create()
+        program = ProgramFactory.create(status=ProgramStatus.ACTIVE)
+        ProgramOrganizationFactory.create(program=program, organization=org)
+        program_course_code = ProgramCourseCodeFactory.create(
+            program=program, course_code=CourseCodeFactory.create(organization=org)
+        )
+        ProgramCourseRunModeFactory.create(program_course_code=program_course_code, course_key='edX/DemoX/Demo_Course')
+
+        token = self.generate_id_token(UserFactory())
+        listed = self.client.get(
+            reverse('api:v1:programs-list'), HTTP_AUTHORIZATION='JWT {0}'.format(token)
+        ).data['results']
+        self.assertEqual(self._export(), json.loads(json.dumps(listed, cls=JSONEncoder)))
+
+    def test_role_and_filters(self):
+        """
+        Verify that the export includes only the programs the list would include.
+        """
+        programs = {status: ProgramFactory.create(status=status) for status in STATUSES}
+
+        self.assertEqual(
+            [obj['id'] for obj in self._export()],
+            [programs[ProgramStatus.ACTIVE].id, programs[ProgramStatus.RETIRED].id],
+        )
+        self.assertEqual(
+            [obj['id'] for obj in self._export(admin=True, status=ProgramStatus.UNPUBLISHED)],
+            [programs[ProgramStatus.UNPUBLISHED].id],
+        )
+
+    def test_chunks(self):
+        """
+        Verify that programs are read in chunks, each with a constant number of queries.
+        """
+        org = OrganizationFactory.create()
+        programs = [ProgramFactory.create(status=ProgramStatus.ACTIVE) for _ in range(5)]
+        for program in programs:
+            ProgramOrganizationFactory.create(program=program, organization=org)
+            ProgramCourseCodeFactory.create(program=program, course_code=CourseCodeFactory.create(organization=org))
+
+        with override_settings(CACHES=LOCMEM_CACHES), mock.patch.object(ProgramsViewSet, 'export_chunk_size', 2):
+            cache.clear()
+            self._export()  # provision the user and warm the default banner image cache.
+            with CaptureQueriesContext(connection) as context:
+                exported = self._export()
+
+        self.assertEqual([obj['id'] for obj in exported], [program.id for program in programs])
+        # 3 chunks of programs, read along with their documents, and an empty one.
+        program_queries = [query for query in context.captured_queries if 'programs_' in query['sql']]
+        self.assertEqual(len(program_queries), 4)
+
+    def test_empty(self):
+        """
+        Verify that an empty catalog exports nothing.
+        """
+        self.assertEqual(self._export(), [])
+
+
+@ddt.ddt
+class ProgramsChangesTests(JwtMixin, TestCase):
+    """
+    Tests for the modified_since filter and the changes feed of programs.
+    """
+
+    def setUp(self):
+        super(ProgramsChangesTests, self).setUp()
+        self.org = OrganizationFactory.create()
+        self.programs = []
+        for _ in range(3):
+            program = ProgramFactory.create(status=ProgramStatus.ACTIVE)
+            ProgramOrganizationFactory.create(program=program, organization=self.org)
+            ProgramCourseCodeFactory.create(
+                program=program, course_code=CourseCodeFactory.create(organization=self.org)
+            )
+            self.programs.append(program)
+
+        # backdate everything, so that changes made by tests can be told apart.
+        self.since = datetime.datetime(2016, 1, 1, tzinfo=pytz.UTC)
+        old = self.since - datetime.timedelta(days=1)
+        for model in (Program, ProgramCourseCode, CourseCode, ProgramCourseRunMode):
+            model.objects.update(modified=old)
+        for program in self.programs:
+            program.programorganization_set.update(modified=old)
+        self.org.__class__.objects.update(modified=old)
+
+    def _get(self, url, admin=False, **params):
+        """
+        DRY helper.
+        """
+        token = self.generate_id_token(UserFactory(), admin=admin)
+        return self.client.get(url, params, HTTP_AUTHORIZATION='JWT {0}'.format(token))
+
+    def _changed_ids(self, **params):
+        """
+        Return the IDs of the programs listed as changed since setUp.
+        """
+        response = self._get(reverse('api:v1:programs-list'), modified_since=self.since.isoformat(), **params)
+        self.assertEqual(response.status_code, 200)
+        return sorted(obj['id'] for obj in response.data['results'])
+
+    def test_unchanged(self):
+        """
+        Verify that nothing is listed when nothing has changed.
+        """
+        self.assertEqual(self._changed_ids(), [])
+
+    def test_program_changed(self):
+        """
+        Verify that changes to the program itself are detected.
+        """
+        self.programs[0].save()
+        self.assertEqual(self._changed_ids(), [self.programs[0].id])
+
+    def test_nested_changed(self):
+        """
+        Verify that changes to nested rows are detected, and each program is listed once.
+        """
+        self.programs[0].programorganization_set.get().save()
+        program_course_code = self.programs[1].programcoursecode_set.get()
+        program_course_code.course_code.save()
+        ProgramCourseRunModeFactory.create(program_course_code=program_course_code, course_key='edX/DemoX/Demo_Course')
+        ProgramCourseRunModeFactory.create(program_course_code=program_course_code, course_key='edX/DemoX/Demo_Course2')
+        self.assertEqual(self._changed_ids(), [self.programs[0].id, self.programs[1].id])
+
+    def test_shared_organization_changed(self):
+        """
+        Verify that changes to an organization are detected for every program linked to it.
+        """
+        self.org.save()
+        self.assertEqual(self._changed_ids(), sorted(program.id for program in self.programs))
+
+    def test_naive_timestamp(self):
+        """
+        Verify that timestamps without an offset are taken to be UTC.
+        """
+        self.programs[0].save()
+        response = self._get(reverse('api:v1:programs-list'), modified_since='2016-01-01T00:00:00')
+        self.assertEqual([obj['id'] for obj in response.data['results']], [self.programs[0].id])
+
+    @ddt.data('yesterday', '2016-13-01T00:00:00')
+    def test_invalid_timestamp(self, value):
+        """
+        Verify that invalid timestamps are rejected with a 400.
+        """
+        response = self._get(reverse('api:v1:programs-list'), modified_since=value)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('modified_since', response.data)
+
+    def test_changes(self):
+        """
+        Verify that the feed returns changed programs, tombstones for those deleted, and the timestamp to start
+        from next.
+        """
+        self.programs[0].save()
+        self.programs[1].status = ProgramStatus.DELETED
+        self.programs[1].save()
+        self.programs[2].status = ProgramStatus.UNPUBLISHED
+        self.programs[2].save()
+
+        before = datetime.datetime.now(pytz.UTC)
+        response = self._get(reverse('api:v1:programs-changes'), modified_since=self.since.isoformat())
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([obj['id'] for obj in response.data['results']], [self.programs[0].id])
+        # unpublished programs are not revealed to learners, even as tombstones.
+        self.assertEqual(
+            [(obj['id'], obj['uuid']) for obj in response.data['deleted']],
+            [(self.programs[1].id, self.programs[1].uuid)],
+        )
+        until = datetime.datetime.strptime(response.data['until'], DRF_DATE_FORMAT).replace(tzinfo=pytz.UTC)
+        self.assertGreaterEqual(until, before)
+        self.assertIsNone(response.data['deleted_after'])
+
+        response = self._get(reverse('api:v1:programs-changes'), admin=True, modified_since=self.since.isoformat())
+        self.assertEqual(
+            [obj['id'] for obj in response.data['results']], [self.programs[0].id, self.programs[2].id]
+        )
+        self.assertEqual([obj['id'] for obj in response.data['deleted']], [self.programs[1].id])
+
+        # nothing has changed since the returned timestamp.
+        response = self._get(reverse('api:v1:programs-changes'), modified_since=response.data['until'])
+        self.assertEqual((response.data['results'], response.data['deleted']), ([], []))
+
+    def test_changes_deleted_bounded(self):
+        """
+        Verify that the tombstones listed at once are bounded, even when they share a modification time, and that
+        the next request continues after the last one listed.
+        """
+        for program in self.programs:
+            program.status = ProgramStatus.DELETED
+            program.save()
+        tied = self.programs[2].modified
+        Program.objects.filter(id=self.programs[1].id).update(modified=tied)
+
+        def get_deleted(modified_since, **params):
+            """Return the IDs of the tombstones listed, and the position to continue from next."""
+            response = self._get(reverse('api:v1:programs-changes'), modified_since=modified_since, **params)
+            self.assertEqual(response.status_code, 200)
+            deleted = [obj['id'] for obj in response.data['deleted']]
+            return deleted, response.data['until'], response.data['deleted_after']
+
+        with mock.patch.object(ProgramsViewSet, 'changes_max_deleted', 1):
+            deleted, until, deleted_after = get_deleted(self.since.isoformat())
+            self.assertEqual(deleted, [self.programs[0].id])
+            self.assertEqual(until, DateTimeField().to_representation(self.programs[0].modified))
+            self.assertEqual(deleted_after, self.programs[0].id)
+
+            # the tombstones modified at the same time are listed one at a time.
+            deleted, until, deleted_after = get_deleted(until, deleted_after=deleted_after)
+            self.assertEqual(deleted, [self.programs[1].id])
+            self.assertEqual(until, DateTimeField().to_representation(tied))
+            self.assertEqual(deleted_after, self.programs[1].id)
+
+            deleted, until, deleted_after = get_deleted(until, deleted_after=deleted_after)
+            self.assertEqual(deleted, [self.programs[2].id])
+            self.assertIsNone(deleted_after)
+            self.assertEqual(get_deleted(until)[0], [])
+
+    def test_changes_invalid_deleted_after(self):
+        """
+        Verify that a tombstone position which is not an ID is rejected with a 400.
+        """
+        response = self._get(
+            reverse('api:v1:programs-changes'), modified_since=self.since.isoformat(), deleted_after='last'
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('deleted_after', response.data)
+
+    def test_changes_requires_timestamp(self):
+        """
+        Verify that the feed requires a modified_since timestamp.
+        """
+        response = self._get(reverse('api:v1:programs-changes'))
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('modified_since', response.data)
+
+
+class ProgramsBatchWriteTests(JwtMixin, TestCase):
+    """
+    Tests for batched reconciliation of nested course codes and run modes.
+    """
+
+    def setUp(self):
+        super(ProgramsBatchWriteTests, self).setUp()
+        self.org = OrganizationFactory.create(key='test-org')
+        self.program = ProgramFactory.create()
+        ProgramOrganizationFactory.create(program=self.program, organization=self.org)
+        self.program_course_codes = []
+        for i in range(3):
+            course_code = CourseCodeFactory.create(organization=self.org, key='cc-{}'.format(i))
+            program_course_code = ProgramCourseCodeFactory.create(program=self.program, course_code=course_code)
+            for j in range(2):
+                ProgramCourseRunModeFactory.create(
+                    program_course_code=program_course_code,
+                    course_key='course-v1:test-org+cc-{}+run-{}'.format(i, j),
+                    start_date=datetime.datetime(2016, 1, 1, tzinfo=pytz.UTC),
+                )
+            self.program_course_codes.append(program_course_code)
+        self.new_course_code = CourseCodeFactory.create(organization=self.org, key='cc-3')
+
+    def _patch(self, data):
+        """
+        DRY helper.
+        """
+        token = self.generate_id_token(UserFactory(), admin=True)
+        return self.client.patch(
+            reverse('api:v1:programs-detail', kwargs={'pk': self.program.id}),
+            data=json.dumps(data),
+            HTTP_AUTHORIZATION='JWT {0}'.format(token),
+            content_type='application/merge-patch+json',
+        )
+
+    @staticmethod
+    def _course_code(key, run_modes=None):
+        """
+        Build the request data for a course code, with run modes given as (run, start date) tuples.
+        """
+        data = {'key': key, 'organization': {'key': 'test-org'}}
+        if run_modes is not None:
+            data['run_modes'] = [
+                {
+                    'course_key': 'course-v1:test-org+{}+{}'.format(key, run),
+                    'mode_slug': 'verified',
+                    'start_date': start_date,
+                } for run, start_date in run_modes
+            ]
+        return data
+
+    def test_reconcile(self):
+        """
+        Ensure that creations, updates and deletions of course codes and run modes are each written
+        with a constant number of statements, and that unchanged rows are not written at all.
+        """
+        unchanged = ProgramCourseRunMode.objects.get(course_key='course-v1:test-org+cc-0+run-0')
+        patch_data = {
+            'course_codes': [
+                self._course_code('cc-0', [
+                    ('run-0', '2016-01-01T00:00:00Z'),
+                    ('run-1', '2016-02-01T00:00:00Z'),
+                    ('run-2', '2016-03-01T00:00:00Z'),
+                ]),
+                self._course_code('cc-2'),
+                self._course_code('cc-3', [('run-0', '2016-04-01T00:00:00Z'), ('run-1', '2016-04-01T00:00:00Z')]),
+            ],
+        }
+        token = self.generate_id_token(UserFactory(), admin=True)
+        self.client.get(reverse('api:v1:programs-list'), HTTP_AUTHORIZATION='JWT {0}'.format(token))
+
+        with CaptureQueriesContext(connection) as context:
+            response = self._patch(patch_data)
+        self.assertEqual(response.status_code, 200)
+
+        def count(statement, table):
+            """Count the captured statements of the given kind on the given table."""
+            return len([
+                sql for sql in get_statements(context.captured_queries, statement) if table in sql.split('WHERE')[0]
+            ])
+
+        self.assertEqual(count('INSERT', 'programs_programcoursecode'), 1)
+        self.assertEqual(count('INSERT', 'programs_programcourserunmode'), 1)
+        self.assertEqual(count('UPDATE', 'programs_programcourserunmode'), 1)
+        self.assertEqual(count('DELETE', 'programs_programcoursecode'), 1)
+
+        run_modes = ProgramCourseRunMode.objects.filter(program_course_code__program=self.program)
+        self.assertEqual(
+            sorted((run_mode.course_key, run_mode.start_date.month, run_mode.run_key) for run_mode in run_modes),
+            [
+                ('course-v1:test-org+cc-0+run-0', 1, 'run-0'),
+                ('course-v1:test-org+cc-0+run-1', 2, 'run-1'),
+                ('course-v1:test-org+cc-0+run-2', 3, 'run-2'),
+                ('course-v1:test-org+cc-2+run-0', 1, 'run-0'),
+                ('course-v1:test-org+cc-2+run-1', 1, 'run-1'),
+                ('course-v1:test-org+cc-3+run-0', 4, 'run-0'),
+                ('course-v1:test-org+cc-3+run-1', 4, 'run-1'),
+            ]
+        )
+        self.assertEqual(ProgramCourseRunMode.objects.get(id=unchanged.id).modified, unchanged.modified)
+        self.assertEqual(
+            list(ProgramCourseCode.objects.filter(program=self.program).values_list('course_code__key', 'position')),
+            [('cc-0', 1), ('cc-2', 3), ('cc-3', 4)],
+        )
+
+        # the response, rendered after the nested writes, reflects them.
+        self.assertEqual(
+            [(cc['key'], len(cc['run_modes'])) for cc in response.data['course_codes']],
+            [('cc-0', 3), ('cc-2', 2), ('cc-3', 2)],
+        )
+
+    def test_invalid_run_mode_rolled_back(self):
+        """
+        Ensure that an invalid run mode rejects the whole request, without writing anything.
+        """
+        patch_data = {
+            'name': 'changed',
+            'course_codes': [
+                self._course_code('cc-0', [('run-0', '2016-01-01T00:00:00Z')]),
+                self._course_code('cc-3', [('run-0', '2016-01-01T00:00:00Z')]),
+            ],
+        }
+        patch_data['course_codes'][1]['run_modes'][0]['course_key'] = 'not-a-course-key'
+
+        response = self._patch(patch_data)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Program.objects.get(id=self.program.id).name, self.program.name)
+        self.assertEqual(ProgramCourseCode.objects.filter(program=self.program).count(), 3)
+        self.assertEqual(ProgramCourseRunMode.objects.filter(program_course_code__program=self.program).count(), 6)
+
+    def test_course_code_lookups(self):
+        """
+        Ensure that the course codes and organizations referred to by nested data are looked up with a
+        constant number of queries, and that unchanged course codes are not written.
+        """
+        keys = ['cc-0', 'cc-1', 'cc-2', 'cc-3']
+        with CaptureQueriesContext(connection) as context:
+            response = self._patch({'course_codes': [self._course_code(key) for key in keys]})
+        self.assertEqual(response.status_code, 200)
+
+        # i.e. queries filtering course codes or organizations by their keys.
+        key_lookups = [
+            sql for sql in get_statements(context.captured_queries, 'SELECT')
+            if re.search(r'\Wkey\W', sql.partition('WHERE')[2])
+        ]
+        self.assertEqual(len(key_lookups), 2)
+        self.assertEqual(CourseCode.objects.get(key='cc-1').modified, self.program_course_codes[1].course_code.modified)
+
+        response = self._patch({'course_codes': [dict(self._course_code('cc-0'), display_name='changed')]})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(CourseCode.objects.get(key='cc-0').display_name, 'changed')
+
+    def test_course_code_conflict(self):
+        """
+        Ensure that a course code which cannot be created because it conflicts with an existing one (e.g. one
+        created concurrently) is rejected as invalid, without writing anything.
+        """
+        with mock.patch.object(CourseCodeResolver, 'get_course_code', return_value=None):
+            response = self._patch({'name': 'changed', 'course_codes': [self._course_code('cc-0')]})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Program.objects.get(id=self.program.id).name, self.program.name)
+        self.assertEqual(CourseCode.objects.filter(key='cc-0').count(), 1)
+
+
+class ProgramsBulkWriteTests(JwtMixin, TestCase):
+    """
+    Tests for creating and updating programs in bulk.
+    """
+
+    def setUp(self):
+        super(ProgramsBulkWriteTests, self).setUp()
+        self.org = OrganizationFactory.create(key='test-org')
+        self.program = ProgramFactory.create(name='existing')
+        ProgramOrganizationFactory.create(program=self.program, organization=self.org)
+        self.course_code = CourseCodeFactory.create(organization=self.org, key='cc-0')
+
+    def _post(self, data, admin=True):
+        """
+        DRY helper.
+        """
+        token = self.generate_id_token(UserFactory(), admin=admin)
+        return self.client.post(
+            reverse('api:v1:programs-bulk'),
+            data=json.dumps(data),
+            HTTP_AUTHORIZATION='JWT {0}'.format(token),
+            content_type='application/json',
+        )
+
+    @staticmethod
+    def _new_program(name):
+        """
+        Build the request data for a new program.
+        """
+        return {
+            'name': name,
+            'subtitle': 'subtitle',
+            'category': ProgramCategory.XSERIES,
+            'status': ProgramStatus.UNPUBLISHED,
+            'organizations': [{'key': 'test-org'}],
+        }
+
+    def test_bulk(self):
+        """
+        Ensure that programs are created and patched, with per-item results in order.
+        """
+        patch = {
+            'uuid': str(self.program.uuid),
+            'subtitle': 'patched',
+            'course_codes': [{'key': 'cc-0', 'organization': {'key': 'test-org'}}],
+        }
+        response = self._post([self._new_program('first'), patch, self._new_program('second')])
+        self.assertEqual(response.status_code, 200)
+
+        first, second = Program.objects.get(name='first'), Program.objects.get(name='second')
+        self.assertEqual(
+            [(result['id'], str(result['uuid']), result['status']) for result in response.data],
+            [
+                (first.id, str(first.uuid), 201),
+                (self.program.id, str(self.program.uuid), 200),
+                (second.id, str(second.uuid), 201),
+            ]
+        )
+        self.assertEqual(first.programorganization_set.get().organization, self.org)
+        program = Program.objects.get(id=self.program.id)
+        self.assertEqual((program.name, program.subtitle), ('existing', 'patched'))
+        self.assertEqual(list(program.programcoursecode_set.values_list('course_code__key', flat=True)), ['cc-0'])
+
+    def test_organization_lookups(self):
+        """
+        Ensure that the organizations of every item are looked up with a single query.
+        """
+        OrganizationFactory.create(key='other-org')
+        items = [self._new_program('first'), self._new_program('second'), self._new_program('third')]
+        items[1]['organizations'] = [{'key': 'other-org'}]
+        with CaptureQueriesContext(connection) as context:
+            response = self._post(items)
+        self.assertEqual(response.status_code, 200)
+
+        organization_lookups = [
+            sql for sql in get_statements(context.captured_queries, 'SELECT')
+            if '"programs_organization"."key"' in sql.partition('WHERE')[2]
+        ]
+        self.assertEqual(len(organization_lookups), 1)
+        self.assertEqual(Program.objects.get(name='second').organizations.get().key, 'other-org')
+
+    def test_all_or_nothing(self):
+        """
+        Ensure that nothing is written if any item is invalid, and that errors are reported per item.
+        """
+        response = self._post([
+            self._new_program('first'),
+            {'uuid': str(self.program.uuid), 'subtitle': 'patched'},
+            {'uuid': '00000000-0000-0000-0000-000000000000', 'subtitle': 'patched'},
+            dict(self._new_program('second'), category='invalid'),
+        ])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual([sorted(errors) for errors in response.data], [[], [], ['uuid'], ['category']])
+        self.assertFalse(Program.objects.filter(name__in=['first', 'second']).exists())
+        self.assertEqual(Program.objects.get(id=self.program.id).subtitle, self.program.subtitle)
+
+    def test_duplicates(self):
+        """
+        Ensure that items repeating the UUID or name of an earlier item in the batch are rejected.
+        """
+        response = self._post([
+            self._new_program('first'),
+            {'uuid': str(self.program.uuid), 'subtitle': 'patched'},
+            self._new_program('FIRST'),
+            {'uuid': str(self.program.uuid).upper(), 'subtitle': 'patched again'},
+        ])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual([sorted(errors) for errors in response.data], [[], [], ['name'], ['uuid']])
+        self.assertFalse(Program.objects.filter(name='first').exists())
+        self.assertEqual(Program.objects.get(id=self.program.id).subtitle, self.program.subtitle)
+
+    def test_conflict(self):
+        """
+        Ensure that conflicts only detected by the database (e.g. with a concurrent write) are reported per item, and
+        roll back the batch.
+        """
+        with mock.patch(
+            'programs.apps.api.serializers.ProgramSerializer.update', side_effect=IntegrityError
+        ):
+            response = self._post([self._new_program('first'), {'uuid': str(self.program.uuid), 'name': 'renamed'}])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual([sorted(errors) for errors in response.data], [[], ['non_field_errors']])
+        self.assertFalse(Program.objects.filter(name='first').exists())
+
+    def test_invalid_payload(self):
+        """
+        Ensure that anything other than a bounded list of programs is rejected.
+        """
+        self.assertEqual(self._post({'name': 'not a list'}).status_code, 400)
+        self.assertEqual(self._post(['not a program']).status_code, 400)
+        with mock.patch.object(ProgramsViewSet, 'bulk_max_size', 1):
+            self.assertEqual(self._post([self._new_program('first'), self._new_program('second')]).status_code, 400)
+
+    def test_admin_only(self):
+        """
+        Ensure that only admins may write programs in bulk.
+        """
+        self.assertEqual(self._post([self._new_program('first')], admin=False).status_code, 403)
+
+
+class ProgramsProjectionTests(JwtMixin, TestCase):
+    """
+    Tests for program lists rendered from projected column values.
+    """
+
+    def setUp(self):
+        super(ProgramsProjectionTests, self).setUp()
+        self.org = OrganizationFactory.create()
+        for _ in range(3):
+            program = ProgramFactory.create(status=ProgramStatus.ACTIVE)
+            ProgramOrganizationFactory.create(program=program, organization=self.org)
+            program_course_code = ProgramCourseCodeFactory.create(
+                program=program, course_code=CourseCodeFactory.create(organization=self.org)
+            )
+            ProgramCourseRunModeFactory.create(
+                program_course_code=program_course_code, course_key='edX/DemoX/Demo_Course'
+            )
+        ProgramFactory.create(status=ProgramStatus.DELETED)
+
+    def _get(self, **params):
+        """
+        DRY helper.
+        """
+        token = self.generate_id_token(UserFactory())
+        response = self.client.get(
+            reverse('api:v1:programs-list'), params, HTTP_AUTHORIZATION='JWT {0}'.format(token)
+        )
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_list(self):
+        """
+        Verify that projected lists have the same content as other lists.
+        """
+        self.assertEqual(self._get(projection='values').data, self._get().data)
+        self.assertEqual(
+            self._get(projection='values', pagination='cursor', page_size=2).data['results'],
+            self._get(pagination='cursor', page_size=2).data['results'],
+        )
+
+    @override_settings(PROGRAM_DOCUMENTS_ENABLED=False)
+    def test_live_rendering(self):
+        """
+        Verify that projected lists have the same content as lists rendered from model instances.
+        """
+        self.assertEqual(self._get(projection='values').data, self._get().data)
+
+
+@ddt.ddt
+class ProgramsSparseFieldsetTests(JwtMixin, TestCase):
+    """
+    Tests for selecting the fields rendered by the Programs API.
+    """
+
+    def setUp(self):
+        super(ProgramsSparseFieldsetTests, self).setUp()
+        org = OrganizationFactory.create()
+        self.program = ProgramFactory.create(status=ProgramStatus.ACTIVE)
+        ProgramOrganizationFactory.create(program=self.program, organization=org)
+        program_course_code = ProgramCourseCodeFactory.create(
+            program=self.program, course_code=CourseCodeFactory.create(organization=org)
+        )
+        ProgramCourseRunModeFactory.create(program_course_code=program_course_code, course_key='edX/DemoX/Demo_Course')
+
+    def _get(self, url=None, status_code=200, **params):
+        """
+        DRY helper.
+        """
+        token = self.generate_id_token(UserFactory())
+        response = self.client.get(
+            url or reverse('api:v1:programs-list'), params, HTTP_AUTHORIZATION='JWT {0}'.format(token)
+        )
+        self.assertEqual(response.status_code, status_code)
+        return response
+
+    @ddt.data({}, {'projection': 'values'}, {'pagination': 'cursor'})
+    def test_fields(self, params):
+        """
+        Verify that only the selected fields are rendered, in their usual order, whichever way programs are rendered.
+        """
+        full_data = self._get(**params).data['results'][0]
+        for documents_enabled in (True, False):
+            with override_settings(PROGRAM_DOCUMENTS_ENABLED=documents_enabled):
+                data = self._get(fields='uuid,status,name,marketing_slug', **params).data['results'][0]
+                self.assertEqual(list(data), ['name', 'status', 'marketing_slug', 'uuid'])
+                self.assertEqual(data, {name: full_data[name] for name in data})
+
+                data = self._get(exclude='course_codes,banner_image_urls', **params).data['results'][0]
+                self.assertNotIn('course_codes', data)
+                self.assertEqual(data, {name: full_data[name] for name in full_data if name in data})
+                self.assertEqual(len(data), len(full_data) - 2)
+
+                data = self._get(fields='name,course_codes', exclude='name', **params).data['results'][0]
+                self.assertEqual(data, {'course_codes': full_data['course_codes']})
+
+    def test_retrieve(self):
+        """
+        Verify that the fields of a single program can be selected.
+        """
+        url = reverse('api:v1:programs-detail', kwargs={'pk': self.program.id})
+        self.assertEqual(self._get(url, fields='name').data, {'name': self.program.name})
+
+    @ddt.data('fields', 'exclude')
+    def test_unknown_field(self, query_param):
+        """
+        Verify that selecting unknown fields is rejected.
+        """
+        response = self._get(status_code=400, **{query_param: 'name,invalid'})
+        self.assertEqual(response.data, {query_param: ['Unknown field(s): invalid.']})
+
+    @ddt.data({}, {'projection': 'values'})
+    def test_nested_data_not_read(self, params):
+        """
+        Verify that nested data which is not rendered is not read.
+        """
+        with CaptureQueriesContext(connection) as context:
+            self._get(fields='uuid,name,status,marketing_slug', **params)
+        tables = [
+            'programorganization', 'programcoursecode', 'programcourserunmode', 'programdocument', 'programdefault'
+        ]
+        for query in context.captured_queries:
+            for table in tables:
+                self.assertNotIn('programs_{}'.format(table), query['sql'])
@@ -1,26 +1,44 @@
 """
 Programs API views (v1).
 """
-from django.db import transaction
-from django.db.models import Prefetch
+import json
+import uuid
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Count, Max
 from django.db.models.functions import Lower
+from django.http import StreamingHttpResponse
+from django.utils import timezone
 from django.utils.decorators import method_decorator
 from rest_framework import (
+    exceptions,
+    fields,
     mixins,
     parsers as drf_parsers,
+    status,
     viewsets,
 )
+from rest_framework.decorators import list_route
+from rest_framework.response import Response
+from rest_framework.utils.encoders import JSONEncoder
 
 from programs.apps.programs import models
+from programs.apps.programs.constants import ProgramStatus
 from programs.apps.api import (
+    documents,
     filters,
+    mixins as edx_mixins,
     parsers as edx_parsers,
     permissions as edx_permissions,
+    projections,
     serializers,
 )
+from programs.apps.api.pagination import KeysetPagination
 
 
 class ProgramsViewSet(
+        edx_mixins.ConditionalGetMixin, edx_mixins.KeysetPaginationMixin, edx_mixins.SparseFieldsetMixin,
         mixins.CreateModelMixin, mixins.ListModelMixin, mixins.RetrieveModelMixin, mixins.UpdateModelMixin,
         viewsets.GenericViewSet):
     """
@@ -55,6 +73,43 @@ class ProgramsViewSet(
         Only users with global administrative rights may update programs. PATCH requests from non-
         admins will result in status 403.
 
+        # Export every program in the system.
+        GET /api/v1/programs/export/
+
+        If the request is successful, the HTTP status will be 200 and the response body will be
+        streamed as newline-delimited JSON (application/x-ndjson), one program per line, ordered
+        by ID.  The status and organization filters of the list are supported.  Programs are read
+        in chunks, so the export is not a consistent snapshot of a catalog which changes meanwhile.
+
+        # Return the programs which changed since a point in time.
+        GET /api/v1/programs/changes/?modified_since=2016-01-01T00:00:00Z
+
+        If the request is successful, the HTTP status will be 200 and the response body will
+        contain a page of the programs which changed since the given time (as also returned by
+        the list when filtered by `modified_since`), along with:
+
+        * until: the time to pass as `modified_since` in the next request for changes.
+        * deleted: the IDs and UUIDs of programs which were deleted since the given time, oldest
+          first.  Mirrors should remove these.  At most 1000 are listed at once.
+        * deleted_after: null, unless more programs were deleted than listed.  In that case, `until`
+          is the time of the last one listed, and this is its ID: pass both (as `modified_since`
+          and `deleted_after`) in the next request, to continue after it.
+
+        # Create and update several programs at once.
+        POST /api/v1/programs/bulk/
+
+        The request body must be a JSON array of up to 100 programs.  Items with a `uuid` are
+        applied as merge patches to the existing programs with those UUIDs; other items are
+        created.  All items are applied in a single transaction: if any item is invalid, none
+        are applied, and the HTTP status will be 400 with a response body containing an array
+        of the errors of each item (empty for valid items).
+
+        If the request is successful, the HTTP status will be 200 and the response body will
+        contain an array with the `id`, `uuid` and `status` (201 if created, 200 if updated) of
+        each item, in order.
+
+        Only users with global administrative rights may create or update programs.
+
     **Response Values**
 
         * id: The ID of the program.
@@ -67,20 +122,304 @@ class ProgramsViewSet(
         * created: The date/time this Program was created.
         * modified: The date/time this Program was last modified.
 
+    **Caching**
+
+        Successful GET responses are cached per role and URL, and are invalidated whenever
+        any program, organization, course code, run mode or the program defaults change.
+
+        GET responses, other than cursor-paginated lists, carry ETag and Last-Modified headers.
+        Requests bearing a matching If-None-Match (or a current If-Modified-Since) header
+        receive a 304 Not Modified response with no body.
+
+    **Pagination**
+
+        Lists are paginated by page number by default.  Clients walking the entire list
+        should instead request `?pagination=cursor`, and follow the `next` link of each
+        page until it is null.  Cursor-paginated responses omit the `count`, `num_pages`
+        and `previous` values, and their cost does not depend on the depth of the page.
+
+        Cursor-paginated programs are ordered by modification time, so a program which is
+        modified during the walk is listed again on a later page, rather than being missed.
+
+    **Sparse Fieldsets**
+
+        GET requests may select the fields of each program to render, by passing comma-separated
+        field names as `fields` (e.g. `?fields=uuid,name,status,marketing_slug`) and/or `exclude`
+        (e.g. `?exclude=course_codes`).  Nested data which is not rendered is not read, so lists
+        without `organizations` and `course_codes` are read with a single query.
+
+    **Projection**
+
+        Lists requested with `?projection=values` are rendered from the plain column values
+        of the programs and their nested rows, rather than from model instances, with the
+        same output.  This reduces the time and memory taken to render long pages.
+
     """
     permission_classes = (edx_permissions.IsAdminGroupOrReadOnly, )
     filter_backends = (
         filters.ProgramStatusRoleFilterBackend,
         filters.ProgramStatusQueryFilterBackend,
         filters.ProgramOrgKeyFilterBackend,
+        filters.ProgramModifiedSinceFilterBackend,
     )
     serializer_class = serializers.ProgramSerializer
+    keyset_ordering = ('modified', 'id')
+    export_chunk_size = 100
+    bulk_max_size = 100
+    changes_max_deleted = 1000
+    changes_deleted_after_param = 'deleted_after'
+    sparse_fields = serializers.ProgramSerializer.Meta.fields
+    projection_query_param = 'projection'
+    projection_value = 'values'
     parser_classes = (edx_parsers.MergePatchParser, drf_parsers.JSONParser)
 
     @method_decorator(transaction.non_atomic_requests)
     def dispatch(self, request, *args, **kwargs):
         return super(ProgramsViewSet, self).dispatch(request, *args, **kwargs)
 
+    @list_route(methods=['get'])
+    def export(self, request):  # pylint: disable=unused-argument
+        """Stream every program visible to the requesting user as newline-delimited JSON."""
+        queryset = self.filter_queryset(self.get_queryset())
+        response = StreamingHttpResponse(self._export_lines(queryset), content_type='application/x-ndjson')
+        response['Content-Disposition'] = 'attachment; filename="programs.ndjson"'
+        return response
+
+    def _export_lines(self, queryset):
+        """
+        Serialize the programs in the queryset one chunk at a time, so that memory use does not
+        grow with the size of the catalog.  Chunks are read by ID range rather than by offset.
+        """
+        last_id = 0
+        while True:
+            chunk = list(queryset.filter(id__gt=last_id).order_by('id')[:self.export_chunk_size])
+            if not chunk:
+                return
+
+            for data in self.get_serializer(chunk, many=True).data:
+                yield json.dumps(data, cls=JSONEncoder) + '\n'
+            last_id = chunk[-1].id
+
+    @list_route(methods=['get'])
+    def changes(self, request):
+        """Return a page of the programs which changed since a given time, and tombstones for those removed."""
+        modified_since_backend = filters.ProgramModifiedSinceFilterBackend
+        modified_since = modified_since_backend.get_modified_since(request)
+        if modified_since is None:
+            raise exceptions.ValidationError({modified_since_backend.query_parameter: ['This parameter is required.']})
+
+        # take the next starting point before reading, so that changes made meanwhile are not missed.
+        until = timezone.now()
+
+        page = self.paginate_queryset(self.filter_queryset(self.get_queryset()))
+        response = self.get_paginated_response(self.get_serializer(page, many=True).data)
+
+        # only deleted programs are reported, rather than every program the user cannot see, which would reveal
+        # unpublished programs to learners.  Deleting a program saves it, so its own modification time suffices.
+        # tombstones are paged by (modified, id), like keyset pages, so that any number of them may share a time.
+        removed = models.Program.objects.filter(status=ProgramStatus.DELETED)
+        deleted_after = self._get_deleted_after(request)
+        if deleted_after is None:
+            removed = removed.filter(modified__gt=modified_since)
+        else:
+            removed = removed.filter(
+                KeysetPagination.get_position_filter(('modified', 'id'), (modified_since, deleted_after))
+            )
+        deleted = list(
+            removed.order_by('modified', 'id').values('id', 'uuid', 'modified')[:self.changes_max_deleted + 1]
+        )
+        deleted_after = None
+        if len(deleted) > self.changes_max_deleted:
+            # continue after the last tombstone listed next time.
+            deleted = deleted[:self.changes_max_deleted]
+            until, deleted_after = deleted[-1]['modified'], deleted[-1]['id']
+
+        response.data['deleted'] = [{'id': tombstone['id'], 'uuid': tombstone['uuid']} for tombstone in deleted]
+        response.data['until'] = fields.DateTimeField().to_representation(until)
+        response.data[self.changes_deleted_after_param] = deleted_after
+        return response
+
+    def _get_deleted_after(self, request):
+        """
+        Return the ID of the last tombstone listed by a previous request for changes, or None if there is none.
+
+        Raises:
+            ValidationError: if the value is not an integer.
+        """
+        value = request.query_params.get(self.changes_deleted_after_param)
+        if not value:
+            return None
+        try:
+            return int(value)
+        except ValueError:
+            raise exceptions.ValidationError({self.changes_deleted_after_param: ['A valid integer is required.']})
+
+    @list_route(methods=['post'])
+    def bulk(self, request):
+        """
+        Create or merge-patch several programs in one transaction.
+
+        The existing programs and the organizations referred to by every item are each looked up with one query.
+        Each program is then validated and saved by ProgramSerializer in turn, so that Program.save() and its
+        signals run as for any other write; only the nested course codes and run modes of each are written in bulk.
+        """
+        items = request.data
+        if not isinstance(items, list) or not all(isinstance(item, dict) for item in items):
+            raise exceptions.ValidationError({'non_field_errors': ['Expected a list of programs.']})
+        if len(items) > self.bulk_max_size:
+            raise exceptions.ValidationError(
+                {'non_field_errors': ['At most {} programs may be written at once.'.format(self.bulk_max_size)]}
+            )
+
+        # look up all of the programs to update at once.
+        uuids = set()
+        for item in items:
+            try:
+                uuids.add(uuid.UUID(unicode(item.get('uuid'))))
+            except ValueError:
+                pass
+        existing = {program.uuid: program for program in models.Program.objects.filter(uuid__in=uuids)}
+
+        # likewise the organizations of all of the programs, which are shared by the serializers of every item.
+        org_keys = set()
+        for item in items:
+            organizations = item.get('organizations')
+            if isinstance(organizations, list):
+                org_keys.update(
+                    org['key'] for org in organizations
+                    if isinstance(org, dict) and isinstance(org.get('key'), basestring)
+                )
+        context = self.get_serializer_context()
+        context[serializers.ProgramSerializer.ORGANIZATIONS_CONTEXT_KEY] = {
+            org.key: org for org in models.Organization.objects.filter(key__in=org_keys)
+        }
+        serializer_class = self.get_serializer_class()
+
+        with transaction.atomic():
+            serializers_by_item = []
+            errors = []
+            for item, item_errors in zip(items, self._get_bulk_duplicate_errors(items)):
+                if item.get('uuid') is None:
+                    serializer = serializer_class(data=item, context=dict(context))
+                else:
+                    try:
+                        program = existing.get(uuid.UUID(unicode(item['uuid'])))
+                    except ValueError:
+                        program = None
+                    if program is None:
+                        item_errors.setdefault('uuid', ['No program with this UUID exists.'])
+                    serializer = serializer_class(program, data=item, partial=True, context=dict(context))
+
+                # nested course codes are resolved (and possibly created) during validation, so it must be
+                # done within the transaction, and must not be attempted without a program to update.
+                if not item_errors and not serializer.is_valid():
+                    item_errors = serializer.errors
+                serializers_by_item.append(serializer)
+                errors.append(item_errors)
+
+            if any(errors):
+                transaction.set_rollback(True)
+                return Response(errors, status=status.HTTP_400_BAD_REQUEST)
+
+            results = []
+            for serializer in serializers_by_item:
+                created = serializer.instance is None
+                try:
+                    # conflicts between items (e.g. one renaming a program to the former name of another) are only
+                    # detected by the database; the savepoint lets the remaining items still be checked.
+                    with transaction.atomic():
+                        program = serializer.save()
+                except IntegrityError:
+                    results.append({'non_field_errors': ['This program conflicts with another program.']})
+                    continue
+                results.append({
+                    'id': program.id,
+                    'uuid': program.uuid,
+                    'status': status.HTTP_201_CREATED if created else status.HTTP_200_OK,
+                })
+
+            if any('non_field_errors' in result for result in results):
+                transaction.set_rollback(True)
+                return Response(
+                    [result if 'non_field_errors' in result else {} for result in results],
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+
+        return Response(results)
+
+    @staticmethod
+    def _get_bulk_duplicate_errors(items):
+        """
+        Return the errors of each bulk item which repeats the UUID or name of an earlier item.  Each item is only
+        validated against the database, so these conflicts within the batch would otherwise go unnoticed.  Names are
+        compared case-insensitively, as the database collation does.
+        """
+        normalizers = (('uuid', lambda value: uuid.UUID(unicode(value))), ('name', lambda value: value.lower()))
+        seen = {field_name: set() for field_name, __ in normalizers}
+        errors = []
+        for item in items:
+            item_errors = {}
+            for field_name, normalize in normalizers:
+                try:
+                    value = normalize(item[field_name])
+                except (AttributeError, KeyError, TypeError, ValueError):
+                    continue
+                if value in seen[field_name]:
+                    item_errors[field_name] = ['Another item in this batch has the same {}.'.format(field_name)]
+                seen[field_name].add(value)
+            errors.append(item_errors)
+        return errors
+
+    def get_response_cache_parts(self, request):
+        """Responses differ by role, according to the programs each role may see."""
+        return filters.ProgramStatusRoleFilterBackend.get_allowed_statuses(request)
+
+    def get_conditional_state(self, queryset):
+        """
+        Summarize the programs in the queryset, and every nested row rendered with them.
+
+        Row counts are included alongside modification times so that deleting
+        a nested row is detected too.  Nested rows which are not rendered (see
+        `SparseFieldsetMixin`) are not summarized.
+        """
+        requested_fields = self.get_sparse_fields()
+        programs = queryset.aggregate(count=Count('id', distinct=True), modified=Max('modified'))
+        if not programs['count']:
+            return None
+
+        aggregates = [programs]
+        if requested_fields is None or 'organizations' in requested_fields:
+            aggregates.append(models.ProgramOrganization.objects.filter(program__in=queryset).aggregate(
+                count=Count('id'),
+                modified=Max('modified'),
+                organization_modified=Max('organization__modified'),
+            ))
+        if requested_fields is None or 'course_codes' in requested_fields:
+            aggregates.append(models.ProgramCourseCode.objects.filter(program__in=queryset).aggregate(
+                count=Count('id'),
+                modified=Max('modified'),
+                course_code_modified=Max('course_code__modified'),
+                organization_modified=Max('course_code__organization__modified'),
+            ))
+            aggregates.append(
+                models.ProgramCourseRunMode.objects.filter(program_course_code__program__in=queryset).aggregate(
+                    count=Count('id'),
+                    modified=Max('modified'),
+                )
+            )
+        state = [sorted(aggregate.items()) for aggregate in aggregates]
+        if requested_fields is None or 'banner_image_urls' in requested_fields:
+            # programs without their own banner image render the default one.  Its stored URLs are included, since
+            # they change (e.g. once its resized copies are generated) without any modification time changing.
+            state.append(
+                models.ProgramDefault.objects.values_list('banner_image', 'banner_image_resized_urls').first()
+            )
+
+        last_modified = max(
+            value for aggregate in aggregates for key, value in aggregate.items() if key != 'count' and value
+        )
+        return last_modified, state
+
     def get_queryset(self):
         """Perform eager loading of data to prevent a cascade of performance-degrading queries."""
         queryset = models.Program.objects.all()
@@ -92,20 +431,59 @@ class ProgramsViewSet(
         if self.request.method != 'GET':
             return queryset
 
-        return queryset.prefetch_related(
-            Prefetch(
-                'programorganization_set',
-                queryset=models.ProgramOrganization.objects.select_related('organization')
-            ),
-            Prefetch(
-                'programcoursecode_set',
-                queryset=models.ProgramCourseCode.objects.select_related()
-            ),
-            'programcoursecode_set__run_modes',
+        if self._is_projection_requested():
+            # nested rows are read by the projection serializer.
+            return queryset
+
+        if self._is_document_rendering():
+            # documents are rendered from a single row, which is read along with the program.
+            return queryset.select_related('document')
+
+        return serializers.ProgramSerializer.setup_eager_loading(queryset, self.get_sparse_fields())
+
+    def _renders_nested_data(self):
+        """
+        Return True unless the request selected fields other than the nested organizations and course codes.
+        """
+        requested_fields = self.get_sparse_fields()
+        return requested_fields is None or any(
+            name in requested_fields for name in serializers.ProgramSerializer.NESTED_FIELDS
+        )
+
+    def _is_document_rendering(self):
+        """
+        Return True if programs should be rendered from their precomputed documents.  Programs are rendered
+        from their own rows when no nested data is selected, as that needs no more than the program itself.
+        """
+        return self.request.method == 'GET' and settings.PROGRAM_DOCUMENTS_ENABLED and self._renders_nested_data()
+
+    def _is_projection_requested(self):
+        """
+        Return True if the request is for a list rendered from projected column values (see `projections`).
+        """
+        return (
+            self.action == 'list' and
+            self.request.query_params.get(self.projection_query_param) == self.projection_value
         )
 
+    def paginate_queryset(self, queryset):
+        """Read the page of a projected list as plain column values, rather than model instances."""
+        if self._is_projection_requested():
+            queryset = projections.get_projection_queryset(queryset)
+        return super(ProgramsViewSet, self).paginate_queryset(queryset)
+
+    def get_serializer_class(self):
+        """Render programs from their precomputed documents when enabled, otherwise with the read-only serializer."""
+        if self._is_projection_requested():
+            return projections.ProgramProjectionSerializer
+        if self._is_document_rendering():
+            return documents.ProgramDocumentSerializer
+        if self.request.method == 'GET':
+            return serializers.ProgramReadSerializer
+        return super(ProgramsViewSet, self).get_serializer_class()
+
 
-class CourseCodesViewSet(mixins.ListModelMixin, viewsets.GenericViewSet):
+class CourseCodesViewSet(edx_mixins.KeysetPaginationMixin, mixins.ListModelMixin, viewsets.GenericViewSet):
     """
 
     **Use Cases**
@@ -129,10 +507,18 @@ class CourseCodesViewSet(mixins.ListModelMixin, viewsets.GenericViewSet):
             * key: the prefix from the edX CourseKey, consisting of the "org" part.
             * display_name: the display title of the organization.
 
+    **Pagination**
+
+        Lists are paginated by page number by default.  Clients walking the entire list
+        should instead request `?pagination=cursor`, and follow the `next` link of each
+        page until it is null.  Cursor-paginated responses omit the `count`, `num_pages`
+        and `previous` values, and their cost does not depend on the depth of the page.
+
     """
     permission_classes = (edx_permissions.IsAdminGroup, )
     serializer_class = serializers.CourseCodeSerializer
     filter_backends = (filters.CourseCodeOrgKeyFilterBackend, )
+    keyset_ordering = ('modified', 'id')
 
     def get_queryset(self):
         """Perform eager loading of data to prevent a cascade of performance-degrading queries."""
@@ -141,7 +527,8 @@ class CourseCodesViewSet(mixins.ListModelMixin, viewsets.GenericViewSet):
         return queryset.select_related('organization')
 
 
-class OrganizationsViewSet(mixins.CreateModelMixin, mixins.ListModelMixin, viewsets.GenericViewSet):
+class OrganizationsViewSet(
+        edx_mixins.KeysetPaginationMixin, mixins.CreateModelMixin, mixins.ListModelMixin, viewsets.GenericViewSet):
     """
 
     **Use Cases**
@@ -162,7 +549,17 @@ class OrganizationsViewSet(mixins.CreateModelMixin, mixins.ListModelMixin, views
         * key: the prefix from the edX CourseKey, consisting of the "org" part.
         * display_name: the display title of the organization.
 
+    **Pagination**
+
+        Lists are paginated by page number by default.  Clients walking the entire list
+        should instead request `?pagination=cursor`, and follow the `next` link of each
+        page until it is null.  Cursor-paginated responses omit the `count`, `num_pages`
+        and `previous` values, and their cost does not depend on the depth of the page.
+
     """
     permission_classes = (edx_permissions.IsAdminGroup, )
     queryset = models.Organization.objects.all().order_by(Lower('key'))
     serializer_class = serializers.OrganizationSerializer
+    # cursors follow the (unique, indexed) key column, as lower(key) cannot be read from an index.  the walk is
+    # case-insensitive where the column's collation is, as with MySQL's defaults.
+    keyset_ordering = ('key', 'id')
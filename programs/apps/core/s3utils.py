@@ -2,12 +2,47 @@
 Custom S3 storage backends.
 """
 from functools import partial
+import logging
 
 from django.conf import settings
 from storages.backends.s3boto import S3BotoStorage
 
+logger = logging.getLogger(__name__)
+
 
 MediaS3BotoStorage = partial(
     S3BotoStorage,
     location=settings.MEDIA_ROOT.strip('/')
 )
+
+# The maximum number of keys in an S3 multi-object delete request.
+S3_DELETE_BATCH_SIZE = 1000
+
+
+def delete_files(storage, names):
+    """
+    Delete the named files from the given storage: with multi-object delete
+    requests if it is an S3 storage, otherwise one at a time.
+
+    Arguments:
+        storage (Storage): a django storage instance.
+        names (list): the names of the files to delete.
+
+    Returns:
+        list: the names of the files which could not be deleted.
+    """
+    if not isinstance(storage, S3BotoStorage):
+        for name in names:
+            storage.delete(name)
+        return []
+
+    # pylint: disable=protected-access
+    keys = {storage._encode_name(storage._normalize_name(storage._clean_name(name))): name for name in names}
+    key_names = list(keys)
+    failed = []
+    for start in range(0, len(key_names), S3_DELETE_BATCH_SIZE):
+        result = storage.bucket.delete_keys(key_names[start:start + S3_DELETE_BATCH_SIZE], quiet=True)
+        for error in result.errors:
+            logger.warning('Failed to delete %s from S3: %s %s', error.key, error.code, error.message)
+            failed.append(keys[error.key])
+    return failed
@@ -3,9 +3,10 @@ Test s3 utilities
 """
 from django.test import TestCase
 from django.conf import settings
+import mock
 from storages.backends.s3boto import S3BotoStorage
 
-from programs.apps.core.s3utils import MediaS3BotoStorage
+from programs.apps.core.s3utils import delete_files, MediaS3BotoStorage
 
 
 class MediaS3BotoStorageTestCase(TestCase):
@@ -21,3 +22,34 @@ class MediaS3BotoStorageTestCase(TestCase):
         storage = MediaS3BotoStorage()
         self.assertIsInstance(storage, S3BotoStorage)
         self.assertEqual(storage.location, settings.MEDIA_ROOT.strip('/'))
+
+
+class DeleteFilesTestCase(TestCase):
+    """
+    Test deleting files from storage in batches.
+    """
+
+    def test_delete_files(self):
+        """
+        Ensure that files are deleted from other storages one at a time.
+        """
+        storage = mock.Mock()
+        self.assertEqual(delete_files(storage, ['a', 'b']), [])
+        self.assertEqual(storage.delete.call_args_list, [mock.call('a'), mock.call('b')])
+
+    @mock.patch('programs.apps.core.s3utils.S3_DELETE_BATCH_SIZE', 2)
+    def test_delete_files_s3(self):
+        """
+        Ensure that files are deleted from S3 with multi-object delete requests, and failures are reported.
+        """
+        storage = S3BotoStorage(location='media')
+        error = mock.Mock(key='media/c', code='AccessDenied', message='Access Denied')
+        with mock.patch.object(S3BotoStorage, 'bucket', new_callable=mock.PropertyMock) as mock_bucket:
+            mock_bucket.return_value.delete_keys.side_effect = [
+                mock.Mock(errors=[]), mock.Mock(errors=[error]),
+            ]
+            self.assertEqual(delete_files(storage, ['a', 'b', 'c']), ['c'])
+
+        deleted_keys = [call[0][0] for call in mock_bucket.return_value.delete_keys.call_args_list]
+        self.assertEqual([len(keys) for keys in deleted_keys], [2, 1])
+        self.assertEqual(sorted(sum(deleted_keys, [])), ['media/a', 'media/b', 'media/c'])
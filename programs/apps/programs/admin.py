@@ -6,7 +6,7 @@ from opaque_keys.edx.keys import CourseKey
 from solo.admin import SingletonModelAdmin
 
 from programs.apps.programs import models
-from programs.apps.programs.image_helpers import validate_image_type, validate_image_size
+from programs.apps.programs.image_helpers import validate_image
 
 
 class ProgramOrganizationInline(admin.TabularInline):
@@ -34,8 +34,7 @@ class ProgramForm(forms.ModelForm):
         Avoid server errors if an uploaded banner image is going to fail validation checks.
         """
         if 'banner_image' in self.files:
-            validate_image_type(self.files['banner_image'])
-            validate_image_size(self.files['banner_image'], *self.instance.banner_image.minimum_original_size)
+            validate_image(self.files['banner_image'], *self.instance.banner_image.minimum_original_size)
         return self.cleaned_data['banner_image']
 
 
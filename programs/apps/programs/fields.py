@@ -3,25 +3,54 @@ Custom fields used in models in the programs django app.
 """
 from collections import OrderedDict
 from contextlib import closing
+import hashlib
+import json
 import logging
 import os
 import re
 
-from django.db import models
+from django.apps import apps
+from django.conf import settings
+from django.db import models, transaction
+from django.db.models import signals
 from django.db.models.fields.files import ImageFieldFile
-from PIL import Image
+from django.utils import timezone
+from django_extensions.db.fields import ModificationDateTimeField
 
+from programs.apps.core.s3utils import delete_files
+
+from . import workers
 from .image_helpers import (
     create_image_file,
-    crop_image_to_aspect_ratio,
-    scale_image,
-    set_color_mode_to_rgb,
-    validate_image_size,
-    validate_image_type,
+    create_resized_images,
+    validate_image,
 )
 
 LOG = logging.getLogger(__name__)
 
+# Storage attributes which affect the URLs generated for stored files.
+STORAGE_URL_ATTRS = ('base_url', 'location', 'bucket_name', 'custom_domain', 'secure_urls', 'url_protocol')
+
+
+def get_storage_fingerprint(storage):
+    """
+    Return a value identifying the configuration of the given storage as far as
+    it affects the URLs it generates, or None if its URLs cannot be reused
+    (i.e. they are signed and will expire).
+
+    Arguments:
+        storage (Storage): a django storage instance.
+
+    Returns:
+        str or None
+    """
+    if getattr(storage, 'querystring_auth', False):
+        return None
+    cls = storage.__class__
+    values = ['{}.{}'.format(cls.__module__, cls.__name__)]
+    values += [unicode(getattr(storage, attr, None)) for attr in STORAGE_URL_ATTRS]
+    return hashlib.md5(u'|'.join(values).encode('utf-8')).hexdigest()
+
 
 class ResizingImageFieldFile(ImageFieldFile):
     """
@@ -37,13 +66,7 @@ class ResizingImageFieldFile(ImageFieldFile):
         Returns:
             dict
         """
-        if not self.name:
-            return {}
-        else:
-            return {
-                (width, height): '{}__{}x{}.jpg'.format(self.name, width, height)
-                for width, height in self.field.sizes
-            }
+        return self.field.get_resized_names(self.name)
 
     @property
     def resized_urls(self):
@@ -54,10 +77,83 @@ class ResizingImageFieldFile(ImageFieldFile):
         Returns:
             dict
         """
-        if not self.name:
-            return {}
+        return self.field.get_resized_urls(self.name, self._get_stored_value())
+
+    @property
+    def stored_resized_urls(self):
+        """
+        Return the resized URLs stored on the model instance, if present and
+        still valid for the current image and storage configuration.
+
+        Returns:
+            dict or None
+        """
+        return self.field.get_stored_resized_urls(self.name, self._get_stored_value())
+
+    @property
+    def resized_copies_pending(self):
+        """
+        Return whether the resized copies of this image are still being
+        generated in the background (see `mark_resized_copies_pending`).
+
+        Returns:
+            bool
+        """
+        return self.field.is_pending(self.name, self._get_stored_value())
+
+    def _get_stored_value(self):
+        """
+        Return the value of the field in which resized URLs are stored, if any.
+        """
+        if not self.field.resized_urls_field:
+            return None
+        return getattr(self.instance, self.field.resized_urls_field)
+
+    def store_resized_urls(self):
+        """
+        Compute the URLs of the resized copies of this image and store them on
+        the model instance, in the field named by the `resized_urls_field`
+        argument of the ResizingImageField, so that they can be served without
+        calling the storage backend again.
+
+        This does not save the model instance.
+
+        Returns:
+            None
+        """
+        if not self.field.resized_urls_field:
+            return
+
+        fingerprint = get_storage_fingerprint(self.storage)
+        if not self.name or fingerprint is None:
+            value = ''
         else:
-            return {size: self.storage.url(name) for size, name in self.resized_names.items()}
+            value = json.dumps({
+                'name': self.name,
+                'fingerprint': fingerprint,
+                'urls': {
+                    '{}x{}'.format(*size): self.storage.url(name) for size, name in self.resized_names.items()
+                },
+            }, sort_keys=True)
+
+        setattr(self.instance, self.field.resized_urls_field, value)
+
+    def mark_resized_copies_pending(self):
+        """
+        Record on the model instance that the resized copies of this image have
+        yet to be generated, so that no URLs are served for them in the
+        meantime, and have them generated in the background once the instance
+        has been saved (see `ResizingImageField.submit_pending_resized_copies`).
+
+        This does not save the model instance.
+
+        Returns:
+            None
+        """
+        value = json.dumps({'name': self.name, 'pending': True}, sort_keys=True)
+        setattr(self.instance, self.field.resized_urls_field, value)
+        # this is flagged on the instance since saving the file replaces the field value (i.e. this object).
+        setattr(self.instance, self.field.submit_flag_attname, True)
 
     @property
     def minimum_original_size(self):
@@ -74,28 +170,133 @@ class ResizingImageFieldFile(ImageFieldFile):
     def create_resized_copies(self):
         """
         Generate and store resized copies of the original image, using the
-        django storage API.
+        django storage API, then store their URLs on the model instance and
+        clean up stale images.
 
         Returns:
             None
         """
-        original = Image.open(self.file)
-        image = set_color_mode_to_rgb(original)
-        ref_width, ref_height = self.minimum_original_size
-        image = crop_image_to_aspect_ratio(image, float(ref_width) / float(ref_height))
+        self.save_resized_copies()
+        self.store_resized_urls()
+        self.clean_stale_images()
+
+    def save_resized_copies(self):
+        """
+        Generate and store resized copies of the original image, using the
+        django storage API.  This needs no model instance.
 
-        for size, name in self.resized_names.items():
-            scaled = scale_image(image, *size)
-            with closing(create_image_file(scaled)) as scaled_image_file:
-                self.storage.save(name, scaled_image_file)
+        The copies are encoded and saved concurrently, on up to
+        RESIZED_IMAGES_UPLOAD_THREADS threads, since each save to a remote
+        storage (e.g. S3) costs a round trip.  If any of them fails, those
+        which were saved are deleted, and a ConcurrentCallsError is raised.
 
-        self.clean_stale_images()
+        Returns:
+            None
+        """
+        resized_names = self.resized_names
+
+        def save_copy(resized_image):
+            """
+            Encode a resized copy and save it to storage, returning its stored name and size.
+            """
+            size, image = resized_image
+            with closing(create_image_file(image)) as image_file:
+                return self.storage.save(resized_names[size], image_file), image_file.size
+
+        try:
+            saved = workers.call_concurrently(
+                save_copy,
+                create_resized_images(self.file, self.field.sizes),
+                settings.RESIZED_IMAGES_UPLOAD_THREADS,
+            )
+        except workers.ConcurrentCallsError as error:
+            # a partial set of copies is of no use, so remove those which were saved before failing.
+            for name, __ in error.results:
+                LOG.info('Deleting resized image file from failed set: %s', name)
+                self.storage.delete(name)
+            raise
+
+        self.record_stored_images(saved)
+
+    def record_stored_images(self, files):
+        """
+        Record files stored for this image (i.e. the image itself or its
+        resized copies) in the manifest of stored images, if the field has one.
+
+        Arguments:
+            files: a sequence of tuples of (name, size in bytes).
+
+        Returns:
+            None
+        """
+        manifest = self.field.manifest
+        if manifest is None:
+            return
+
+        manifest.objects.bulk_create([
+            manifest(directory=os.path.dirname(self.name), name=name, original_name=self.name, size=size)
+            for name, size in files
+        ])
+
+    def record_listed_images(self):
+        """
+        Record the files in the directory of this image which are missing from
+        the manifest of stored images (e.g. those stored before it was in use),
+        by listing them in the storage.  This calls the storage for the size of
+        every file and the modified time of every uploaded image, so it is only
+        meant to be run once; see the `clean_stale_images` management command.
+
+        Returns:
+            int: the number of files recorded.
+        """
+        manifest = self.field.manifest
+        dir_ = os.path.dirname(self.name)
+        recorded = set(manifest.objects.filter(directory=dir_).values_list('name', flat=True))
+
+        images = []
+        for source_name, group in self._list_stored_images(dir_).items():
+            original_name = os.path.join(dir_, source_name)
+            paths = [os.path.join(dir_, name) for name in group if os.path.join(dir_, name) not in recorded]
+            if not paths:
+                continue
+            created = self.storage.modified_time(original_name)
+            if timezone.is_naive(created):
+                created = timezone.make_aware(created)
+            images += [
+                manifest(
+                    directory=dir_, name=path, original_name=original_name, size=self.storage.size(path),
+                    created=created,
+                )
+                for path in paths
+            ]
+
+        manifest.objects.bulk_create(images)
+        return len(images)
+
+    def _list_stored_images(self, dir_):
+        """
+        List the files in the given directory, grouped by the name of the
+        uploaded image which they are (or are resized copies of).
+
+        Returns:
+            dict
+        """
+        groups = {}
+        for name in self.storage.listdir(dir_)[1]:
+            source_name = re.sub(r'__([\d]+)x([\d]+)\.jpg', '', name)
+            groups.setdefault(source_name, []).append(name)
+        return groups
 
     def clean_stale_images(self, keep_previous=True):
         """
         Search and clean historical images left in the storage,
         using django storage API
 
+        When the field has a manifest of stored images, the stale images are
+        found with a single query of the manifest and deleted in batches (see
+        `delete_files`), rather than by listing the storage and reading the
+        modified time of every image in it.
+
         Returns:
             None
         """
@@ -105,12 +306,13 @@ class ResizingImageFieldFile(ImageFieldFile):
             # empty.
             return
 
+        if self.field.manifest is not None:
+            self._clean_stale_images_from_manifest(keep_previous)
+            return
+
         dir_ = self.field.get_path(self.instance)
 
-        groups = {}
-        for name in self.storage.listdir(dir_)[1]:
-            source_name = re.sub(r'__([\d]+)x([\d]+)\.jpg', '', name)
-            groups.setdefault(source_name, []).append(name)
+        groups = self._list_stored_images(dir_)
 
         ordered_groups = OrderedDict(
             sorted(
@@ -136,6 +338,21 @@ class ResizingImageFieldFile(ImageFieldFile):
             LOG.info('Deleting stale image file: %s', stale_path)
             self.storage.delete(stale_path)
 
+    def _clean_stale_images_from_manifest(self, keep_previous):
+        """
+        Delete the stale images recorded in the manifest of stored images, and
+        their manifest entries.  Entries are kept for any files which could not
+        be deleted, so that they are retried by the next clean up.
+        """
+        manifest = self.field.manifest
+        stale_images = manifest.get_stale(os.path.dirname(self.name), self.name, keep_previous)
+        if not stale_images:
+            return
+
+        LOG.info('Deleting %d stale image files from %s.', len(stale_images), os.path.dirname(self.name))
+        failed = set(delete_files(self.storage, [image.name for image in stale_images]))
+        manifest.objects.filter(id__in=[image.id for image in stale_images if image.name not in failed]).delete()
+
 
 class ResizingImageField(models.ImageField):
     """
@@ -145,11 +362,17 @@ class ResizingImageField(models.ImageField):
     WARNING: this does not presently correct for orientation - processed images
     taken directly from digital cameras may appear with unexpected rotation.
 
+    When the RESIZED_IMAGES_ASYNC setting is enabled, and the field has a
+    `resized_urls_field`, the resized copies are instead generated by
+    background workers after the model instance has been saved, and marked as
+    pending until then.  While they are pending, no resized URLs are served,
+    so the default banner image is rendered in their place.
+
     TODO: purge stale copies.
     """
     attr_class = ResizingImageFieldFile
 
-    def __init__(self, path_template, sizes, *a, **kw):
+    def __init__(self, path_template, sizes, resized_urls_field=None, manifest_model=None, *a, **kw):
         """
         Arguments:
 
@@ -179,6 +402,23 @@ class ResizingImageField(models.ImageField):
 
                 WARNING: presently, all of the sizes must have the same aspect
                 ratio.
+
+            resized_urls_field (basestring):
+                Optional name of a text field on the same model, in which the
+                URLs of the resized copies will be stored whenever they are
+                generated.  They are then served from that field (rather than
+                by calling the storage backend) for as long as the storage
+                configuration is unchanged.  See the `rebuild_resized_urls`
+                management command.
+
+                The text field must be declared after this field, so that its
+                value is saved after this field has been processed.
+
+            manifest_model (basestring):
+                Optional 'app_label.ModelName' of a model with the fields of
+                `programs.StoredImage`, in which stored images and their resized
+                copies are recorded, so that stale images can be cleaned up
+                without listing the storage.
         """
         if callable(kw.get('upload_to')):
             # if an upload_to kwarg is passed with a callable value, the
@@ -193,6 +433,115 @@ class ResizingImageField(models.ImageField):
         super(ResizingImageField, self).__init__(*a, **kw)
         self.path_template = path_template.rstrip('/')
         self.sizes = sizes
+        self.resized_urls_field = resized_urls_field
+        self.manifest_model = manifest_model
+
+    @property
+    def manifest(self):
+        """
+        Return the model in which stored images are recorded, if any.
+
+        Returns:
+            Model or None
+        """
+        if not self.manifest_model:
+            return None
+        return apps.get_model(self.manifest_model)
+
+    def get_resized_names(self, name):
+        """
+        Return the names of the resized copies of the image with the given name
+        (if any), in a dictionary keyed by tuples of (width, height).
+
+        Returns:
+            dict
+        """
+        if not name:
+            return {}
+        return {(width, height): '{}__{}x{}.jpg'.format(name, width, height) for width, height in self.sizes}
+
+    def get_stored_resized_urls(self, name, stored_value):
+        """
+        Parse the resized URLs stored for the image with the given name.
+
+        Arguments:
+            name (basestring): the name of the original image.
+            stored_value (basestring): the value of the `resized_urls_field`, if any.
+
+        Returns:
+            dict, or None if no URLs are stored, or they are no longer valid for
+            the image and storage configuration.  While the resized copies are
+            being generated in the background, this is an empty dict.
+        """
+        stored = self._parse_stored_value(name, stored_value)
+        if stored is None:
+            return None
+
+        if stored.get('pending'):
+            # until the resized copies exist, no URLs are served for them, and the default banner is rendered.
+            return {}
+
+        if stored.get('fingerprint') != get_storage_fingerprint(self.storage):
+            return None
+
+        return {tuple(int(dim) for dim in size.split('x')): url for size, url in stored['urls'].items()}
+
+    def is_pending(self, name, stored_value):
+        """
+        Return whether the resized copies of the image with the given name are
+        still being generated in the background.
+
+        Arguments:
+            name (basestring): the name of the original image.
+            stored_value (basestring): the value of the `resized_urls_field`, if any.
+
+        Returns:
+            bool
+        """
+        stored = self._parse_stored_value(name, stored_value)
+        return bool(stored and stored.get('pending'))
+
+    def _parse_stored_value(self, name, stored_value):
+        """
+        Return the parsed value of the `resized_urls_field`, or None if there is
+        none, or it was not stored for the image with the given name.
+        """
+        if not self.resized_urls_field:
+            return None
+
+        try:
+            stored = json.loads(stored_value or '{}')
+        except ValueError:
+            return None
+
+        if stored.get('name') != name:
+            return None
+        return stored
+
+    def get_resized_urls(self, name, stored_value):
+        """
+        Return the URLs of the resized copies of the image with the given name
+        (if any), in a dictionary keyed by tuples of (width, height).  Stored
+        URLs are used while valid, otherwise they are built by the storage.
+
+        This needs no model instance, so that URLs can be rendered from plain
+        column values (e.g. as read with `values_list()`).
+
+        Arguments:
+            name (basestring): the name of the original image.
+            stored_value (basestring): the value of the `resized_urls_field`, if any.
+
+        Returns:
+            dict
+        """
+        if not name:
+            return {}
+
+        stored_urls = self.get_stored_resized_urls(name, stored_value)
+        if stored_urls is not None:
+            return stored_urls
+
+        return {size: self.storage.url(resized_name) for size, resized_name in self.get_resized_names(name).items()}
 
     def get_path(self, model_instance):
         """
@@ -260,12 +609,72 @@ class ResizingImageField(models.ImageField):
 
         # if we just stored a new file, do additional validation, then generate and save resized copies.
         if not originally_committed:
-            validate_image_type(field_value.file)
-            validate_image_size(field_value.file, *field_value.minimum_original_size)
-            field_value.create_resized_copies()
+            # an upload which has already been validated (e.g. by a form) is not inspected again.
+            validate_image(field_value.file, *field_value.minimum_original_size)
+            field_value.record_stored_images([(field_value.name, field_value.file.size)])
+            if self.resizes_in_background:
+                field_value.mark_resized_copies_pending()
+            else:
+                field_value.create_resized_copies()
 
         return field_value
 
+    @property
+    def resizes_in_background(self):
+        """
+        Return whether the resized copies of newly stored images are generated
+        by background workers (see the RESIZED_IMAGES_ASYNC setting).  This
+        requires a `resized_urls_field`, in which they are marked as pending.
+
+        Returns:
+            bool
+        """
+        return bool(settings.RESIZED_IMAGES_ASYNC and self.resized_urls_field)
+
+    def contribute_to_class(self, cls, name, **kwargs):  # pylint: disable=arguments-differ
+        """
+        Connect the submission of pending resized copies to the saving of model instances.
+        """
+        super(ResizingImageField, self).contribute_to_class(cls, name, **kwargs)
+        if not cls._meta.abstract:  # pylint: disable=protected-access
+            signals.post_save.connect(self.submit_pending_resized_copies, sender=cls)
+
+    def submit_pending_resized_copies(self, instance, **kwargs):  # pylint: disable=unused-argument
+        """
+        Once a model instance has been saved with a newly stored image whose
+        resized copies are pending, submit their generation to the background
+        workers.  The model instance must have been saved first, so that it has
+        a primary key by which the workers can find it.
+        """
+        if instance.__dict__.pop(self.submit_flag_attname, False):
+            workers.submit(
+                create_pending_resized_copies, instance.__class__, instance.pk, self.name,
+                getattr(instance, self.attname).name,
+            )
+
+    def get_resized_urls_update_fields(self):
+        """
+        Return the names of the fields to save when only the stored resized
+        URLs of a model instance have changed: the `resized_urls_field`, along
+        with any fields recording the modification time of the instance, since
+        the URLs rendered for it change too.
+
+        Returns:
+            list
+        """
+        return [self.resized_urls_field] + [
+            field.name for field in self.model._meta.fields  # pylint: disable=protected-access
+            if getattr(field, 'auto_now', False) or isinstance(field, ModificationDateTimeField)
+        ]
+
+    @property
+    def submit_flag_attname(self):
+        """
+        Return the name of the model instance attribute which flags that the
+        pending resized copies of a newly stored image are to be submitted.
+        """
+        return '_{}_submit_resized_copies'.format(self.attname)
+
     def deconstruct(self):
         """
         Provide instantiation metadata for the migrations framework.
@@ -273,4 +682,48 @@ class ResizingImageField(models.ImageField):
         name, path, args, kwargs = super(ResizingImageField, self).deconstruct()
         kwargs['sizes'] = self.sizes
         kwargs['path_template'] = self.path_template
+        if self.resized_urls_field:
+            kwargs['resized_urls_field'] = self.resized_urls_field
+        if self.manifest_model:
+            kwargs['manifest_model'] = self.manifest_model
         return name, path, args, kwargs
+
+
+def create_pending_resized_copies(model, pk, field_name, name):
+    """
+    Generate the pending resized copies of the image with the given name,
+    stored in a ResizingImageField of a saved model instance, then store their
+    URLs on the instance and clean up stale images.  This is run by background
+    workers (see `ResizingImageField.submit_pending_resized_copies`).
+
+    The copies are generated before the model instance is read, so that the
+    instance is only locked for as long as it takes to store their URLs.  That
+    locking read also waits for the transaction which saved the instance (if it
+    is still open) to be committed.  If the instance has been deleted or its
+    image replaced in the meantime, its URLs are left alone, and the copies
+    will be cleaned up as stale images.
+
+    Arguments:
+        model (Model): the model class.
+        pk: the primary key of the model instance.
+        field_name (basestring): the name of the ResizingImageField.
+        name (basestring): the name of the original image.
+
+    Returns:
+        None
+    """
+    field = model._meta.get_field(field_name)  # pylint: disable=protected-access
+    with closing(field.attr_class(None, field, name)) as original:
+        original.save_resized_copies()
+
+    with transaction.atomic():
+        instance = model._default_manager.select_for_update().filter(pk=pk).first()  # pylint: disable=protected-access
+        field_value = getattr(instance, field.attname, None)
+        if field_value is None or field_value.name != name:
+            LOG.info('Discarding resized copies of replaced image %s.', name)
+            return
+
+        field_value.store_resized_urls()
+        instance.save(update_fields=field.get_resized_urls_update_fields())
+
+    field_value.clean_stale_images()
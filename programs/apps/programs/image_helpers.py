@@ -7,12 +7,18 @@ further generalization to provide correct functionality in this app.
 """
 from collections import namedtuple
 from cStringIO import StringIO
+import logging
+import math
+import time
 
+from django.conf import settings
 from django.core.exceptions import ValidationError
 from django.core.files.base import ContentFile
 from django.utils.translation import ugettext as _
 from PIL import Image
 
+LOG = logging.getLogger(__name__)
+
 
 class ImageValidationError(ValidationError):  # pylint: disable=missing-docstring
     pass
@@ -39,22 +45,41 @@ IMAGE_TYPES = {
 }
 
 
-def validate_image_type(uploaded_file):
+# The size of the first read of the header of an uploaded image, which is doubled on each further read.
+HEADER_READ_SIZE = 8 * 1024
+
+# The number of bytes within which the dimensions of an uploaded image must be found (JPEG metadata segments, which
+# may precede them, are limited to 64KB each).
+MAX_HEADER_SIZE = 1024 * 1024
+
+# Name of the attribute of uploaded files on which the result of inspecting them is cached, as a pair of the ImageInfo
+# and the ImageValidationError (one of which is None).
+IMAGE_INFO_ATTR = '_image_info'
+
+ImageInfo = namedtuple('ImageInfo', ('image_type', 'width', 'height'))
+
+
+def inspect_image(uploaded_file):
     """
-    Raises ImageValidationError if the server should refuse to use this
-    uploaded file based on its apparent type/metadata.  Otherwise, returns
-    nothing.
+    Inspect an uploaded image in a single pass, and return its type and
+    dimensions, or raise ImageValidationError if the server should refuse to
+    use it.  The file is read from the start, and only for as long as it takes
+    to find its dimensions in the image header: no pixel data is decoded.
+
+    The result (or error) is cached on the uploaded file, so that it is only
+    ever inspected once, however many times it is validated.
 
     Arguments:
 
         uploaded_file (UploadedFile): A user-supplied image file
 
     Returns:
-        None
+        ImageInfo
 
     Raises:
         ImageValidationError:
-            when the image file is an unsupported or invalid type.
+            when the image file is an unsupported or invalid type, or has more
+            pixels than the IMAGE_MAX_PIXELS setting allows.
 
     Note:
         Based on original code by @pmitros, adapted from https://github.com/pmitros/ProfileXBlock
@@ -63,6 +88,27 @@ def validate_image_type(uploaded_file):
         http://en.wikipedia.org/wiki/Magic_number_%28programming%29
         https://en.wikipedia.org/wiki/List_of_file_signatures
     """
+    inspected = getattr(uploaded_file, IMAGE_INFO_ATTR, None)
+    if inspected is None:
+        try:
+            inspected = (_inspect_image(uploaded_file), None)
+        except ImageValidationError as exc:
+            inspected = (None, exc)
+        finally:
+            # avoid unexpected errors from subsequent modules expecting the fp to be at 0
+            uploaded_file.seek(0)
+        setattr(uploaded_file, IMAGE_INFO_ATTR, inspected)
+
+    image_info, error = inspected
+    if error is not None:
+        raise error
+    return image_info
+
+
+def _inspect_image(uploaded_file):
+    """
+    Inspect an uploaded image, without caching the result.  See `inspect_image`.
+    """
     uploaded_file.seek(0)
 
     # check the file extension looks acceptable
@@ -87,21 +133,42 @@ def validate_image_type(uploaded_file):
         raise ImageValidationError(file_upload_bad_mimetype)
 
     # check file signature matches expected file type
-    headers = image_type.file_signatures
-    if uploaded_file.read(len(headers[0]) / 2).encode('hex') not in headers:
+    header = uploaded_file.read(HEADER_READ_SIZE)
+    signatures = image_type.file_signatures
+    if header[:len(signatures[0]) / 2].encode('hex') not in signatures:
         file_upload_bad_ext = _(
             u'The file name extension for this file does not match '
             u'the file data. The file may be corrupted.'
         )
         raise ImageValidationError(file_upload_bad_ext)
-    # avoid unexpected errors from subsequent modules expecting the fp to be at 0
-    uploaded_file.seek(0)
 
+    # read on until PIL finds the dimensions in the header (opening an image does not decode it).
+    size = None
+    while size is None:
+        try:
+            size = Image.open(StringIO(header)).size
+        except IOError:
+            chunk = uploaded_file.read(len(header))
+            if not chunk or len(header) >= MAX_HEADER_SIZE:
+                raise ImageValidationError(_(u'The file could not be read as an image. The file may be corrupted.'))
+            header += chunk
 
-def validate_image_size(uploaded_file, minimum_width, minimum_height):
+    width, height = size
+    if width * height > settings.IMAGE_MAX_PIXELS:
+        file_upload_too_large = _(
+            u'The file must be no larger than {max_megapixels:g} megapixels.'
+        ).format(max_megapixels=settings.IMAGE_MAX_PIXELS / 1000000.0)
+        raise ImageValidationError(file_upload_too_large)
+
+    return ImageInfo(filetypes[0], width, height)
+
+
+def validate_image(uploaded_file, minimum_width, minimum_height):
     """
-    Raises ImageValidationError if the uploaded file is not at least as wide
-    and tall as the specified dimensions.
+    Raises ImageValidationError if the server should refuse to use this
+    uploaded file, either because of its apparent type/metadata, or because it
+    is not at least as wide and tall as the specified dimensions.  Otherwise,
+    returns nothing.  See `inspect_image`.
 
     Arguments:
         uploaded_file (UploadedFile): A user-supplied image file
@@ -112,11 +179,10 @@ def validate_image_size(uploaded_file, minimum_width, minimum_height):
         None
 
     Raises:
-        ImageValidationError:
-            when the image file is an unsupported or invalid type.
+        ImageValidationError
     """
-    image_width, image_height = Image.open(uploaded_file).size
-    if image_width < minimum_width or image_height < minimum_height:
+    image_info = inspect_image(uploaded_file)
+    if image_info.width < minimum_width or image_info.height < minimum_height:
         file_upload_too_small = _(
             u'The file must be at least {minimum_width} pixels wide '
             u'and {minimum_height} pixels high.'
@@ -124,19 +190,61 @@ def validate_image_size(uploaded_file, minimum_width, minimum_height):
         raise ImageValidationError(file_upload_too_small)
 
 
-def crop_image_to_aspect_ratio(image, aspect_ratio):
+def validate_image_type(uploaded_file):
     """
-    Given a PIL.Image object, return a copy cropped horizontally around the
-    center and vertically from the top, using the specified aspect ratio.
+    Raises ImageValidationError if the server should refuse to use this
+    uploaded file based on its apparent type/metadata.  Otherwise, returns
+    nothing.  See `inspect_image`.
 
     Arguments:
-        image (Image): a PIL.Image
+
+        uploaded_file (UploadedFile): A user-supplied image file
+
+    Returns:
+        None
+
+    Raises:
+        ImageValidationError:
+            when the image file is an unsupported or invalid type.
+    """
+    inspect_image(uploaded_file)
+
+
+def validate_image_size(uploaded_file, minimum_width, minimum_height):
+    """
+    Raises ImageValidationError if the uploaded file is not at least as wide
+    and tall as the specified dimensions.  Since the dimensions are found by
+    `inspect_image`, this also validates the type of the file, and so is
+    equivalent to `validate_image`.
+
+    Arguments:
+        uploaded_file (UploadedFile): A user-supplied image file
+        minimum_width (int): minimum width of the image in pixels
+        minimum_height (int): minimum height of the image in pixels
+
+    Returns:
+        None
+
+    Raises:
+        ImageValidationError:
+            when the image file is an unsupported or invalid type, or too small.
+    """
+    validate_image(uploaded_file, minimum_width, minimum_height)
+
+
+def get_crop_box(image_size, aspect_ratio):
+    """
+    Given the dimensions of an image, return the box to which it is cropped
+    by `crop_image_to_aspect_ratio`.
+
+    Arguments:
+        image_size (tuple(int, int)): the width and height of the image.
         aspect_ratio (float): desired aspect ratio of the cropped image.
 
     Returns:
-        Image
+        tuple(int, int, int, int): the left, top, right and bottom of the box.
     """
-    width, height = image.size
+    width, height = image_size
     current_ratio = float(width) / float(height)
 
     # defaults
@@ -154,12 +262,25 @@ def crop_image_to_aspect_ratio(image, aspect_ratio):
         # image is too tall and must be cropped vertically (from top)
         bottom = width // aspect_ratio
     else:
-        # cropping will be a no-op but we'll go ahead, since we promised to
-        # return a copy of the input image.
+        # cropping will be a no-op.
         pass
 
-    image = image.crop(map(int, (left, top, right, bottom)))
-    return image
+    return tuple(map(int, (left, top, right, bottom)))
+
+
+def crop_image_to_aspect_ratio(image, aspect_ratio):
+    """
+    Given a PIL.Image object, return a copy cropped horizontally around the
+    center and vertically from the top, using the specified aspect ratio.
+
+    Arguments:
+        image (Image): a PIL.Image
+        aspect_ratio (float): desired aspect ratio of the cropped image.
+
+    Returns:
+        Image
+    """
+    return image.crop(get_crop_box(image.size, aspect_ratio))
 
 
 def set_color_mode_to_rgb(image):
@@ -190,6 +311,85 @@ def scale_image(image, width, height):
     return image.resize((width, height), Image.ANTIALIAS)
 
 
+def get_pixel_memory(image):
+    """
+    Estimate the memory (in bytes) occupied by the pixels of a PIL.Image
+    object, which stores multi-band pixels in 4 bytes.
+
+    Arguments:
+        image (Image)
+
+    Returns:
+        int
+    """
+    width, height = image.size
+    return width * height * (1 if len(image.getbands()) == 1 else 4)
+
+
+def create_resized_images(image_file, sizes):
+    """
+    Given a file containing an image, return copies of it cropped to the
+    aspect ratio of the given sizes and resized to each of them.
+
+    The image is decoded only once.  When it is a JPEG, it is decoded at the
+    smallest scale (down to 1/8) which still leaves the cropped image at least
+    as large as the largest size (see `PIL.Image.draft`), which is much faster
+    and uses far less memory than decoding it at full resolution.  Each copy
+    is then resized from the next larger copy, rather than from the original.
+
+    The time taken and an estimate of the peak memory used by pixel data are
+    logged for each image.
+
+    Arguments:
+        image_file (file): a file containing an image.
+        sizes: a sequence of tuples of (width, height), which must all have the
+            same aspect ratio.
+
+    Returns:
+        list of tuples of ((width, height), Image), largest first.
+    """
+    start = time.time()
+    sizes = sorted(sizes, reverse=True)
+    max_width, max_height = sizes[0]
+
+    aspect_ratio = float(max_width) / float(max_height)
+
+    image = Image.open(image_file)
+    original_size = image.size
+    left, top, right, bottom = get_crop_box(original_size, aspect_ratio)
+    scale = min(float(right - left) / max_width, float(bottom - top) / max_height)
+    if scale > 1:
+        # both dimensions are given, since PIL picks the scale by whichever of them is reduced the most.
+        image.draft('RGB', tuple(int(math.ceil(dim / scale)) for dim in original_size))
+    image.load()
+    decoded_size = image.size
+
+    # cropping before converting the color mode (if needed) only converts the pixels which are kept.
+    cropped = crop_image_to_aspect_ratio(image, aspect_ratio)
+    peak_memory = get_pixel_memory(image) + get_pixel_memory(cropped)
+    del image
+    if cropped.mode != 'RGB':
+        converted = set_color_mode_to_rgb(cropped)
+        peak_memory = max(peak_memory, get_pixel_memory(cropped) + get_pixel_memory(converted))
+        cropped = converted
+
+    resized_images = []
+    source = cropped
+    for size in sizes:
+        source = scale_image(source, *size)
+        resized_images.append((size, source))
+    # the smaller copies take less memory between them than the cropped image, which is released by now.
+    peak_memory = max(peak_memory, get_pixel_memory(cropped) + get_pixel_memory(resized_images[0][1]))
+    del cropped
+
+    LOG.info(
+        'Resized %dx%d image (decoded at %dx%d) to %d sizes in %.1fms, using up to %.1fMB for pixel data.',
+        original_size[0], original_size[1], decoded_size[0], decoded_size[1], len(sizes),
+        (time.time() - start) * 1000, peak_memory / 1024.0 / 1024.0,
+    )
+    return resized_images
+
+
 def create_image_file(image):
     """
     Given a PIL.Image object, create and return a file-like object containing
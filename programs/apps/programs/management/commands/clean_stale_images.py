@@ -0,0 +1,55 @@
+# pylint: disable=missing-docstring
+import logging
+
+from django.apps import apps
+from django.core.management import BaseCommand
+
+from programs.apps.programs.fields import ResizingImageField
+
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = (
+        'Delete the stale images (and their resized copies) stored for every image field which records them in a '
+        'manifest.  Run with --backfill once, to record images stored before the manifest was in use.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--backfill',
+            action='store_true',
+            dest='backfill',
+            default=False,
+            help='First record any images missing from the manifest, by listing the storage.'
+        )
+        parser.add_argument(
+            '--delete-previous',
+            action='store_false',
+            dest='keep_previous',
+            default=True,
+            help='Also delete the image stored before the current one.'
+        )
+
+    def _clean(self, model, field, backfill, keep_previous):
+        queryset = model.objects.exclude(**{field.name: ''}).exclude(**{field.name + '__isnull': True})
+
+        total = recorded = 0
+        for instance in queryset.iterator():
+            total += 1
+            field_value = getattr(instance, field.attname)
+            if backfill:
+                recorded += field_value.record_listed_images()
+            field_value.clean_stale_images(keep_previous=keep_previous)
+
+        logger.info(
+            'Cleaned stale images of %d %s.%s values, after recording %d unlisted files.',
+            total, model.__name__, field.name, recorded
+        )
+
+    def handle(self, *args, **options):
+        for model in apps.get_app_config('programs').get_models():
+            for field in model._meta.fields:  # pylint: disable=protected-access
+                if isinstance(field, ResizingImageField) and field.manifest is not None:
+                    self._clean(model, field, options.get('backfill'), options.get('keep_previous'))
@@ -0,0 +1,68 @@
+# pylint: disable=missing-docstring
+import logging
+
+from django.apps import apps
+from django.core.management import BaseCommand
+
+from programs.apps.programs.fields import create_pending_resized_copies, ResizingImageField
+
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = (
+        'Rebuild the stored URLs of resized image copies. '
+        'Run this after changing MEDIA_URL or the media storage (e.g. bucket) settings, '
+        'or with --pending to generate resized copies left pending by background workers which exited.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '-f', '--force',
+            action='store_true',
+            dest='force',
+            default=False,
+            help='Rebuild stored URLs even where they are valid for the current storage configuration.'
+        )
+        parser.add_argument(
+            '--pending',
+            action='store_true',
+            dest='pending',
+            default=False,
+            help='Generate (in this process) the resized copies of images which are still marked as pending.'
+        )
+
+    def _rebuild(self, model, field, force, pending):
+        queryset = model.objects.exclude(**{field.name: ''}).exclude(**{field.name + '__isnull': True})
+
+        total = rebuilt = generated = 0
+        for instance in queryset.iterator():
+            total += 1
+            field_value = getattr(instance, field.attname)
+            if field_value.resized_copies_pending:
+                if pending:
+                    # this stores the URLs once the copies exist, as the background workers would.
+                    create_pending_resized_copies(model, instance.pk, field.name, field_value.name)
+                    generated += 1
+                # otherwise, the background workers will store the URLs once the copies exist.
+                continue
+            if not force and field_value.stored_resized_urls is not None:
+                continue
+
+            field_value.store_resized_urls()
+            # only the stored URLs are written (along with the modified time, since the rendered URLs change, so that
+            # conditional GETs do not keep serving the old ones); this does not regenerate images.
+            instance.save(update_fields=field.get_resized_urls_update_fields())
+            rebuilt += 1
+
+        logger.info(
+            'Rebuilt stored URLs for %d and generated pending copies for %d of %d %s.%s values.',
+            rebuilt, generated, total, model.__name__, field.name
+        )
+
+    def handle(self, *args, **options):
+        for model in apps.get_app_config('programs').get_models():
+            for field in model._meta.fields:  # pylint: disable=protected-access
+                if isinstance(field, ResizingImageField) and field.resized_urls_field:
+                    self._rebuild(model, field, options.get('force'), options.get('pending'))
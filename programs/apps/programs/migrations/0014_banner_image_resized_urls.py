@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import programs.apps.programs.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('programs', '0013_auto_20160725_2147'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='program',
+            name='banner_image_resized_urls',
+            field=models.TextField(default=b'', help_text='The URLs of the resized copies of the banner image, as last generated.', editable=False, blank=True),
+        ),
+        migrations.AddField(
+            model_name='programdefault',
+            name='banner_image_resized_urls',
+            field=models.TextField(default=b'', help_text='The URLs of the resized copies of the banner image, as last generated.', editable=False, blank=True),
+        ),
+        migrations.AlterField(
+            model_name='program',
+            name='banner_image',
+            field=programs.apps.programs.fields.ResizingImageField(sizes=[(1440, 480), (726, 242), (435, 145), (348, 116)], resized_urls_field=b'banner_image_resized_urls', path_template=b'program/banner/{uuid}', upload_to=b'', max_length=1000, blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='programdefault',
+            name='banner_image',
+            field=programs.apps.programs.fields.ResizingImageField(sizes=[(1440, 480), (726, 242), (435, 145), (348, 116)], resized_urls_field=b'banner_image_resized_urls', path_template=b'program/banner/default', upload_to=b'', max_length=1000, blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('programs', '0014_banner_image_resized_urls'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProgramDocument',
+            fields=[
+                ('program', models.OneToOneField(related_name='document', primary_key=True, serialize=False, to='programs.Program')),
+                ('version', models.CharField(default=b'', help_text='Replaced whenever the data this document is built from changes.', max_length=32)),
+                ('document_version', models.CharField(help_text='The version at which the document was built.', max_length=32, null=True)),
+                ('document', models.TextField(default=b'', blank=True)),
+            ],
+        ),
+    ]
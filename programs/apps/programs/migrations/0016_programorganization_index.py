@@ -0,0 +1,22 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('programs', '0015_programdocument'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='programorganization',
+            options={},
+        ),
+        migrations.AlterIndexTogether(
+            name='programorganization',
+            index_together=set([('organization', 'program')]),
+        ),
+    ]
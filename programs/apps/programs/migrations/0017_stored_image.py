@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.utils.timezone
+import programs.apps.programs.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('programs', '0016_programorganization_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StoredImage',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('directory', models.CharField(help_text='The directory of the file in storage, which is unique to the model instance it was stored for.', max_length=255)),
+                ('name', models.CharField(help_text='The name of the file in storage.', max_length=1000)),
+                ('original_name', models.CharField(help_text='The name of the uploaded image which this file is, or is a resized copy of.', max_length=1000)),
+                ('size', models.PositiveIntegerField(help_text='The size of the file, in bytes.')),
+                ('created', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='program',
+            name='banner_image',
+            field=programs.apps.programs.fields.ResizingImageField(sizes=[(1440, 480), (726, 242), (435, 145), (348, 116)], resized_urls_field=b'banner_image_resized_urls', path_template=b'program/banner/{uuid}', upload_to=b'', max_length=1000, blank=True, null=True, manifest_model=b'programs.StoredImage'),
+        ),
+        migrations.AlterField(
+            model_name='programdefault',
+            name='banner_image',
+            field=programs.apps.programs.fields.ResizingImageField(sizes=[(1440, 480), (726, 242), (435, 145), (348, 116)], resized_urls_field=b'banner_image_resized_urls', path_template=b'program/banner/default', upload_to=b'', max_length=1000, blank=True, null=True, manifest_model=b'programs.StoredImage'),
+        ),
+        migrations.AlterIndexTogether(
+            name='storedimage',
+            index_together=set([('directory', 'created')]),
+        ),
+    ]
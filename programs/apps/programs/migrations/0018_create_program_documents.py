@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+from uuid import uuid4
+
+from django.db import migrations
+
+
+def create_program_documents(apps, schema_editor):
+    """
+    Create the document row of every program without one, so that changes to it always have a row to invalidate.
+    """
+    Program = apps.get_model('programs', 'Program')
+    ProgramDocument = apps.get_model('programs', 'ProgramDocument')
+    ProgramDocument.objects.bulk_create(
+        ProgramDocument(program_id=program_id, version=uuid4().hex)
+        for program_id in Program.objects.filter(document__isnull=True).values_list('id', flat=True)
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('programs', '0017_stored_image'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_program_documents, reverse_code=migrations.RunPython.noop),
+    ]
@@ -0,0 +1,22 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('programs', '0018_create_program_documents'),
+    ]
+
+    operations = [
+        migrations.AlterIndexTogether(
+            name='coursecode',
+            index_together=set([('modified', 'id')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='program',
+            index_together=set([('status', 'category'), ('modified', 'id')]),
+        ),
+    ]
@@ -2,8 +2,12 @@
 # pylint: disable=model-missing-unicode,no-member
 from uuid import uuid4
 
-from django.db import models
+from django.conf import settings
+from django.core.cache import cache
+from django.db import models, transaction
+from django.db.models import signals
 from django.core.exceptions import ValidationError
+from django.utils import timezone
 from django.utils.translation import ugettext_lazy as _
 from django_extensions.db.models import TimeStampedModel
 from opaque_keys import InvalidKeyError
@@ -83,11 +87,21 @@ class Program(TimeStampedModel):
     banner_image = ResizingImageField(
         path_template='program/banner/{uuid}',
         sizes=RESIZABLE_IMAGE_SIZES,
+        resized_urls_field='banner_image_resized_urls',
+        manifest_model='programs.StoredImage',
         null=True,
         blank=True,
         max_length=1000,
     )
 
+    # NOTE: this must be declared after banner_image (see ResizingImageField).
+    banner_image_resized_urls = models.TextField(
+        help_text=_('The URLs of the resized copies of the banner image, as last generated.'),
+        blank=True,
+        default='',
+        editable=False,
+    )
+
     def save(self, *a, **kw):
         """
         Verify that the marketing slug is not empty if the user has attempted
@@ -102,7 +116,8 @@ class Program(TimeStampedModel):
         return super(Program, self).save(*a, **kw)
 
     class Meta(object):  # pylint: disable=missing-docstring
-        index_together = ('status', 'category')
+        # the latter covers the keyset pagination of the programs list (see KeysetPagination).
+        index_together = (('status', 'category'), ('modified', 'id'))
 
     def __unicode__(self):
         return unicode(self.name)
@@ -140,6 +155,10 @@ class ProgramOrganization(TimeStampedModel):
     program = models.ForeignKey(Program)
     organization = models.ForeignKey(Organization)
 
+    class Meta(object):  # pylint: disable=missing-docstring
+        # covers the lookup of the programs offered by an organization (see ProgramOrgKeyFilterBackend).
+        index_together = ('organization', 'program')
+
     # TODO: we may need validation to ensure that you cannot remove a program's
     # org association if the program contains course codes that are associated
     # with that org.
@@ -180,6 +199,8 @@ class CourseCode(TimeStampedModel):
 
     class Meta(object):  # pylint: disable=missing-docstring
         unique_together = ('organization', 'key')
+        # covers the keyset pagination of the course codes list (see KeysetPagination).
+        index_together = ('modified', 'id')
 
     def __unicode__(self):
         return unicode(self.display_name)
@@ -200,19 +221,51 @@ class ProgramCourseCode(TimeStampedModel):
     def __unicode__(self):
         return unicode(self.course_code)
 
+    @classmethod
+    def allocate_positions(cls, program_course_codes):
+        """
+        Validate m2m cardinality and set the positions of new (unsaved) rows, which must all belong to
+        the same program.  Positions follow the highest existing position, in the order given.
+
+        This costs two queries however many rows are given, both of which are locking reads, so the
+        caller must be in a transaction which also inserts the rows.  Concurrent allocations for the
+        same program are thus serialized, and never collide on the (program, position) constraint.
+
+        Raises:
+            ValidationError: if any course code is not offered by an organization offering the program.
+        """
+        if not program_course_codes:
+            return
+        program_id = program_course_codes[0].program_id
+
+        # before creating, ensure that the program has an association with the same org as each course code.
+        # locking these associations (which are required for any row to be valid) serializes allocators.
+        organization_ids = set(
+            ProgramOrganization.objects.select_for_update().filter(
+                program_id=program_id
+            ).values_list('organization_id', flat=True)
+        )
+        if any(pcc.course_code.organization_id not in organization_ids for pcc in program_course_codes):
+            raise ValidationError(_('Course code must be offered by the same organization offering the program.'))
+
+        # automatically set position attribute for new rows.  a locking read (unlike an aggregate) sees
+        # the rows committed by any allocator which held the lock before.
+        max_position = cls.objects.select_for_update().filter(program_id=program_id).order_by(
+            '-position'
+        ).values_list('position', flat=True).first()
+        for offset, program_course_code in enumerate(program_course_codes, start=1):
+            program_course_code.position = (max_position or 0) + offset
+
     def save(self, *a, **kw):
         """
         Override save() to validate m2m cardinality and automatically set the position for a new row.
         """
-        if self.position is None:
-            # before creating, ensure that the program has an association with the same org as this course code
-            if not ProgramOrganization.objects.filter(
-                    program=self.program, organization=self.course_code.organization).exists():
-                raise ValidationError(_('Course code must be offered by the same organization offering the program.'))
-            # automatically set position attribute for a new row
-            res = ProgramCourseCode.objects.filter(program=self.program).aggregate(max_position=models.Max('position'))
-            self.position = (res['max_position'] or 0) + 1
-        return super(ProgramCourseCode, self).save(*a, **kw)
+        if self.position is not None:
+            return super(ProgramCourseCode, self).save(*a, **kw)
+
+        with transaction.atomic():
+            self.allocate_positions([self])
+            return super(ProgramCourseCode, self).save(*a, **kw)
 
 
 class ProgramCourseRunMode(TimeStampedModel):
@@ -272,13 +325,60 @@ class ProgramCourseRunMode(TimeStampedModel):
         ).exclude(id=self.id).exists():  # pylint: disable=no-member
             raise ValidationError(_('Duplicate course run modes are not allowed for course codes in a program.'))
 
+        self.derive_run_key()
+        return super(ProgramCourseRunMode, self).save()
+
+    def derive_run_key(self):
+        """
+        Set the run key from the course key.
+
+        Raises:
+            ValidationError: if the course key is invalid.
+        """
         try:
             course_key = CourseKey.from_string(self.course_key)
             self.run_key = course_key.run
         except InvalidKeyError:
             raise ValidationError(_("Invalid course key."))
 
-        return super(ProgramCourseRunMode, self).save()
+    @classmethod
+    def validate_bulk(cls, run_modes):
+        """
+        Perform the validation of save() for many run modes at once, for use when they are written in bulk:
+        the run modes are checked for duplicates among themselves in memory, and against all other stored
+        run modes with a single query.  The run key of each run mode is derived in the same pass.
+
+        Arguments:
+            run_modes: the run modes about to be written, new or existing.
+
+        Raises:
+            ValidationError: if any of the run modes is a duplicate, or has an invalid course key.
+        """
+        unique_attrs = set()
+        run_keys = {}
+        for run_mode in run_modes:
+            attrs = (run_mode.program_course_code_id, run_mode.course_key, run_mode.mode_slug, run_mode.sku)
+            if attrs in unique_attrs:
+                raise ValidationError(_('Duplicate course run modes are not allowed for course codes in a program.'))
+            unique_attrs.add(attrs)
+
+            # run modes of one course run share a course key, so each is only parsed once.
+            if run_mode.course_key not in run_keys:
+                run_mode.derive_run_key()
+                run_keys[run_mode.course_key] = run_mode.run_key
+            run_mode.run_key = run_keys[run_mode.course_key]
+
+        if not unique_attrs:
+            return
+
+        stored_attrs = cls.objects.filter(
+            program_course_code_id__in=set(attrs[0] for attrs in unique_attrs),
+            course_key__in=set(attrs[1] for attrs in unique_attrs),
+        ).exclude(
+            id__in=[run_mode.id for run_mode in run_modes if run_mode.id is not None],
+        ).values_list('program_course_code_id', 'course_key', 'mode_slug', 'sku')
+        if any(attrs in unique_attrs for attrs in stored_attrs):
+            raise ValidationError(_('Duplicate course run modes are not allowed for course codes in a program.'))
 
 
 class ProgramDefault(SingletonModel):
@@ -288,10 +388,142 @@ class ProgramDefault(SingletonModel):
     used if a given program has not specified its own banner image.
     This model is a singleton - only one instance exists.
     """
+    BANNER_IMAGE_URLS_CACHE_KEY = 'programs.program_default.banner_image_urls'
+
     banner_image = ResizingImageField(
         path_template='program/banner/default',
         sizes=RESIZABLE_IMAGE_SIZES,
+        resized_urls_field='banner_image_resized_urls',
+        manifest_model='programs.StoredImage',
         null=True,
         blank=True,
         max_length=1000,
     )
+
+    # NOTE: this must be declared after banner_image (see ResizingImageField).
+    banner_image_resized_urls = models.TextField(
+        help_text=_('The URLs of the resized copies of the banner image, as last generated.'),
+        blank=True,
+        default='',
+        editable=False,
+    )
+
+    @classmethod
+    def get_banner_image_urls(cls):
+        """
+        Return the URLs of the resized copies of the default banner image (if
+        any), in a dictionary keyed by tuples of (width, height).
+
+        The result is cached until the singleton is next saved or deleted, so
+        rendering the default banner does not cost any queries.  Since that
+        invalidation does not reach the caches of other processes unless the
+        cache backend is shared, entries also expire after
+        `settings.DEFAULT_BANNER_IMAGE_URLS_CACHE_TIMEOUT` seconds.
+
+        Returns:
+            dict
+        """
+        urls = cache.get(cls.BANNER_IMAGE_URLS_CACHE_KEY)
+        if urls is None:
+            try:
+                urls = cls.objects.get().banner_image.resized_urls
+            except cls.DoesNotExist:
+                urls = {}
+            cache.set(cls.BANNER_IMAGE_URLS_CACHE_KEY, urls, settings.DEFAULT_BANNER_IMAGE_URLS_CACHE_TIMEOUT)
+        return urls
+
+
+def invalidate_banner_image_urls(sender, **kwargs):  # pylint: disable=unused-argument
+    """
+    Invalidate the cached default banner image URLs.
+    """
+    cache.delete(ProgramDefault.BANNER_IMAGE_URLS_CACHE_KEY)
+
+
+signals.post_save.connect(invalidate_banner_image_urls, sender=ProgramDefault)
+signals.post_delete.connect(invalidate_banner_image_urls, sender=ProgramDefault)
+
+
+class ProgramDocument(models.Model):
+    """
+    The precomputed API representation of a program, including all of its
+    nested data, stored as JSON so that it can be served with a single query.
+
+    Documents are created along with their program, invalidated (by replacing
+    `version`) in the same transaction as any change to the rows they were
+    built from, and rebuilt after the change, or when next read.  A document
+    is current only while `document_version` matches `version`; see
+    `programs.apps.api.documents`.
+    """
+    program = models.OneToOneField(Program, primary_key=True, related_name='document')
+    version = models.CharField(
+        help_text=_('Replaced whenever the data this document is built from changes.'),
+        max_length=32,
+        default='',
+    )
+    document_version = models.CharField(
+        help_text=_('The version at which the document was built.'),
+        max_length=32,
+        null=True,
+    )
+    document = models.TextField(blank=True, default='')
+
+    @property
+    def is_current(self):
+        """
+        Return True if the document reflects the current data of its program.
+        """
+        return self.document_version == self.version
+
+    def __unicode__(self):
+        return unicode(self.program_id)
+
+
+class StoredImage(models.Model):
+    """
+    A manifest entry for a file stored by a ResizingImageField: either an
+    uploaded image or one of its resized copies.  Stale images are found by
+    querying this manifest, rather than by listing and inspecting the storage;
+    see `ResizingImageFieldFile.clean_stale_images`.
+    """
+    directory = models.CharField(
+        help_text=_('The directory of the file in storage, which is unique to the model instance it was stored for.'),
+        max_length=255,
+    )
+    name = models.CharField(help_text=_('The name of the file in storage.'), max_length=1000)
+    original_name = models.CharField(
+        help_text=_('The name of the uploaded image which this file is, or is a resized copy of.'),
+        max_length=1000,
+    )
+    size = models.PositiveIntegerField(help_text=_('The size of the file, in bytes.'))
+    created = models.DateTimeField(default=timezone.now)
+
+    class Meta(object):  # pylint: disable=missing-docstring
+        index_together = ('directory', 'created')
+
+    @classmethod
+    def get_stale(cls, directory, current_name, keep_previous=True):
+        """
+        Return the stale images in the given directory: every image uploaded
+        before the current one (except for the one uploaded just before it, if
+        `keep_previous`), along with their resized copies.  Nothing is stale if
+        the current image is not in the manifest.
+
+        Arguments:
+            directory (basestring): the directory of the images.
+            current_name (basestring): the name of the current uploaded image.
+            keep_previous (bool): whether to keep the image uploaded before the current one.
+
+        Returns:
+            list of StoredImage
+        """
+        images = list(cls.objects.filter(directory=directory).order_by('-created', '-id'))
+        originals = [image.name for image in images if image.name == image.original_name]
+        if current_name not in originals:
+            return []
+
+        kept = originals[:originals.index(current_name) + (2 if keep_previous else 1)]
+        return [image for image in images if image.original_name not in kept]
+
+    def __unicode__(self):
+        return self.name
@@ -0,0 +1,83 @@
+# pylint: disable=missing-docstring
+import os
+import time
+
+from django.core.management import call_command
+from django.test import TestCase
+import mock
+
+from programs.apps.programs.fields import ResizingImageField, ResizingImageFieldFile
+from programs.apps.programs.models import RESIZABLE_IMAGE_SIZES, StoredImage
+from programs.apps.programs.tests.factories import ProgramFactory
+from programs.apps.programs.tests.helpers import make_banner_image_file
+
+
+class CleanStaleImagesTests(TestCase):
+    """Tests for the manifest of stored images, and the clean_stale_images management command."""
+
+    def setUp(self):
+        super(CleanStaleImagesTests, self).setUp()
+        self.program = ProgramFactory.create()
+        self.directory = 'program/banner/{}'.format(self.program.uuid)
+        self.storage = self.program.banner_image.storage
+
+    def _upload(self, count):
+        names = []
+        for index in range(count):
+            self.program.banner_image = make_banner_image_file('banner_{}.jpg'.format(index))
+            self.program.save()
+            names.append(self.program.banner_image.name)
+        return names
+
+    def _get_group(self, original_name):
+        return sorted([original_name] + self.program.banner_image.field.get_resized_names(original_name).values())
+
+    def assert_stored(self, original_names):
+        expected_names = sorted(sum((self._get_group(name) for name in original_names), []))
+        self.assertEqual(
+            sorted(os.path.join(self.directory, name) for name in self.storage.listdir(self.directory)[1]),
+            expected_names,
+        )
+        self.assertEqual(
+            sorted(StoredImage.objects.filter(directory=self.directory).values_list('name', flat=True)),
+            expected_names,
+        )
+
+    def test_recorded_on_upload(self):
+        """Uploads and their copies are recorded, and stale ones are cleaned up without listing the storage."""
+        with mock.patch.object(self.storage, 'listdir') as mock_listdir:
+            with mock.patch.object(self.storage, 'modified_time') as mock_modified_time:
+                names = self._upload(3)
+
+        self.assertFalse(mock_listdir.called or mock_modified_time.called)
+        self.assert_stored(names[1:])
+        original = StoredImage.objects.get(name=names[-1])
+        self.assertEqual(original.original_name, names[-1])
+        self.assertEqual(original.size, self.storage.size(names[-1]))
+        self.assertEqual(StoredImage.objects.filter(original_name=names[-1]).count(), len(RESIZABLE_IMAGE_SIZES) + 1)
+
+    def test_clean(self):
+        names = self._upload(3)
+        call_command('clean_stale_images', keep_previous=False)
+        self.assert_stored(names[2:])
+
+    def test_backfill(self):
+        """Images stored before the manifest was in use are recorded, by their modified times, and cleaned up."""
+        with mock.patch.object(ResizingImageField, 'manifest', None):
+            with mock.patch.object(ResizingImageFieldFile, 'clean_stale_images'):
+                names = self._upload(3)
+        self.assertFalse(StoredImage.objects.exists())
+
+        # set the modified times of the uploads a minute apart, so that they are ordered without ties.
+        now = time.time()
+        for index, name in enumerate(names):
+            os.utime(self.storage.path(name), (now, now + 60 * index))
+
+        call_command('clean_stale_images')
+        self.assertFalse(StoredImage.objects.exists())
+
+        call_command('clean_stale_images', backfill=True)
+        self.assert_stored(names[1:])
+
+        call_command('clean_stale_images', backfill=True)
+        self.assert_stored(names[1:])
@@ -1,16 +1,24 @@
 """
 Tests for custom fields.
 """
+from contextlib import closing
 import itertools
+import json
 import random
+import shutil
+import tempfile
 
+from django.core.files.storage import FileSystemStorage
 from django.test import override_settings, TestCase
 import ddt
 import mock
 from PIL import Image
 
-from programs.apps.programs.fields import ResizingImageField, ResizingImageFieldFile
-from .helpers import make_image_file, make_uploaded_file
+from programs.apps.programs import image_helpers, workers
+from programs.apps.programs.fields import get_storage_fingerprint, ResizingImageField, ResizingImageFieldFile
+from programs.apps.programs.models import Program, RESIZABLE_IMAGE_SIZES
+from .factories import ProgramFactory
+from .helpers import make_banner_image_file, make_image_file, make_uploaded_file
 
 TEST_SIZES = [(1, 1), (999, 999)]
 PATCH_MODULE = 'programs.apps.programs.fields'
@@ -76,6 +84,62 @@ class ResizingImageFieldFileTestCase(TestCase):
         field_value = ResizingImageFieldFile(self.model_instance, self.field, None)
         self.assertEqual(field_value.resized_urls, {})
 
+    def _make_stored_field_value(self, name):
+        """
+        Create a field value for a field which stores its resized URLs on the model instance.
+        """
+        field = ResizingImageField('test-path', TEST_SIZES, resized_urls_field='resized_urls_data')
+        model_instance = mock.Mock(resized_urls_data='')
+        return ResizingImageFieldFile(model_instance, field, name)
+
+    def test_store_resized_urls(self):
+        """
+        Ensure that stored resized URLs are served without calling the storage backend.
+        """
+        field_value = self._make_stored_field_value('path/to/test-filename')
+        expected_urls = field_value.resized_urls
+        field_value.store_resized_urls()
+        self.assertEqual(
+            json.loads(field_value.instance.resized_urls_data)['urls'],
+            {
+                '1x1': '/test/media/url/path/to/test-filename__1x1.jpg',
+                '999x999': '/test/media/url/path/to/test-filename__999x999.jpg',
+            }
+        )
+
+        with mock.patch.object(field_value.storage, 'url') as mock_url:
+            self.assertEqual(field_value.resized_urls, expected_urls)
+            self.assertFalse(mock_url.called)
+
+    def test_stored_resized_urls_stale(self):
+        """
+        Ensure that stored resized URLs are ignored when the storage configuration or file name changes.
+        """
+        field_value = self._make_stored_field_value('path/to/test-filename')
+        field_value.store_resized_urls()
+        self.assertIsNotNone(field_value.stored_resized_urls)
+
+        with override_settings(MEDIA_URL='https://example.com/media/'):
+            self.assertIsNone(field_value.stored_resized_urls)
+            self.assertEqual(
+                field_value.resized_urls[(1, 1)],
+                'https://example.com/media/path/to/test-filename__1x1.jpg',
+            )
+
+        field_value.name = 'path/to/other-filename'
+        self.assertIsNone(field_value.stored_resized_urls)
+        self.assertEqual(field_value.resized_urls[(1, 1)], '/test/media/url/path/to/other-filename__1x1.jpg')
+
+    def test_stored_resized_urls_signed(self):
+        """
+        Ensure that URLs are not stored if the storage backend signs them.
+        """
+        field_value = self._make_stored_field_value('path/to/test-filename')
+        with mock.patch.object(field_value, 'storage', mock.Mock(querystring_auth=True)):
+            self.assertIsNone(get_storage_fingerprint(field_value.storage))
+            field_value.store_resized_urls()
+        self.assertEqual(field_value.instance.resized_urls_data, '')
+
     def test_minimum_original_size(self):
         """
         Ensure the minimum original size is computed correctly.
@@ -83,6 +147,8 @@ class ResizingImageFieldFileTestCase(TestCase):
         field_value = ResizingImageFieldFile(self.model_instance, self.field, None)
         self.assertEqual(field_value.minimum_original_size, (999, 999))
 
+    # mocks do not record concurrent calls reliably; concurrent saves are tested by SaveResizedCopiesTestCase.
+    @override_settings(RESIZED_IMAGES_UPLOAD_THREADS=1)
     def test_create_resized_copies(self):
         """
         Ensure the create_resized_copies function produces and stores copies
@@ -167,15 +233,14 @@ class ResizingImageFieldTestCase(TestCase):
             'testing/test-attr/path/test-filename'
         )
 
-    @mock.patch(PATCH_MODULE + '.validate_image_type')
-    @mock.patch(PATCH_MODULE + '.validate_image_size')
+    @mock.patch(PATCH_MODULE + '.validate_image')
     @ddt.data(
         (None, False),
         ('test-filename', False),
         ('test-filename', True),
     )
     @ddt.unpack
-    def test_pre_save(self, filename, is_existing_file, mock_validate_size, mock_validate_type):
+    def test_pre_save(self, filename, is_existing_file, mock_validate):
         """
         Ensure that image validation and resizing take place only when a new
         file is being stored.
@@ -196,7 +261,7 @@ class ResizingImageFieldTestCase(TestCase):
                 self.field.pre_save(self.model_instance, False)
 
         expected_called = bool(filename) and not is_existing_file
-        for actual_called in (mock_validate_size.called, mock_validate_type.called, mock_resize.called):
+        for actual_called in (mock_validate.called, mock_resize.called):
             self.assertEqual(actual_called, expected_called)
 
     def test_upload_to(self):
@@ -214,3 +279,164 @@ class ResizingImageFieldTestCase(TestCase):
             exc_context.exception.message,
             'ResizingImageField does not support passing a custom callable for the `upload_to` keyword arg.',
         )
+
+
+@override_settings(MEDIA_URL='/test/media/url/', RESIZED_IMAGES_ASYNC=True)
+class BackgroundResizingTestCase(TestCase):
+    """
+    Test the generation of resized copies by background workers.
+    """
+
+    def _save_banner_image(self, program, filename):
+        """
+        Store a new banner image for the given program, returning the call which submitted its resized copies.
+        """
+        with mock.patch('programs.apps.programs.workers.submit') as mock_submit:
+            program.banner_image = make_banner_image_file(filename)
+            program.save()
+        self.assertEqual(mock_submit.call_count, 1)
+        return mock_submit.call_args[0]
+
+    def test_pending(self):
+        """
+        Ensure that resized copies are marked as pending (with no URLs served) until the workers have stored them.
+        """
+        program = ProgramFactory.create()
+        submitted = self._save_banner_image(program, 'test_banner.jpg')
+
+        program.refresh_from_db()
+        modified = program.modified
+        self.assertTrue(program.banner_image.resized_copies_pending)
+        self.assertEqual(program.banner_image.resized_urls, {})
+        for name in program.banner_image.resized_names.values():
+            self.assertFalse(program.banner_image.storage.exists(name))
+
+        with mock.patch.object(ResizingImageFieldFile, 'clean_stale_images') as mock_clean:
+            submitted[0](*submitted[1:])
+        self.assertTrue(mock_clean.called)
+
+        program.refresh_from_db()
+        # the URLs rendered for the program have changed, so must its modified time.
+        self.assertGreater(program.modified, modified)
+        self.assertFalse(program.banner_image.resized_copies_pending)
+        self.assertEqual(program.banner_image.resized_urls, program.banner_image.stored_resized_urls)
+        self.assertEqual(len(program.banner_image.resized_urls), len(RESIZABLE_IMAGE_SIZES))
+        for name in program.banner_image.resized_names.values():
+            self.assertTrue(program.banner_image.storage.exists(name))
+
+    def test_replaced(self):
+        """
+        Ensure that the workers do not store URLs for an image which has since been replaced.
+        """
+        program = ProgramFactory.create()
+        submitted = self._save_banner_image(program, 'first_banner.jpg')
+        self._save_banner_image(program, 'second_banner.jpg')
+        pending_value = Program.objects.get(pk=program.pk).banner_image_resized_urls
+
+        submitted[0](*submitted[1:])
+        self.assertEqual(Program.objects.get(pk=program.pk).banner_image_resized_urls, pending_value)
+
+    def test_not_resaved(self):
+        """
+        Ensure that saving an instance without storing a new image submits nothing.
+        """
+        program = ProgramFactory.create()
+        self._save_banner_image(program, 'test_banner.jpg')
+        with mock.patch('programs.apps.programs.workers.submit') as mock_submit:
+            program.save()
+            Program.objects.get(pk=program.pk).save()
+        self.assertFalse(mock_submit.called)
+
+    @override_settings(RESIZED_IMAGES_ASYNC=False)
+    def test_synchronous(self):
+        """
+        Ensure that resized copies are generated within the save when background resizing is disabled.
+        """
+        program = ProgramFactory.create()
+        with mock.patch('programs.apps.programs.workers.submit') as mock_submit:
+            program.banner_image = make_banner_image_file('test_banner.jpg')
+            program.save()
+        self.assertFalse(mock_submit.called)
+        self.assertFalse(program.banner_image.resized_copies_pending)
+        self.assertIsNotNone(program.banner_image.stored_resized_urls)
+
+
+@override_settings(RESIZED_IMAGES_UPLOAD_THREADS=4)
+class SaveResizedCopiesTestCase(TestCase):
+    """
+    Test saving resized copies to a local filesystem storage.
+    """
+
+    def setUp(self):
+        super(SaveResizedCopiesTestCase, self).setUp()
+        location = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, location)
+        self.storage = FileSystemStorage(location=location)
+        self.field = ResizingImageField('test-path', RESIZABLE_IMAGE_SIZES, storage=self.storage)
+        self.field_value = ResizingImageFieldFile(mock.Mock(), self.field, 'test-path/test_name.jpg')
+        with make_image_file((1500, 1000)) as image_file:
+            self.storage.save(self.field_value.name, image_file)
+
+    def _list_copies(self):
+        """
+        Return the names of the resized copies in storage.
+        """
+        return sorted(name for name in self.storage.listdir('test-path')[1] if '__' in name)
+
+    def test_save_resized_copies(self):
+        """
+        Ensure that every copy is saved, concurrently.
+        """
+        with mock.patch(PATCH_MODULE + '.workers.call_concurrently', wraps=workers.call_concurrently) as mock_call:
+            self.field_value.save_resized_copies()
+
+        self.assertEqual(mock_call.call_args[0][2], 4)
+        self.assertEqual(
+            self._list_copies(),
+            sorted('test_name.jpg__{}x{}.jpg'.format(*size) for size in RESIZABLE_IMAGE_SIZES),
+        )
+        for size, name in self.field_value.resized_names.items():
+            with closing(self.storage.open(name)) as image_file:
+                self.assertEqual(Image.open(image_file).size, size)
+
+    def test_save_resized_copies_error(self):
+        """
+        Ensure that when any copy fails to be saved, the others are deleted and the errors are raised together.
+        """
+        save = self.storage.save
+
+        def fail_small_copies(name, content):  # pylint: disable=missing-docstring
+            if name.endswith(('__435x145.jpg', '__348x116.jpg')):
+                raise IOError('Failed to save {}'.format(name))
+            return save(name, content)
+
+        with mock.patch.object(self.storage, 'save', side_effect=fail_small_copies):
+            with self.assertRaises(workers.ConcurrentCallsError) as context:
+                self.field_value.save_resized_copies()
+
+        self.assertEqual(len(context.exception.errors), 2)
+        self.assertEqual(len(context.exception.results), 2)
+        self.assertEqual(self._list_copies(), [])
+        self.assertTrue(self.storage.exists(self.field_value.name))
+
+
+class ValidationTestCase(TestCase):
+    """
+    Test the validation of newly stored images.
+    """
+
+    def test_inspected_once(self):
+        """
+        Ensure that an upload which has already been validated (e.g. by a form) is not inspected again when saved.
+        """
+        program = ProgramFactory.create()
+        banner_image = make_banner_image_file('test_banner.jpg')
+        with mock.patch(
+            'programs.apps.programs.image_helpers._inspect_image',
+            wraps=image_helpers._inspect_image,  # pylint: disable=protected-access
+        ) as mock_inspect:
+            image_helpers.validate_image(banner_image, *program.banner_image.minimum_original_size)
+            program.banner_image = banner_image
+            program.save()
+        self.assertEqual(mock_inspect.call_count, 1)
+        self.assertIsNotNone(program.banner_image.stored_resized_urls)
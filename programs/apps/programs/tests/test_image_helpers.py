@@ -5,16 +5,22 @@ from contextlib import closing
 import os
 from tempfile import NamedTemporaryFile
 
-from django.core.files.uploadedfile import UploadedFile
-from django.test import TestCase
+from django.core.files.uploadedfile import SimpleUploadedFile, UploadedFile
+from django.test import override_settings, TestCase
 import ddt
+import mock
 from PIL import Image
 
 from ..image_helpers import (
+    HEADER_READ_SIZE,
+    ImageInfo,
     ImageValidationError,
+    inspect_image,
     validate_image_type,
     validate_image_size,
+    create_resized_images,
     crop_image_to_aspect_ratio,
+    scale_image,
 )
 from .helpers import make_image_file, make_uploaded_file
 
@@ -160,3 +166,111 @@ class TestCropImageToAspectRatio(TestCase):
                 # no cropping necessary, aspect ratio already correct
                 cropped = crop_image_to_aspect_ratio(image_obj, 1.5)
                 self.assertEqual(cropped.size, (300, 200))
+
+
+class TestInspectImage(TestCase):
+    """
+    Test inspect_image
+    """
+
+    def test_header_only(self):
+        """
+        Ensure that only the header of an image is read to find its dimensions.
+        """
+        with make_uploaded_file('image/jpeg', (3000, 2000), force_size=1024 * 1024) as uploaded_file:
+            read = uploaded_file.file.read
+            bytes_read = []
+
+            def tracked_read(*args):  # pylint: disable=missing-docstring
+                data = read(*args)
+                bytes_read.append(len(data))
+                return data
+
+            with mock.patch.object(uploaded_file.file, 'read', side_effect=tracked_read):
+                self.assertEqual(inspect_image(uploaded_file), ImageInfo('jpeg', 3000, 2000))
+            self.assertEqual(sum(bytes_read), HEADER_READ_SIZE)
+            self.assertEqual(uploaded_file.tell(), 0)
+
+    def test_cached(self):
+        """
+        Ensure that each uploaded file is only inspected once, whether it is valid or not.
+        """
+        with make_uploaded_file('image/jpeg', (300, 200)) as uploaded_file:
+            with make_uploaded_file('image/png', (300, 200)) as invalid_file:
+                self.assertEqual(inspect_image(uploaded_file), ImageInfo('jpeg', 300, 200))
+                with self.assertRaises(ImageValidationError):
+                    inspect_image(invalid_file)
+
+                with mock.patch.object(uploaded_file.file, 'read') as mock_read:
+                    with mock.patch.object(invalid_file.file, 'read') as mock_invalid_read:
+                        validate_image_type(uploaded_file)
+                        validate_image_size(uploaded_file, 300, 200)
+                        with self.assertRaises(ImageValidationError):
+                            validate_image_size(uploaded_file, 301, 200)
+                        with self.assertRaises(ImageValidationError):
+                            validate_image_type(invalid_file)
+                self.assertFalse(mock_read.called or mock_invalid_read.called)
+
+    def test_corrupt(self):
+        """
+        Ensure that files whose header cannot be parsed fail validation.
+        """
+        uploaded_file = SimpleUploadedFile('test.jpg', '\xff\xd8' + 'x' * 100000, content_type='image/jpeg')
+        with self.assertRaises(ImageValidationError) as ctx:
+            inspect_image(uploaded_file)
+        self.assertEqual(
+            ctx.exception.message, u'The file could not be read as an image. The file may be corrupted.'
+        )
+
+    @override_settings(IMAGE_MAX_PIXELS=300 * 200)
+    def test_max_pixels(self):
+        """
+        Ensure that images with more pixels than allowed fail validation, without being decoded.
+        """
+        with make_uploaded_file('image/jpeg', (300, 200)) as uploaded_file:
+            self.assertEqual(inspect_image(uploaded_file), ImageInfo('jpeg', 300, 200))
+
+        with make_uploaded_file('image/jpeg', (300, 201)) as uploaded_file:
+            with mock.patch('PIL.ImageFile.ImageFile.load') as mock_load:
+                with self.assertRaises(ImageValidationError) as ctx:
+                    inspect_image(uploaded_file)
+            self.assertFalse(mock_load.called)
+        self.assertEqual(ctx.exception.message, u'The file must be no larger than 0.06 megapixels.')
+
+
+@ddt.ddt
+class TestCreateResizedImages(TestCase):
+    """
+    Test create_resized_images
+    """
+    SIZES = [(48, 16), (120, 40), (30, 10)]
+
+    @ddt.data(
+        ((1200, 900), '.jpeg', (150, 113)),  # decoded at 1/8 scale, which leaves a 150x50 crop.
+        ((1200, 300), '.jpeg', (300, 75)),  # decoded at 1/4 scale, which leaves a 225x75 crop.
+        ((120, 40), '.jpeg', (120, 40)),
+        ((1200, 900), '.png', (1200, 900)),
+        ((1200, 900), '.gif', (1200, 900)),
+    )
+    @ddt.unpack
+    def test_create_resized_images(self, dimensions, extension, expected_decoded_size):
+        """
+        Ensure each image is decoded once, at reduced scale where possible, and resized to every size, largest
+        first, each from the next larger copy.
+        """
+        with make_image_file(dimensions, extension) as image_file:
+            with mock.patch('programs.apps.programs.image_helpers.scale_image', wraps=scale_image) as mock_scale:
+                resized_images = create_resized_images(image_file, self.SIZES)
+
+        self.assertEqual([size for size, __ in resized_images], sorted(self.SIZES, reverse=True))
+        for size, image in resized_images:
+            self.assertEqual(image.size, size)
+            self.assertEqual(image.mode, 'RGB')
+
+        source_sizes = [call[0][0].size for call in mock_scale.call_args_list]
+        self.assertEqual(source_sizes[1:], [(120, 40), (48, 16)])
+        self.assertEqual(source_sizes[0][1] * 3, source_sizes[0][0])
+        self.assertEqual(
+            source_sizes[0][0],
+            min(expected_decoded_size[0], expected_decoded_size[1] * 3),
+        )
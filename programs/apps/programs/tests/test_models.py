@@ -5,9 +5,13 @@ import datetime
 
 import ddt
 import pytz
+from django.core.cache import cache
 from django.core.exceptions import ValidationError
-from django.db import IntegrityError
-from django.test import TestCase
+from django.db import connection, IntegrityError
+from django.db.models.query import QuerySet
+from django.test import override_settings, TestCase
+from django.test.utils import CaptureQueriesContext
+import mock
 
 from programs.apps.programs import models
 from programs.apps.programs.constants import ProgramStatus, ProgramCategory
@@ -153,6 +157,41 @@ class TestProgramCourseCode(TestCase):
         res = models.ProgramCourseCode.objects.filter(program=self.program)
         self.assertEqual([2, 3, 10], [pgm_course.position for pgm_course in res])
 
+    def test_allocate_positions(self):
+        """
+        Ensure that positions are allocated to any number of new rows with a constant number of queries.
+        """
+        course_code = factories.CourseCodeFactory.create(organization=self.org)
+        factories.ProgramCourseCodeFactory.create(program=self.program, course_code=course_code)
+
+        pgm_courses = [
+            factories.ProgramCourseCodeFactory.build(
+                program=self.program, course_code=factories.CourseCodeFactory.create(organization=self.org)
+            )
+            for _ in range(5)
+        ]
+        select_for_update = QuerySet.select_for_update
+        with CaptureQueriesContext(connection) as context:
+            with mock.patch.object(
+                QuerySet, 'select_for_update', autospec=True, side_effect=select_for_update
+            ) as mock_select_for_update:
+                models.ProgramCourseCode.allocate_positions(pgm_courses)
+        self.assertEqual([2, 3, 4, 5, 6], [pgm_course.position for pgm_course in pgm_courses])
+
+        # both queries are locking reads, which serialize concurrent allocations.
+        self.assertEqual(len(context), 2)
+        self.assertEqual(mock_select_for_update.call_count, 2)
+        if connection.features.has_select_for_update:
+            for query in context.captured_queries:
+                self.assertIn('FOR UPDATE', query['sql'].upper())
+
+        org2 = factories.OrganizationFactory.create()
+        pgm_courses.append(factories.ProgramCourseCodeFactory.build(
+            program=self.program, course_code=factories.CourseCodeFactory.create(organization=org2)
+        ))
+        with self.assertRaises(ValidationError):
+            models.ProgramCourseCode.allocate_positions(pgm_courses)
+
     def test_organization(self):
         """
         Ensure that it is not allowed to associate a course code with a program
@@ -260,6 +299,69 @@ class TestProgramCourseRunMode(TestCase):
             context.exception.message
         )
 
+    def _build_run_mode(self, **kwargs):
+        """
+        Return an unsaved run mode, with defaults for any unspecified fields.
+        """
+        attrs = {
+            'program_course_code': self.program_course,
+            'course_key': self.course_key,
+            'mode_slug': 'test-mode-slug',
+            'sku': '',
+            'start_date': self.start_date,
+        }
+        attrs.update(kwargs)
+        return models.ProgramCourseRunMode(**attrs)
+
+    def test_validate_bulk(self):
+        """
+        Verify that run modes are validated in bulk with a single query, and their run keys derived.
+        """
+        run_modes = [
+            self._build_run_mode(mode_slug='verified'),
+            self._build_run_mode(mode_slug='honor'),
+            self._build_run_mode(course_key='course-v1:edX+DemoX+Demo_Course'),
+        ]
+        with self.assertNumQueries(1):
+            models.ProgramCourseRunMode.validate_bulk(run_modes)
+        self.assertEqual([run_mode.run_key for run_mode in run_modes], ['Demo_Course'] * 3)
+
+    def test_validate_bulk_duplicates(self):
+        """
+        Verify that duplicates among the validated run modes are rejected without querying.
+        """
+        with self.assertNumQueries(0):
+            with self.assertRaises(ValidationError) as context:
+                models.ProgramCourseRunMode.validate_bulk([self._build_run_mode(), self._build_run_mode()])
+        self.assertEqual(
+            'Duplicate course run modes are not allowed for course codes in a program.',
+            context.exception.message
+        )
+
+    def test_validate_bulk_stored_duplicates(self):
+        """
+        Verify that duplicates of stored run modes are rejected, unless the stored run mode is itself
+        being validated (i.e. updated).
+        """
+        existing = factories.ProgramCourseRunModeFactory.create(
+            program_course_code=self.program_course, course_key=self.course_key, mode_slug='test-mode-slug'
+        )
+        with self.assertRaises(ValidationError):
+            models.ProgramCourseRunMode.validate_bulk([self._build_run_mode()])
+
+        existing.mode_slug = 'verified'
+        models.ProgramCourseRunMode.validate_bulk([existing, self._build_run_mode()])
+
+    def test_validate_bulk_invalid_course_key(self):
+        """
+        Verify that an invalid course key among the validated run modes is rejected.
+        """
+        with self.assertRaises(ValidationError) as context:
+            models.ProgramCourseRunMode.validate_bulk(
+                [self._build_run_mode(), self._build_run_mode(course_key='invalid')]
+            )
+        self.assertEqual('Invalid course key.', context.exception.message)
+
 
 class TestProgramDefault(TestCase):
     """
@@ -285,3 +387,98 @@ class TestProgramDefault(TestCase):
         self._create_model_instance()
         with self.assertRaises(IntegrityError):
             factories.ProgramDefaultFactory.create()
+
+
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    MEDIA_URL='/test/media/url/',
+)
+class TestProgramDefaultBannerImageUrls(TestCase):
+    """
+    Tests for the cached lookup of the default banner image URLs.
+    """
+
+    def setUp(self):
+        super(TestProgramDefaultBannerImageUrls, self).setUp()
+        cache.clear()
+
+    def test_no_default(self):
+        """ Verify that no URLs are returned, and no further queries run, when no default exists """
+        self.assertEqual(models.ProgramDefault.get_banner_image_urls(), {})
+        with self.assertNumQueries(0):
+            self.assertEqual(models.ProgramDefault.get_banner_image_urls(), {})
+
+    def test_cached_until_saved(self):
+        """ Verify that the URLs are cached, and invalidated when the singleton is saved """
+        program_default = factories.ProgramDefaultFactory.create()
+        self.assertEqual(models.ProgramDefault.get_banner_image_urls(), {})
+
+        program_default.banner_image = make_banner_image_file('test.jpg')
+        program_default.save()
+        expected_urls = program_default.banner_image.resized_urls
+        self.assertEqual(len(expected_urls), len(RESIZABLE_IMAGE_SIZES))
+
+        self.assertEqual(models.ProgramDefault.get_banner_image_urls(), expected_urls)
+        with self.assertNumQueries(0):
+            self.assertEqual(models.ProgramDefault.get_banner_image_urls(), expected_urls)
+
+    def test_invalidated_on_delete(self):
+        """ Verify that the cached URLs are invalidated when the singleton is deleted """
+        program_default = factories.ProgramDefaultFactory.create()
+        program_default.banner_image = make_banner_image_file('test.jpg')
+        program_default.save()
+        self.assertNotEqual(models.ProgramDefault.get_banner_image_urls(), {})
+
+        models.ProgramDefault.objects.all().delete()
+        self.assertEqual(models.ProgramDefault.get_banner_image_urls(), {})
+
+    @override_settings(DEFAULT_BANNER_IMAGE_URLS_CACHE_TIMEOUT=60)
+    def test_timeout(self):
+        """ Verify that the URLs are cached for a finite time """
+        with mock.patch('programs.apps.programs.models.cache') as mock_cache:
+            mock_cache.get.return_value = None
+            models.ProgramDefault.get_banner_image_urls()
+        mock_cache.set.assert_called_once_with(models.ProgramDefault.BANNER_IMAGE_URLS_CACHE_KEY, {}, 60)
+
+
+@ddt.ddt
+class TestStoredImage(TestCase):
+    """
+    Tests for the manifest of stored images.
+    """
+
+    def setUp(self):
+        super(TestStoredImage, self).setUp()
+        created = datetime.datetime(2016, 1, 1, tzinfo=pytz.UTC)
+        # four uploads, oldest first, with a resized copy each; the copy of 'b' was stored after 'c' was uploaded.
+        for index, original_name in enumerate(['a', 'b', 'c', 'd']):
+            models.StoredImage.objects.create(
+                directory='dir', name=original_name, original_name=original_name, size=1,
+                created=created + datetime.timedelta(minutes=index),
+            )
+        for original_name, minutes in (('a', 0), ('b', 2), ('c', 2), ('d', 3)):
+            models.StoredImage.objects.create(
+                directory='dir', name=original_name + '__1x1.jpg', original_name=original_name, size=1,
+                created=created + datetime.timedelta(minutes=minutes),
+            )
+        models.StoredImage.objects.create(directory='other', name='x', original_name='x', size=1)
+
+    @ddt.data(
+        ('d', True, ['a', 'b']),
+        ('d', False, ['a', 'b', 'c']),
+        ('c', True, ['a']),
+        ('b', True, []),
+        ('a', False, []),
+        ('unrecorded', False, []),
+    )
+    @ddt.unpack
+    def test_get_stale(self, current_name, keep_previous, expected_stale_originals):
+        """
+        Ensure that uploads older than the current (and previous) one are stale, along with their copies.
+        """
+        with self.assertNumQueries(1):
+            stale_images = models.StoredImage.get_stale('dir', current_name, keep_previous=keep_previous)
+        self.assertEqual(
+            sorted(image.name for image in stale_images),
+            sorted(name + suffix for name in expected_stale_originals for suffix in ('', '__1x1.jpg')),
+        )
@@ -0,0 +1,80 @@
+# pylint: disable=missing-docstring
+import json
+
+from django.core.management import call_command
+from django.test import override_settings, TestCase
+
+from programs.apps.programs.models import Program, ProgramDefault
+from programs.apps.programs.tests.factories import ProgramDefaultFactory, ProgramFactory
+from programs.apps.programs.tests.helpers import make_banner_image_file
+
+
+@override_settings(MEDIA_URL='/test/media/url/')
+class RebuildResizedUrlsTests(TestCase):
+    """Tests for the rebuild_resized_urls management command."""
+
+    def setUp(self):
+        super(RebuildResizedUrlsTests, self).setUp()
+        self.program = ProgramFactory.create()
+        self.program.banner_image = make_banner_image_file('test_filename.jpg')
+        self.program.save()
+        self.program_without_banner = ProgramFactory.create()
+        self.program_default = ProgramDefaultFactory.create()
+        self.program_default.banner_image = make_banner_image_file('default_filename.jpg')
+        self.program_default.save()
+
+    def assert_stored_urls_prefix(self, model, pk, prefix):
+        instance = model.objects.get(pk=pk)
+        urls = instance.banner_image.stored_resized_urls
+        self.assertIsNotNone(urls)
+        self.assertEqual(len(urls), len(instance.banner_image.field.sizes))
+        for url in urls.values():
+            self.assertTrue(url.startswith(prefix))
+
+    def test_urls_stored_on_upload(self):
+        self.assert_stored_urls_prefix(Program, self.program.pk, '/test/media/url/')
+        self.assert_stored_urls_prefix(ProgramDefault, self.program_default.pk, '/test/media/url/')
+
+    @override_settings(MEDIA_URL='https://cdn.example.com/media/')
+    def test_rebuild(self):
+        modified = self.program.modified
+        self.assertIsNone(Program.objects.get(pk=self.program.pk).banner_image.stored_resized_urls)
+
+        call_command('rebuild_resized_urls')
+
+        self.assert_stored_urls_prefix(Program, self.program.pk, 'https://cdn.example.com/media/')
+        self.assert_stored_urls_prefix(ProgramDefault, self.program_default.pk, 'https://cdn.example.com/media/')
+        self.assertGreater(Program.objects.get(pk=self.program.pk).modified, modified)
+        self.assertEqual(Program.objects.get(pk=self.program_without_banner.pk).banner_image_resized_urls, '')
+
+    def test_rebuild_current(self):
+        """Stored URLs which are still valid are only rewritten when forced."""
+        Program.objects.filter(pk=self.program.pk).update(
+            banner_image_resized_urls=json.dumps(dict(
+                json.loads(self.program.banner_image_resized_urls),
+                urls={'1x1': 'placeholder'},
+            ))
+        )
+
+        call_command('rebuild_resized_urls')
+        self.assertEqual(Program.objects.get(pk=self.program.pk).banner_image.resized_urls, {(1, 1): 'placeholder'})
+
+        call_command('rebuild_resized_urls', force=True)
+        self.assert_stored_urls_prefix(Program, self.program.pk, '/test/media/url/')
+
+    def test_rebuild_pending(self):
+        """Values whose resized copies are still being generated are left pending."""
+        pending_value = json.dumps({'name': self.program.banner_image.name, 'pending': True})
+        Program.objects.filter(pk=self.program.pk).update(banner_image_resized_urls=pending_value)
+
+        call_command('rebuild_resized_urls', force=True)
+        self.assertEqual(Program.objects.get(pk=self.program.pk).banner_image_resized_urls, pending_value)
+
+    def test_generate_pending(self):
+        """Values whose resized copies were left pending are generated when requested."""
+        pending_value = json.dumps({'name': self.program.banner_image.name, 'pending': True})
+        Program.objects.filter(pk=self.program.pk).update(banner_image_resized_urls=pending_value)
+
+        call_command('rebuild_resized_urls', pending=True)
+        self.assertFalse(Program.objects.get(pk=self.program.pk).banner_image.resized_copies_pending)
+        self.assert_stored_urls_prefix(Program, self.program.pk, '/test/media/url/')
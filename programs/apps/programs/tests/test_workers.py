@@ -0,0 +1,98 @@
+"""
+Tests for the background worker pool.
+"""
+import threading
+import time
+
+from django.test import override_settings, TestCase
+import ddt
+import mock
+
+from programs.apps.programs import workers
+
+
+@override_settings(BACKGROUND_WORKER_THREADS=1)
+class WorkersTestCase(TestCase):
+    """
+    Test the submission of work to background worker threads.
+    """
+
+    def setUp(self):
+        super(WorkersTestCase, self).setUp()
+        patcher = mock.patch.object(workers, '_pool', None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(lambda: workers.get_pool().terminate())
+
+    def test_submit(self):
+        """
+        Ensure that submitted functions are called with their arguments, on a thread which releases its
+        database connection afterwards.
+        """
+        func = mock.Mock(__name__='func')
+        with mock.patch.object(workers, 'connection') as mock_connection:
+            workers.submit(func, 1, 'two').wait(5)
+        func.assert_called_once_with(1, 'two')
+        self.assertTrue(mock_connection.close.called)
+        self.assertIs(workers.get_pool(), workers.get_pool())
+
+    def test_submit_error(self):
+        """
+        Ensure that errors are logged rather than raised, and that the worker carries on.
+        """
+        func = mock.Mock(__name__='func', side_effect=[ValueError, None])
+        with mock.patch.object(workers, 'connection'):
+            with mock.patch.object(workers.LOG, 'exception') as mock_exception:
+                self.assertTrue(workers.submit(func).get(5) is None)
+                workers.submit(func).wait(5)
+        self.assertEqual(mock_exception.call_count, 1)
+        self.assertEqual(func.call_count, 2)
+
+
+@ddt.ddt
+class CallConcurrentlyTestCase(TestCase):
+    """
+    Test calling functions concurrently.
+    """
+
+    def setUp(self):
+        super(CallConcurrentlyTestCase, self).setUp()
+        self.lock = threading.Lock()
+        self.running = self.max_running = 0
+
+    def _call(self, item):
+        """
+        Return the given item after a short delay, keeping track of the number of concurrent calls.
+        """
+        with self.lock:
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+        time.sleep(0.02)
+        with self.lock:
+            self.running -= 1
+        if isinstance(item, Exception):
+            raise item
+        return item
+
+    @ddt.data((1, 1), (2, 2), (8, 4))
+    @ddt.unpack
+    def test_call_concurrently(self, threads, expected_max_running):
+        """
+        Ensure that the results are returned in order, from no more than the given number of concurrent calls.
+        """
+        self.assertEqual(workers.call_concurrently(self._call, range(4), threads), range(4))
+        self.assertEqual(self.max_running, expected_max_running)
+
+    def test_call_concurrently_error(self):
+        """
+        Ensure that every call is completed, and the errors and results of all of them are reported together.
+        """
+        errors = [ValueError('first'), IOError('second')]
+        with mock.patch.object(workers.LOG, 'error') as mock_error:
+            with self.assertRaises(workers.ConcurrentCallsError) as context:
+                workers.call_concurrently(self._call, [errors[0], 1, errors[1], 3], 2)
+
+        self.assertEqual(context.exception.errors, errors)
+        self.assertEqual(context.exception.results, [1, 3])
+        self.assertEqual(mock_error.call_count, 2)
+        self.assertIn('2 of 4 calls to _call failed', str(context.exception))
@@ -0,0 +1,134 @@
+"""
+A local pool of background worker threads, for work which should not hold up
+the request (and database transaction) that gave rise to it, such as the
+generation of resized image copies, and a helper for running I/O-bound calls
+(such as storage uploads) concurrently.
+
+Threads (rather than processes) are used since that work is dominated by image
+decoding/encoding, during which PIL releases the GIL, and by storage I/O.  No
+broker is involved: work submitted to the pool of a process is lost if that
+process exits before it is done.
+"""
+import logging
+from multiprocessing.pool import ThreadPool
+import threading
+import traceback
+
+from django.conf import settings
+from django.db import connection
+
+LOG = logging.getLogger(__name__)
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """
+    Return the worker pool of this process, creating it on first use (so that
+    it is never inherited by a forked process).
+
+    Returns:
+        ThreadPool
+    """
+    global _pool  # pylint: disable=global-statement
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPool(settings.BACKGROUND_WORKER_THREADS)
+    return _pool
+
+
+def _run(func, args):
+    """
+    Run a submitted function, logging (rather than raising) any error, and
+    releasing the database connection of the worker thread afterwards.
+    """
+    try:
+        func(*args)
+    except Exception:  # pylint: disable=broad-except
+        LOG.exception('Background work %s%r failed.', func.__name__, args)
+    finally:
+        connection.close()
+
+
+def submit(func, *args):
+    """
+    Call `func` with the given arguments on a background worker thread.
+
+    Returns:
+        AsyncResult
+    """
+    return get_pool().apply_async(_run, (func, args))
+
+
+class ConcurrentCallsError(Exception):
+    """
+    Raised by `call_concurrently` when any of the calls failed, once all of
+    them have finished.
+
+    Attributes:
+        errors (list): the exceptions raised by the failed calls.
+        results (list): the results of the calls which succeeded.
+    """
+
+    def __init__(self, func, errors, results):
+        super(ConcurrentCallsError, self).__init__(
+            '{} of {} calls to {} failed: {}'.format(
+                len(errors), len(errors) + len(results), func.__name__, ', '.join(repr(error) for error in errors)
+            )
+        )
+        self.errors = errors
+        self.results = results
+
+
+def _call(func_and_item):
+    """
+    Call a function with an item, returning whether it succeeded, along with
+    its result or error.  Errors are logged here, while their traceback is
+    still available.
+    """
+    func, item = func_and_item
+    try:
+        return True, func(item)
+    except Exception as error:  # pylint: disable=broad-except
+        LOG.error('Call to %s failed:\n%s', func.__name__, traceback.format_exc())
+        return False, error
+
+
+def call_concurrently(func, items, threads):
+    """
+    Call `func` with each of the given items, on up to `threads` threads, and
+    wait for all of the calls to finish, even if some of them fail.
+
+    The threads are not taken from the background worker pool, so this can be
+    used by work running on that pool without waiting on itself.
+
+    Arguments:
+        func (callable): a function of one argument.
+        items (iterable): the arguments with which to call it.
+        threads (int): the maximum number of concurrent calls.
+
+    Returns:
+        list: the results of the calls, in the order of the items.
+
+    Raises:
+        ConcurrentCallsError: if any of the calls failed.
+    """
+    calls = [(func, item) for item in items]
+    threads = min(threads, len(calls))
+    if threads > 1:
+        pool = ThreadPool(threads)
+        try:
+            outcomes = pool.map(_call, calls)
+        finally:
+            pool.terminate()
+    else:
+        outcomes = [_call(call) for call in calls]
+
+    if not all(succeeded for succeeded, __ in outcomes):
+        raise ConcurrentCallsError(
+            func,
+            [outcome for succeeded, outcome in outcomes if not succeeded],
+            [outcome for succeeded, outcome in outcomes if succeeded],
+        )
+    return [result for __, result in outcomes]
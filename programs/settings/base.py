@@ -109,12 +109,57 @@ REST_FRAMEWORK = {
     'EXCEPTION_HANDLER': 'programs.apps.api.exception_handler.auth_exception_handler',
 }
 
+# CACHE CONFIGURATION
+# See: https://docs.djangoproject.com/en/dev/ref/settings/#caches
+# Deployments running more than one process must use a shared backend (e.g. memcached),
+# otherwise invalidation of cached API responses will not reach every process.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
+# Number of seconds for which successful API GET responses are cached. Entries are
+# invalidated as soon as catalog data changes, so this only bounds the lifetime of
+# unused entries. Set to 0 to disable response caching.
+# Response caching is disabled by default, since invalidation only reaches every process
+# through a shared cache backend: enable it only along with one (e.g. memcached).
+API_RESPONSE_CACHE_TIMEOUT = 0
+
+# Number of seconds for which the URLs of the default banner image are cached. Entries are
+# invalidated when the default is saved or deleted, but only in the process making the change
+# unless the cache backend is shared, so this bounds how long other processes serve stale URLs.
+DEFAULT_BANNER_IMAGE_URLS_CACHE_TIMEOUT = 60 * 5
+# END CACHE CONFIGURATION
+
+# Serve program API GET responses from precomputed program documents (see programs.apps.api.documents),
+# rather than rendering the nested data of each program on every request.
+PROGRAM_DOCUMENTS_ENABLED = True
+
+# Rebuild the program documents invalidated by a request on a background worker once it has finished, rather than
+# leaving them to be rebuilt by the next request reading them.
+PROGRAM_DOCUMENTS_REBUILD_ON_WRITE = True
+
 # MEDIA CONFIGURATION
 # See: https://docs.djangoproject.com/en/dev/ref/settings/#media-root
 MEDIA_ROOT = root('media')
 
 # See: https://docs.djangoproject.com/en/dev/ref/settings/#media-url
 MEDIA_URL = '/media/'
+
+# Generate the resized copies of uploaded images (see ResizingImageField) on background worker threads, after the
+# upload has been saved, rather than within the request which uploaded them.
+RESIZED_IMAGES_ASYNC = False
+
+# Uploaded images with more pixels than this are rejected, since decoding them could exhaust the memory of a worker
+# (e.g. a "decompression bomb" which is small when compressed).
+IMAGE_MAX_PIXELS = 40 * 1000 * 1000
+
+# Maximum number of resized copies of an image which are encoded and saved to storage at once.
+RESIZED_IMAGES_UPLOAD_THREADS = 4
+
+# Number of background worker threads in each process (see programs.apps.programs.workers).
+BACKGROUND_WORKER_THREADS = 2
 # END MEDIA CONFIGURATION
 
 
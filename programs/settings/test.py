@@ -1,3 +1,7 @@
+import atexit
+import shutil
+import tempfile
+
 from programs.settings.base import *
 
 # TEST SETTINGS
@@ -16,6 +20,24 @@ LOGGING['handlers']['local'] = {'class': 'logging.NullHandler'}
 # END TEST SETTINGS
 
 
+# CACHE CONFIGURATION
+# Caching is disabled by default so that cached data cannot leak between tests;
+# tests of caching behavior should override this setting.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.dummy.DummyCache',
+    }
+}
+# END CACHE CONFIGURATION
+
+
+# MEDIA CONFIGURATION
+# Files stored by tests are written outside of the source tree.
+MEDIA_ROOT = tempfile.mkdtemp(prefix='programs-test-media-')
+atexit.register(shutil.rmtree, MEDIA_ROOT, ignore_errors=True)
+# END MEDIA CONFIGURATION
+
+
 # IN-MEMORY TEST DATABASE
 DATABASES = {
     'default': {
@@ -27,6 +49,9 @@ DATABASES = {
         'PORT': '',
     },
 }
+
+# Background workers have their own connections, which do not share the in-memory test database.
+PROGRAM_DOCUMENTS_REBUILD_ON_WRITE = False
 # END IN-MEMORY TEST DATABASE
 
 # AUTHENTICATION